@@ -7,9 +7,20 @@ Provides GitHub API integration for PR management, repo access, and issue tracki
 import os
 import json
 import sys
-from typing import Any, Dict, List, Optional
+import time
+import base64
+import fnmatch
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import requests
 from datetime import datetime
+from pathlib import Path
+
+# Bump when the issue mirror's row format changes; older mirrors are re-synced
+ISSUE_DB_VERSION = 1
 
 
 class GitHubMCPServer:
@@ -27,23 +38,81 @@ class GitHubMCPServer:
             "X-GitHub-Api-Version": "2022-11-28"
         }
 
-    def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
+        # Reuse connections across paginated and repeated calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # Spacing between mutating requests, shared by all worker threads
+        self._mutation_lock = threading.Lock()
+        self._next_mutation_at = 0.0
+
+        # Local mirrors and caches live under ORCHESTRA_CACHE_DIR
+        cache_root = os.getenv("ORCHESTRA_CACHE_DIR", str(Path.home() / ".cache" / "orchestra"))
+        self.cache_dir = Path(cache_root).expanduser() / "github"
+
+    def _request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict[str, Any]:
         """Make a request to GitHub API"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
 
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
+            response = self._send(method, url, json=data, params=params)
             return response.json() if response.text else {}
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
 
+    def _rate_limit_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying a rate-limited response, or None if not rate limited"""
+        if response.status_code not in (403, 429):
+            return None
+
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            return float(retry_after)
+
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = int(response.headers.get("X-RateLimit-Reset", "0"))
+            return max(reset - time.time(), 0) + 1
+
+        if "secondary rate limit" in response.text.lower():
+            # GitHub asks for at least a minute, growing exponentially
+            return 60 * (2 ** attempt)
+
+        return None
+
+    def _send(self, method: str, url: str, max_retries: int = 3, **kwargs) -> requests.Response:
+        """Send a request, waiting out primary and secondary rate limits.
+
+        Raises requests exceptions for non-rate-limit failures.
+        """
+        kwargs.setdefault("timeout", 30)
+        for attempt in range(max_retries + 1):
+            response = self.session.request(method, url, **kwargs)
+            delay = self._rate_limit_delay(response, attempt)
+            if delay is None or attempt == max_retries:
+                break
+            response.close()
+            time.sleep(delay)
+
+        response.raise_for_status()
+        return response
+
+    def _paginate(self, endpoint: str, params: Optional[Dict] = None) -> Iterator[List[Dict]]:
+        """Yield pages of a list endpoint, following Link rel="next" headers.
+
+        Raises requests exceptions; callers convert them to error dicts.
+        """
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        params = dict(params or {})
+        params.setdefault("per_page", 100)
+
+        while url:
+            response = self._send("GET", url, params=params)
+            yield response.json()
+
+            # The next link already carries the query string
+            url = response.links.get("next", {}).get("url")
+            params = None
+
     def list_pull_requests(self, owner: str, repo: str, state: str = "open") -> List[Dict]:
         """List pull requests for a repository"""
         endpoint = f"repos/{owner}/{repo}/pulls?state={state}"
@@ -93,6 +162,219 @@ class GitHubMCPServer:
             "changed_files": result.get("changed_files", 0)
         }
 
+    def get_pr_files(
+        self,
+        owner: str,
+        repo: str,
+        pr_number: int,
+        paths: Optional[List[str]] = None,
+        include_patch: bool = True,
+        max_file_bytes: int = 65536,
+        max_total_bytes: int = 1048576,
+        max_files: Optional[int] = None
+    ) -> Dict:
+        """List changed files of a pull request page by page, stopping once a budget is spent"""
+        files = []
+        total_bytes = 0
+        scanned = 0
+        truncated = False
+
+        try:
+            for page in self._paginate(f"repos/{owner}/{repo}/pulls/{pr_number}/files"):
+                for f in page:
+                    scanned += 1
+                    if paths and not any(fnmatch.fnmatch(f["filename"], p) for p in paths):
+                        continue
+
+                    item = {
+                        "filename": f["filename"],
+                        "status": f["status"],
+                        "additions": f["additions"],
+                        "deletions": f["deletions"],
+                        "changes": f["changes"],
+                        "previous_filename": f.get("previous_filename")
+                    }
+                    if include_patch and "patch" in f:
+                        patch = f["patch"].encode("utf-8")
+                        budget = min(max_file_bytes, max_total_bytes - total_bytes)
+                        item["patch"] = patch[:budget].decode("utf-8", "ignore")
+                        item["patch_truncated"] = len(patch) > budget
+                        total_bytes += min(len(patch), budget)
+                    files.append(item)
+
+                    if total_bytes >= max_total_bytes or (max_files and len(files) >= max_files):
+                        truncated = True
+                        break
+                if truncated:
+                    break
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        return {
+            "files": files,
+            "files_scanned": scanned,
+            "patch_bytes": total_bytes,
+            "truncated": truncated
+        }
+
+    def _iter_stream_lines(self, response: requests.Response, max_line_bytes: int, chunk_size: int = 65536) -> Iterator[Tuple[bytes, int]]:
+        """Yield (line, length) pairs from a streamed response body.
+
+        Lines longer than max_line_bytes are cut to that prefix and the rest
+        is discarded as it arrives, so memory stays bounded however long a
+        line is; length always counts the whole line.
+        """
+        pending = bytearray()
+        dropped = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            start = 0
+            while start < len(chunk):
+                end = chunk.find(b"\n", start)
+                stop = len(chunk) if end == -1 else end + 1
+                room = max(0, max_line_bytes - len(pending))
+                pending += chunk[start:min(stop, start + room)]
+                dropped += max(0, stop - start - room)
+                start = stop
+                if end != -1:
+                    yield bytes(pending), len(pending) + dropped
+                    pending = bytearray()
+                    dropped = 0
+        if pending or dropped:
+            yield bytes(pending), len(pending) + dropped
+
+    def _diff_header_path(self, line: bytes) -> Optional[str]:
+        """Path from a "diff --git a/<path> b/<path>" header, None when the names differ"""
+        rest = line.rstrip(b"\n")[len(b"diff --git "):].decode("utf-8", "replace")
+        # Both names have the same length unless the file was renamed or copied
+        name = rest[2:2 + (len(rest) - 5) // 2]
+        return name if rest == f"a/{name} b/{name}" else None
+
+    def get_pr_diff(
+        self,
+        owner: str,
+        repo: str,
+        pr_number: int,
+        paths: Optional[List[str]] = None,
+        max_file_bytes: int = 65536,
+        max_total_bytes: int = 1048576,
+        max_files: Optional[int] = None
+    ) -> Dict:
+        """Stream a pull request's unified diff, keeping only matching files within byte budgets.
+
+        The body is read in chunks and the connection is dropped as soon as the
+        total budget or file limit is reached, so huge diffs are never buffered.
+        """
+        files: List[Dict] = []
+        current: Optional[Dict] = None
+        kept: List[bytes] = []
+        # Header lines of a renamed/copied file, held until its new name is known
+        header: List[Tuple[bytes, int]] = []
+        total_bytes = 0
+        bytes_read = 0
+        skipped = 0
+        truncated = False
+
+        def resolve(path: str) -> None:
+            nonlocal skipped
+            current["path"] = path
+            current["matched"] = not paths or any(fnmatch.fnmatch(path, p) for p in paths)
+            if not current["matched"]:
+                skipped += 1
+
+        def accept(line: bytes, length: int) -> bool:
+            """Account one line of the current file; False once the total budget is spent"""
+            nonlocal total_bytes, truncated
+            if not current["matched"]:
+                return True
+            current["bytes"] += length
+            if current["truncated"]:
+                return True
+            if current["bytes"] > max_file_bytes:
+                current["truncated"] = True
+                return True
+            if total_bytes + length > max_total_bytes:
+                current["truncated"] = True
+                truncated = True
+                return False
+
+            kept.append(line)
+            total_bytes += length
+            return True
+
+        def finish() -> None:
+            nonlocal current
+            if current is not None and current["matched"] is None:
+                resolve(current.pop("fallback"))
+                for line, length in header:
+                    accept(line, length)
+            if current is not None and current["matched"]:
+                current["diff"] = b"".join(kept).decode("utf-8", "replace")
+                del current["matched"]
+                current.pop("fallback", None)
+                files.append(current)
+            current = None
+
+        try:
+            response = self._send(
+                "GET",
+                f"{self.base_url}/repos/{owner}/{repo}/pulls/{pr_number}",
+                headers={"Accept": "application/vnd.github.diff"},
+                stream=True
+            )
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        with response:
+            for line, length in self._iter_stream_lines(response, max_file_bytes):
+                bytes_read += length
+
+                if line.startswith(b"diff --git "):
+                    finish()
+                    if max_files and len(files) >= max_files:
+                        truncated = True
+                        break
+                    current = {"path": None, "bytes": 0, "truncated": False, "matched": None}
+                    kept = []
+                    header = []
+                    path = self._diff_header_path(line)
+                    if path is not None:
+                        resolve(path)
+                    else:
+                        current["fallback"] = line.rstrip(b"\n").decode("utf-8", "replace").split(" b/", 1)[-1]
+
+                if current is None:
+                    continue
+
+                if current["matched"] is None:
+                    header.append((line, length))
+                    text = line.rstrip(b"\n").decode("utf-8", "replace")
+                    for marker in ("rename to ", "copy to ", "+++ b/"):
+                        if text.startswith(marker):
+                            current.pop("fallback")
+                            resolve(text[len(marker):])
+                            break
+                    else:
+                        if not line.startswith((b"@@", b"Binary files")):
+                            continue
+                        resolve(current.pop("fallback"))
+                    lines, header = header, []
+                else:
+                    lines = [(line, length)]
+
+                if not all(accept(l, n) for l, n in lines):
+                    break
+
+        # A file cut off by the total budget still reports what was kept
+        finish()
+
+        return {
+            "files": files,
+            "skipped_files": skipped,
+            "diff_bytes": total_bytes,
+            "bytes_read": bytes_read,
+            "truncated": truncated
+        }
+
     def create_pull_request(self, owner: str, repo: str, title: str, head: str, base: str, body: str = "") -> Dict:
         """Create a new pull request"""
         endpoint = f"repos/{owner}/{repo}/pulls"
@@ -164,6 +446,167 @@ class GitHubMCPServer:
 
         return result
 
+    def _check_merge_readiness(self, owner: str, repo: str, pr_number: int, require_checks: bool) -> Dict:
+        """Check whether a PR is open, mergeable and green, returning its head SHA"""
+        started = time.monotonic()
+        pr = self._request("GET", f"repos/{owner}/{repo}/pulls/{pr_number}")
+
+        # GitHub computes mergeability lazily; give it a moment on first request
+        for _ in range(3):
+            if "error" in pr or pr.get("mergeable") is not None or pr.get("state") != "open":
+                break
+            time.sleep(1)
+            pr = self._request("GET", f"repos/{owner}/{repo}/pulls/{pr_number}")
+
+        if "error" in pr:
+            return {"ready": False, "reason": pr["error"], "readiness_ms": int((time.monotonic() - started) * 1000)}
+
+        reason = None
+        if pr.get("merged"):
+            reason = "already merged"
+        elif pr["state"] != "open":
+            reason = f"PR is {pr['state']}"
+        elif pr.get("draft"):
+            reason = "PR is a draft"
+        elif pr.get("mergeable") is False:
+            reason = f"not mergeable ({pr.get('mergeable_state')})"
+        elif require_checks:
+            try:
+                runs = [
+                    run
+                    for page in self._paginate(f"repos/{owner}/{repo}/commits/{pr['head']['sha']}/check-runs")
+                    for run in page.get("check_runs", [])
+                ]
+            except requests.exceptions.RequestException as e:
+                reason = f"could not read checks: {e}"
+            else:
+                pending = [c["name"] for c in runs if c["status"] != "completed"]
+                failed = [c["name"] for c in runs
+                          if c.get("conclusion") not in (None, "success", "neutral", "skipped")]
+                if failed:
+                    reason = f"failing checks: {', '.join(failed)}"
+                elif pending:
+                    reason = f"pending checks: {', '.join(pending)}"
+
+        return {
+            "ready": reason is None,
+            "reason": reason,
+            "merged": bool(pr.get("merged")),
+            "head_sha": pr["head"]["sha"],
+            "base": pr["base"]["ref"],
+            "readiness_ms": int((time.monotonic() - started) * 1000)
+        }
+
+    def _order_merge_queue(self, entries: List[Dict]) -> List[int]:
+        """Topologically order PRs by their depends_on hints, keeping input order otherwise"""
+        numbers = [e["number"] for e in entries]
+        deps = {e["number"]: [d for d in e.get("depends_on", []) if d in numbers] for e in entries}
+
+        ordered: List[int] = []
+        visiting = set()
+
+        def visit(number: int) -> None:
+            if number in ordered:
+                return
+            if number in visiting:
+                raise ValueError(f"Dependency cycle involving PR #{number}")
+            visiting.add(number)
+            for dep in deps[number]:
+                visit(dep)
+            visiting.discard(number)
+            ordered.append(number)
+
+        for number in numbers:
+            visit(number)
+        return ordered
+
+    def merge_queue(
+        self,
+        owner: str,
+        repo: str,
+        prs: List[Any],
+        merge_method: str = "merge",
+        require_checks: bool = True,
+        max_retries: int = 3,
+        max_workers: int = 8
+    ) -> Dict:
+        """Check a batch of PRs concurrently, then merge them in dependency order.
+
+        Each entry in prs is a PR number or {"number", "depends_on", "merge_method"}.
+        """
+        started = time.monotonic()
+        entries = [{"number": p} if isinstance(p, int) else dict(p) for p in prs]
+        by_number = {e["number"]: e for e in entries}
+
+        try:
+            order = self._order_merge_queue(entries)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(entries)))) as pool:
+            futures = {
+                n: pool.submit(self._check_merge_readiness, owner, repo, n, require_checks)
+                for n in order
+            }
+            readiness = {n: f.result() for n, f in futures.items()}
+
+        results = []
+        # PRs merged before this run still satisfy their dependents
+        merged = {n for n, check in readiness.items() if check.get("merged")}
+        for number in order:
+            entry = by_number[number]
+            check = readiness[number]
+            item = {
+                "number": number,
+                "status": "skipped",
+                "reason": check["reason"],
+                "attempts": 0,
+                "readiness_ms": check["readiness_ms"],
+                "merge_ms": 0
+            }
+            results.append(item)
+
+            blocked = [d for d in entry.get("depends_on", []) if d in by_number and d not in merged]
+            if blocked:
+                item["reason"] = f"dependency not merged: {', '.join(f'#{d}' for d in blocked)}"
+                continue
+            if not check["ready"]:
+                continue
+
+            merge_started = time.monotonic()
+            data = {"merge_method": entry.get("merge_method", merge_method), "sha": check["head_sha"]}
+            for attempt in range(max_retries + 1):
+                item["attempts"] = attempt + 1
+                try:
+                    response = self._send("PUT", f"{self.base_url}/repos/{owner}/{repo}/pulls/{number}/merge", json=data)
+                    item["status"] = "merged"
+                    item["reason"] = None
+                    item["merge_sha"] = response.json().get("sha")
+                    merged.add(number)
+                    break
+                except requests.exceptions.RequestException as e:
+                    status_code = getattr(e.response, "status_code", None)
+                    message = str(e)
+                    if e.response is not None:
+                        try:
+                            message = e.response.json().get("message", message)
+                        except ValueError:
+                            pass
+                    item["status"] = "failed"
+                    item["reason"] = message
+                    # 405 "Base branch was modified" clears once GitHub recomputes mergeability
+                    if status_code != 405 or "base branch was modified" not in message.lower():
+                        break
+                    time.sleep(2 ** attempt)
+            item["merge_ms"] = int((time.monotonic() - merge_started) * 1000)
+
+        return {
+            "order": order,
+            "merged": [r["number"] for r in results if r["status"] == "merged"],
+            "results": results,
+            "total_ms": int((time.monotonic() - started) * 1000)
+        }
+
     def list_issues(self, owner: str, repo: str, state: str = "open") -> List[Dict]:
         """List issues for a repository"""
         endpoint = f"repos/{owner}/{repo}/issues?state={state}"
@@ -186,6 +629,101 @@ class GitHubMCPServer:
             "labels": [label["name"] for label in issue.get("labels", [])]
         } for issue in issues]
 
+    def _pace_mutation(self, min_interval: float) -> None:
+        """Block until the next mutating request may be sent.
+
+        GitHub's secondary rate limits cap content creation (about 80 requests
+        per minute) and ask for a gap between mutating requests.
+        """
+        with self._mutation_lock:
+            now = time.monotonic()
+            wait = self._next_mutation_at - now
+            self._next_mutation_at = max(now, self._next_mutation_at) + min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _apply_issue_operation(self, owner: str, repo: str, operation: Dict, min_interval: float) -> Dict:
+        """Apply one label/comment/assign/state operation to an issue or PR"""
+        number = operation["number"]
+        op = operation["op"]
+        issue_url = f"{self.base_url}/repos/{owner}/{repo}/issues/{number}"
+
+        if op == "add_labels":
+            requests_to_send = [("POST", f"{issue_url}/labels", {"labels": operation["labels"]})]
+        elif op == "remove_labels":
+            requests_to_send = [
+                ("DELETE", f"{issue_url}/labels/{requests.utils.quote(label, safe='')}", None)
+                for label in operation["labels"]
+            ]
+        elif op == "comment":
+            requests_to_send = [("POST", f"{issue_url}/comments", {"body": operation["body"]})]
+        elif op == "assign":
+            requests_to_send = [("POST", f"{issue_url}/assignees", {"assignees": operation["assignees"]})]
+        elif op == "unassign":
+            requests_to_send = [("DELETE", f"{issue_url}/assignees", {"assignees": operation["assignees"]})]
+        elif op == "state":
+            data = {"state": operation["state"]}
+            if operation.get("state_reason"):
+                data["state_reason"] = operation["state_reason"]
+            requests_to_send = [("PATCH", issue_url, data)]
+        else:
+            raise ValueError(f"Unknown operation: {op}")
+
+        for method, url, data in requests_to_send:
+            self._pace_mutation(min_interval)
+            self._send(method, url, json=data)
+
+        return {"requests": len(requests_to_send)}
+
+    def bulk_update(
+        self,
+        owner: str,
+        repo: str,
+        operations: List[Dict],
+        max_workers: int = 4,
+        min_interval: float = 1.0
+    ) -> Dict:
+        """Apply many issue/PR mutations with bounded concurrency and secondary-rate-limit pacing.
+
+        Each operation is {"number", "op", ...} where op is add_labels/remove_labels
+        (labels), comment (body), assign/unassign (assignees) or state (state, state_reason).
+        """
+        started = time.monotonic()
+
+        def run(index: int, operation: Dict) -> Dict:
+            item_started = time.monotonic()
+            item = {"index": index, "number": operation.get("number"), "op": operation.get("op")}
+            try:
+                item.update(self._apply_issue_operation(owner, repo, operation, min_interval))
+                item["status"] = "ok"
+            except KeyError as e:
+                item["status"] = "failed"
+                item["error"] = f"Missing parameter: {e}"
+            except ValueError as e:
+                item["status"] = "failed"
+                item["error"] = str(e)
+            except requests.exceptions.RequestException as e:
+                item["status"] = "failed"
+                item["error"] = str(e)
+                item["status_code"] = getattr(e.response, "status_code", None)
+            item["ms"] = int((time.monotonic() - item_started) * 1000)
+            return item
+
+        results = []
+        if operations:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(operations)))) as pool:
+                results = list(pool.map(run, range(len(operations)), operations))
+
+        elapsed = time.monotonic() - started
+        succeeded = sum(1 for r in results if r["status"] == "ok")
+        return {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "elapsed_s": round(elapsed, 3),
+            "ops_per_second": round(len(results) / elapsed, 2) if elapsed > 0 else None
+        }
+
     def get_repo_status(self, owner: str, repo: str) -> Dict:
         """Get repository status and information"""
         endpoint = f"repos/{owner}/{repo}"
@@ -209,6 +747,452 @@ class GitHubMCPServer:
             "updated_at": result["updated_at"]
         }
 
+    # Issue Mirror
+    def _open_issue_db(self, owner: str, repo: str) -> sqlite3.Connection:
+        """Open (and create if needed) the local issue/PR mirror for a repository"""
+        db_dir = self.cache_dir / "repos" / owner / repo
+        db_dir.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(str(db_dir / "issues.db"))
+        conn.row_factory = sqlite3.Row
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS issues (
+                number INTEGER PRIMARY KEY,
+                is_pr INTEGER NOT NULL,
+                title TEXT,
+                body TEXT,
+                state TEXT,
+                author TEXT,
+                labels TEXT,
+                assignees TEXT,
+                comments INTEGER,
+                created_at TEXT,
+                updated_at TEXT,
+                closed_at TEXT,
+                url TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_issues_state ON issues(state, is_pr);
+            CREATE INDEX IF NOT EXISTS idx_issues_updated ON issues(updated_at);
+            CREATE TABLE IF NOT EXISTS issue_labels (
+                number INTEGER NOT NULL,
+                name TEXT NOT NULL COLLATE NOCASE,
+                PRIMARY KEY (number, name)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_issue_labels_name ON issue_labels(name);
+            CREATE TABLE IF NOT EXISTS comments (
+                id INTEGER PRIMARY KEY,
+                issue_number INTEGER NOT NULL,
+                author TEXT,
+                body TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                url TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_comments_issue ON comments(issue_number);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                resource TEXT PRIMARY KEY,
+                since TEXT,
+                synced_at TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts USING fts5(
+                title, body, labels,
+                content='issues', content_rowid='number'
+            );
+        """)
+
+        if conn.execute("PRAGMA user_version").fetchone()[0] < ISSUE_DB_VERSION:
+            # Version 0 stored labels space-joined, which split multi-word
+            # labels; drop those rows so the next sync_issues re-mirrors them
+            conn.execute("DELETE FROM issues")
+            conn.execute("INSERT INTO issues_fts(issues_fts) VALUES('delete-all')")
+            conn.execute("DELETE FROM sync_state WHERE resource = 'issues'")
+            conn.execute(f"PRAGMA user_version = {ISSUE_DB_VERSION}")
+            conn.commit()
+        return conn
+
+    def _upsert_issue(self, conn: sqlite3.Connection, issue: Dict) -> None:
+        """Insert or replace one issue/PR row and keep the FTS index in step"""
+        number = issue["number"]
+        label_names = [label["name"] for label in issue.get("labels", [])]
+        # JSON arrays keep multi-word labels intact; FTS tokenizes them the same
+        labels = json.dumps(label_names)
+
+        old = conn.execute("SELECT title, body, labels FROM issues WHERE number = ?", (number,)).fetchone()
+        if old is not None:
+            # External-content FTS tables need the old values to delete a row
+            conn.execute(
+                "INSERT INTO issues_fts(issues_fts, rowid, title, body, labels) VALUES('delete', ?, ?, ?, ?)",
+                (number, old["title"], old["body"], old["labels"])
+            )
+
+        conn.execute(
+            "INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                number,
+                1 if "pull_request" in issue else 0,
+                issue["title"],
+                issue.get("body") or "",
+                issue["state"],
+                issue["user"]["login"] if issue.get("user") else None,
+                labels,
+                json.dumps([a["login"] for a in issue.get("assignees", [])]),
+                issue.get("comments", 0),
+                issue["created_at"],
+                issue["updated_at"],
+                issue.get("closed_at"),
+                issue["html_url"]
+            )
+        )
+        conn.execute(
+            "INSERT INTO issues_fts(rowid, title, body, labels) VALUES (?, ?, ?, ?)",
+            (number, issue["title"], issue.get("body") or "", labels)
+        )
+        conn.execute("DELETE FROM issue_labels WHERE number = ?", (number,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO issue_labels VALUES (?, ?)",
+            [(number, name) for name in label_names]
+        )
+
+    def _sync_resource(self, conn: sqlite3.Connection, resource: str, endpoint: str, full: bool, upsert) -> int:
+        """Pull one incrementally-synced list endpoint into the mirror"""
+        state = conn.execute("SELECT since FROM sync_state WHERE resource = ?", (resource,)).fetchone()
+        since = None if full or state is None else state["since"]
+
+        params = {"sort": "updated", "direction": "asc"}
+        if resource == "issues":
+            params["state"] = "all"
+        if since:
+            params["since"] = since
+
+        count = 0
+        newest = since
+        for page in self._paginate(endpoint, params):
+            for item in page:
+                upsert(conn, item)
+                newest = max(newest or "", item["updated_at"])
+                count += 1
+            # Commit per page so an interrupted sync resumes where it stopped
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                (resource, newest, datetime.utcnow().isoformat() + "Z")
+            )
+            conn.commit()
+
+        return count
+
+    def _upsert_comment(self, conn: sqlite3.Connection, comment: Dict) -> None:
+        """Insert or replace one issue/PR conversation comment"""
+        conn.execute(
+            "INSERT OR REPLACE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                comment["id"],
+                int(comment["issue_url"].rsplit("/", 1)[-1]),
+                comment["user"]["login"] if comment.get("user") else None,
+                comment.get("body") or "",
+                comment["created_at"],
+                comment["updated_at"],
+                comment["html_url"]
+            )
+        )
+
+    def sync_issues(self, owner: str, repo: str, full: bool = False, include_comments: bool = True) -> Dict:
+        """Incrementally mirror issues, PRs and comments into a local SQLite database"""
+        conn = self._open_issue_db(owner, repo)
+        try:
+            if full:
+                conn.execute("DELETE FROM sync_state")
+
+            issues = self._sync_resource(
+                conn, "issues", f"repos/{owner}/{repo}/issues", full, self._upsert_issue
+            )
+            comments = 0
+            if include_comments:
+                comments = self._sync_resource(
+                    conn, "comments", f"repos/{owner}/{repo}/issues/comments", full, self._upsert_comment
+                )
+
+            totals = conn.execute(
+                "SELECT COUNT(*) AS total, COALESCE(SUM(is_pr), 0) AS prs FROM issues"
+            ).fetchone()
+            return {
+                "repo": f"{owner}/{repo}",
+                "updated_issues": issues,
+                "updated_comments": comments,
+                "total_issues": totals["total"] - totals["prs"],
+                "total_prs": totals["prs"],
+                "database": str(self.cache_dir / "repos" / owner / repo / "issues.db")
+            }
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+        finally:
+            conn.close()
+
+    def search_issues(
+        self,
+        owner: str,
+        repo: str,
+        query: Optional[str] = None,
+        state: Optional[str] = None,
+        kind: Optional[str] = None,
+        label: Optional[str] = None,
+        author: Optional[str] = None,
+        limit: int = 50,
+        include_comments: bool = False
+    ) -> List[Dict]:
+        """Search and filter the local issue/PR mirror (run sync_issues first)"""
+        conn = self._open_issue_db(owner, repo)
+        try:
+            sql = "SELECT i.* FROM issues i"
+            where = []
+            args: List[Any] = []
+
+            if query:
+                sql += " JOIN issues_fts f ON f.rowid = i.number"
+                where.append("issues_fts MATCH ?")
+                args.append(query)
+            if state and state != "all":
+                where.append("i.state = ?")
+                args.append(state)
+            if kind in ("issue", "pr"):
+                where.append("i.is_pr = ?")
+                args.append(1 if kind == "pr" else 0)
+            if label:
+                where.append("i.number IN (SELECT number FROM issue_labels WHERE name = ?)")
+                args.append(label)
+            if author:
+                where.append("i.author = ?")
+                args.append(author)
+
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY " + ("f.rank" if query else "i.updated_at DESC") + " LIMIT ?"
+            args.append(limit)
+
+            try:
+                rows = conn.execute(sql, args).fetchall()
+            except sqlite3.OperationalError as e:
+                return {"error": f"Invalid search query: {e}"}
+
+            results = []
+            for row in rows:
+                item = {
+                    "number": row["number"],
+                    "type": "pr" if row["is_pr"] else "issue",
+                    "title": row["title"],
+                    "state": row["state"],
+                    "author": row["author"],
+                    "labels": json.loads(row["labels"] or "[]"),
+                    "assignees": json.loads(row["assignees"] or "[]"),
+                    "comments": row["comments"],
+                    "created_at": row["created_at"],
+                    "updated_at": row["updated_at"],
+                    "url": row["url"]
+                }
+                if include_comments:
+                    item["body"] = row["body"]
+                    item["comment_bodies"] = [{
+                        "author": c["author"],
+                        "body": c["body"],
+                        "created_at": c["created_at"]
+                    } for c in conn.execute(
+                        "SELECT author, body, created_at FROM comments WHERE issue_number = ? ORDER BY created_at",
+                        (row["number"],)
+                    )]
+                results.append(item)
+
+            return results
+        finally:
+            conn.close()
+
+    # Repository Contents
+    def _walk_tree(self, owner: str, repo: str, tree_sha: str, prefix: str, max_workers: int = 8) -> List[Dict]:
+        """List a tree one level per call, descending only towards/under prefix.
+
+        Used when the recursive listing comes back truncated. Raises
+        requests exceptions.
+        """
+        def fetch(base: str, sha: str) -> List[Dict]:
+            response = self._send("GET", f"{self.base_url}/repos/{owner}/{repo}/git/trees/{sha}")
+            return [dict(entry, path=base + entry["path"]) for entry in response.json().get("tree", [])]
+
+        entries: List[Dict] = []
+        level = [("", tree_sha)]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while level:
+                children = [entry for page in pool.map(lambda item: fetch(*item), level) for entry in page]
+                entries.extend(children)
+                level = [
+                    (entry["path"] + "/", entry["sha"]) for entry in children
+                    if entry["type"] == "tree"
+                    and ((entry["path"] + "/").startswith(prefix) or prefix.startswith(entry["path"] + "/"))
+                ]
+        return entries
+
+    def get_tree(
+        self,
+        owner: str,
+        repo: str,
+        ref: Optional[str] = None,
+        path: Optional[str] = None,
+        pattern: Optional[str] = None,
+        complete: bool = True
+    ) -> Dict:
+        """Get the full file tree of a ref in a single recursive git trees call.
+
+        When GitHub truncates that listing (very large trees) and complete is
+        set, the part under path is listed again level by level.
+        """
+        if not ref:
+            repo_info = self._request("GET", f"repos/{owner}/{repo}")
+            if "error" in repo_info:
+                return repo_info
+            ref = repo_info["default_branch"]
+
+        result = self._request("GET", f"repos/{owner}/{repo}/git/trees/{ref}", params={"recursive": 1})
+
+        if "error" in result:
+            return result
+
+        prefix = path.strip("/") + "/" if path else ""
+        tree = result.get("tree", [])
+        truncated = result.get("truncated", False)
+        if truncated and complete:
+            try:
+                tree = self._walk_tree(owner, repo, result["sha"], prefix)
+            except requests.exceptions.RequestException as e:
+                return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+            truncated = False
+
+        entries = [{
+            "path": entry["path"],
+            "type": entry["type"],
+            "sha": entry["sha"],
+            "size": entry.get("size"),
+            "mode": entry["mode"]
+        } for entry in tree
+            if entry["path"].startswith(prefix)
+            and (not pattern or fnmatch.fnmatch(entry["path"], pattern))]
+
+        return {
+            "ref": ref,
+            "sha": result["sha"],
+            "truncated": truncated,
+            "total_count": len(entries),
+            "entries": entries
+        }
+
+    def _blob_path(self, sha: str) -> Path:
+        """Location of a blob in the content-addressed cache"""
+        return self.cache_dir / "blobs" / sha[:2] / sha[2:]
+
+    def _fetch_blob(self, owner: str, repo: str, sha: str) -> Path:
+        """Download a blob into the cache if it is not already there"""
+        blob_path = self._blob_path(sha)
+        if blob_path.exists():
+            return blob_path
+
+        response = self._send(
+            "GET",
+            f"{self.base_url}/repos/{owner}/{repo}/git/blobs/{sha}",
+            headers={"Accept": "application/vnd.github.raw"}
+        )
+        content = response.content
+
+        # Verify the git object id so a bad download never poisons the cache
+        digest = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+        if digest != sha:
+            raise ValueError(f"Blob {sha} failed checksum verification")
+
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = blob_path.with_name(f"{blob_path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, blob_path)
+        return blob_path
+
+    def get_files(
+        self,
+        owner: str,
+        repo: str,
+        paths: List[str],
+        ref: Optional[str] = None,
+        include_content: bool = True,
+        max_workers: int = 8
+    ) -> Dict:
+        """Get file contents for many paths, served from the blob cache where possible.
+
+        Paths missing from a truncated tree listing are looked up one by one
+        through the contents API.
+        """
+        tree = self.get_tree(owner, repo, ref, complete=False)
+        if "error" in tree:
+            return tree
+
+        blobs = {e["path"]: e for e in tree["entries"] if e["type"] == "blob"}
+        if tree["truncated"]:
+            def lookup(path: str) -> Optional[Dict]:
+                info = self._request(
+                    "GET", f"repos/{owner}/{repo}/contents/{requests.utils.quote(path)}", params={"ref": tree["ref"]}
+                )
+                if not isinstance(info, dict) or info.get("type") != "file":
+                    return None
+                return {"path": path, "type": "blob", "sha": info["sha"], "size": info.get("size")}
+
+            unlisted = [p for p in dict.fromkeys(paths) if p not in blobs]
+            if unlisted:
+                with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unlisted)))) as pool:
+                    for entry in pool.map(lookup, unlisted):
+                        if entry:
+                            blobs[entry["path"]] = entry
+        missing_paths = [p for p in paths if p not in blobs]
+        wanted = [blobs[p] for p in paths if p in blobs]
+
+        # Several paths can share a blob; fetch each uncached SHA once
+        to_fetch = {e["sha"] for e in wanted if not self._blob_path(e["sha"]).exists()}
+        errors = {}
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_fetch)))) as pool:
+                futures = {sha: pool.submit(self._fetch_blob, owner, repo, sha) for sha in to_fetch}
+                for sha, future in futures.items():
+                    try:
+                        future.result()
+                    except (requests.exceptions.RequestException, ValueError) as e:
+                        errors[sha] = str(e)
+
+        files = []
+        for entry in wanted:
+            item = {
+                "path": entry["path"],
+                "sha": entry["sha"],
+                "size": entry["size"],
+                "cached": entry["sha"] not in to_fetch
+            }
+            if entry["sha"] in errors:
+                item["error"] = errors[entry["sha"]]
+            else:
+                blob_path = self._blob_path(entry["sha"])
+                item["local_path"] = str(blob_path)
+                if include_content:
+                    content = blob_path.read_bytes()
+                    try:
+                        item["content"] = content.decode("utf-8")
+                        item["encoding"] = "utf-8"
+                    except UnicodeDecodeError:
+                        item["content"] = base64.b64encode(content).decode("ascii")
+                        item["encoding"] = "base64"
+            files.append(item)
+
+        return {
+            "ref": tree["ref"],
+            "sha": tree["sha"],
+            "files": files,
+            "not_found": missing_paths,
+            "cache_hits": len({e["sha"] for e in wanted}) - len(to_fetch),
+            "fetched": len(to_fetch) - len(errors),
+            "failed": len(errors)
+        }
+
 
 def handle_command(server: GitHubMCPServer, command: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """Handle MCP commands"""
@@ -233,6 +1217,35 @@ def handle_command(server: GitHubMCPServer, command: str, params: Dict[str, Any]
             )
         }
 
+    elif command == "get_pr_files":
+        return {
+            "success": True,
+            "data": server.get_pr_files(
+                params["owner"],
+                params["repo"],
+                params["pr_number"],
+                params.get("paths"),
+                params.get("include_patch", True),
+                params.get("max_file_bytes", 65536),
+                params.get("max_total_bytes", 1048576),
+                params.get("max_files")
+            )
+        }
+
+    elif command == "get_pr_diff":
+        return {
+            "success": True,
+            "data": server.get_pr_diff(
+                params["owner"],
+                params["repo"],
+                params["pr_number"],
+                params.get("paths"),
+                params.get("max_file_bytes", 65536),
+                params.get("max_total_bytes", 1048576),
+                params.get("max_files")
+            )
+        }
+
     elif command == "create_pr":
         return {
             "success": True,
@@ -267,6 +1280,20 @@ def handle_command(server: GitHubMCPServer, command: str, params: Dict[str, Any]
             )
         }
 
+    elif command == "merge_queue":
+        return {
+            "success": True,
+            "data": server.merge_queue(
+                params["owner"],
+                params["repo"],
+                params["prs"],
+                params.get("merge_method", "merge"),
+                params.get("require_checks", True),
+                params.get("max_retries", 3),
+                params.get("max_workers", 8)
+            )
+        }
+
     elif command == "list_issues":
         return {
             "success": True,
@@ -277,6 +1304,18 @@ def handle_command(server: GitHubMCPServer, command: str, params: Dict[str, Any]
             )
         }
 
+    elif command == "bulk_update":
+        return {
+            "success": True,
+            "data": server.bulk_update(
+                params["owner"],
+                params["repo"],
+                params["operations"],
+                params.get("max_workers", 4),
+                params.get("min_interval", 1.0)
+            )
+        }
+
     elif command == "get_repo_status":
         return {
             "success": True,
@@ -286,6 +1325,59 @@ def handle_command(server: GitHubMCPServer, command: str, params: Dict[str, Any]
             )
         }
 
+    elif command == "sync_issues":
+        return {
+            "success": True,
+            "data": server.sync_issues(
+                params["owner"],
+                params["repo"],
+                params.get("full", False),
+                params.get("include_comments", True)
+            )
+        }
+
+    elif command == "search_issues":
+        return {
+            "success": True,
+            "data": server.search_issues(
+                params["owner"],
+                params["repo"],
+                params.get("query"),
+                params.get("state"),
+                params.get("kind"),
+                params.get("label"),
+                params.get("author"),
+                params.get("limit", 50),
+                params.get("include_comments", False)
+            )
+        }
+
+    elif command == "get_tree":
+        return {
+            "success": True,
+            "data": server.get_tree(
+                params["owner"],
+                params["repo"],
+                params.get("ref"),
+                params.get("path"),
+                params.get("pattern"),
+                params.get("complete", True)
+            )
+        }
+
+    elif command == "get_files":
+        return {
+            "success": True,
+            "data": server.get_files(
+                params["owner"],
+                params["repo"],
+                params["paths"],
+                params.get("ref"),
+                params.get("include_content", True),
+                params.get("max_workers", 8)
+            )
+        }
+
     else:
         return {
             "success": False,
@@ -6,97 +6,799 @@ Supports REST and GraphQL APIs for building Shopify apps.
 """
 
 import os
+import re
+import csv
+import hmac
 import json
 import sys
-from typing import Any, Dict, List, Optional
+import mmap
+import time
+import base64
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
 import requests
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from pathlib import Path
+
+from shopify_common import ShopifyClient, StoreRegistry, dispatch
+
+# Optional: vectorized aggregation over the local order store (pip install numpy)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Commands that may run against several stores at once (see shopify_common.dispatch)
+FAN_OUT_COMMANDS = {
+    "list_products", "list_orders", "list_customers", "get_inventory_levels",
+    "list_collections", "list_webhooks", "get_shop_metafields",
+    "get_app_installations", "get_shop_analytics", "sync_orders", "order_analytics",
+    "sync_catalog", "find_products", "find_collections"
+}
+
+# Largest page the REST Admin API returns; all_pages listings always use it
+MAX_PAGE_SIZE = 250
+
+# Bulk operations: polling backs off from the first to the max interval
+BULK_POLL_INTERVAL = 1.0
+BULK_POLL_MAX_INTERVAL = 10.0
+
+# get_shop_analytics pages REST orders for ranges up to this many days;
+# longer ranges start a bulk operation, whose fixed overhead then pays off
+ANALYTICS_REST_MAX_DAYS = 7
+
+# Local order store: one binary file per column (array typecodes), with row
+# counts in meta.json. Bump the version when columns change to force a resync.
+ORDER_STORE_VERSION = 2
+ORDER_COLUMNS = {
+    "id": "q", "day": "i", "updated_at": "q", "channel": "i", "total_price": "d",
+    "items": "i", "quantity": "i", "live": "b"
+}
+LINE_COLUMNS = {"order_row": "q", "product_id": "q", "vendor": "i", "quantity": "i", "amount": "d"}
+ORDER_GROUPS = ["day", "channel", "product", "vendor"]
+
+# GraphQL cost limits: a single query may cost at most 1000 points, and
+# nodes(ids:) takes at most 250 ids. The bucket defaults are the standard
+# plan's until a response reports throttleStatus.
+MAX_QUERY_COST = 1000
+NODES_MAX_IDS = 250
+DEFAULT_COST_BUCKET = 1000.0
+DEFAULT_RESTORE_RATE = 50.0
+
+# inventorySetQuantities accepts up to 250 quantities per call, costing 10 points
+INVENTORY_BATCH_SIZE = 250
+INVENTORY_MUTATION_COST = 10
+
+# Metafields: metafieldsSet accepts at most 25 per call
+METAFIELDS_SET_MAX = 25
+METAFIELDS_MUTATION_COST = 10
+METAFIELDS_MAX_WORKERS = 4
+METAFIELD_OWNERS = {"shop": ("shop", None), "product": ("product", "Product"), "variant": ("productVariant", "ProductVariant")}
+
+# Bulk product upserts: one productSet call per line of a staged JSONL upload
+PRODUCT_SET_MUTATION = """
+mutation call($input: ProductSetInput!) {
+  productSet(input: $input) {
+    product { id handle createdAt }
+    userErrors { field message code }
+  }
+}
+"""
+BULK_UPSERT_TIMEOUT = 3600
+# Handles resolved per products(query:) search while staging an upsert
+HANDLES_PER_QUERY = 50
+
+# Webhook ingestion: deliveries are queued in SQLite and applied in batches
+WEBHOOK_QUEUE_NAME = "webhooks.db"
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_POLL_INTERVAL = 1.0
+
+# Node lookups arriving within this window share one nodes(ids:) query
+NODE_BATCH_WINDOW = 0.01
+BATCH_MAX_WORKERS = 64
+DEFAULT_NODE_FIELDS = {
+    "Product": "id legacyResourceId title handle status vendor productType createdAt updatedAt",
+    "Order": "id legacyResourceId name email createdAt updatedAt displayFinancialStatus displayFulfillmentStatus totalPriceSet { shopMoney { amount currencyCode } }",
+    "Customer": "id legacyResourceId email firstName lastName state createdAt updatedAt"
+}
+
+
+def estimate_selection_cost(selection: str) -> int:
+    """Rough query cost of one node: 1 per object, with connections costing first: N"""
+    connections = sum(int(n) for n in re.findall(r"first:\s*(\d+)", selection))
+    return 1 + selection.count("{") + connections
+
+
+def to_gid(typename: str, resource_id: Any) -> str:
+    """Accept a numeric REST id or a GraphQL global id"""
+    resource_id = str(resource_id)
+    return resource_id if resource_id.startswith("gid://") else f"gid://shopify/{typename}/{resource_id}"
+
+
+def find_connections(data: Any, prefix: Tuple[str, ...] = ()) -> List[List[str]]:
+    """Paths to the outermost connections (objects with pageInfo) in GraphQL data"""
+    if not isinstance(data, dict):
+        return []
+    if "pageInfo" in data and ("nodes" in data or "edges" in data):
+        return [list(prefix)]
+    found = []
+    for key, value in data.items():
+        found.extend(find_connections(value, prefix + (key,)))
+    return found
+
+
+class NodeLoader:
+    """Coalesce lookups into batched fetches, DataLoader style.
+
+    Keys loaded by any thread within the batch window go out together in
+    one fetch(keys) -> {key: value} call. Results are cached for the
+    loader's lifetime, so a repeated key is fetched once.
+    """
+
+    def __init__(self, fetch: Callable[[List[Any]], Dict[Any, Any]], window: float):
+        self._fetch = fetch
+        self._window = window
+        self._lock = threading.Lock()
+        self._cache: Dict[Any, Future] = {}
+        self._pending: Dict[Any, Future] = {}
+        self._timer: Optional[threading.Timer] = None
+
+    def load(self, key: Any) -> Future:
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            future = self._cache[key] = self._pending[key] = Future()
+            if self._timer is None:
+                self._timer = threading.Timer(self._window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def load_many(self, keys: List[Any]) -> List[Any]:
+        """Load several keys without waiting for the batch window"""
+        futures = [self.load(key) for key in keys]
+        self.flush()
+        return [future.result() for future in futures]
+
+    def flush(self) -> None:
+        """Fetch everything pending, in the calling thread"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return
+
+        try:
+            values = self._fetch(list(batch))
+        except Exception as e:
+            with self._lock:
+                # Failed keys are not cached, so a later load retries them
+                for key in batch:
+                    self._cache.pop(key, None)
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        for key, future in batch.items():
+            future.set_result(values.get(key))
+
+
+class WebhookQueue:
+    """Durable, deduplicating queue of webhook deliveries in SQLite.
+
+    Deliveries are committed before they are acknowledged and keyed by
+    X-Shopify-Webhook-Id, so Shopify's retries are stored only once.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS events (
+                webhook_id TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                shop_domain TEXT,
+                body BLOB NOT NULL,
+                received_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                processed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_status ON events(status, received_at);
+        """)
+
+    def put(self, webhook_id: str, topic: str, shop_domain: Optional[str], body: bytes) -> bool:
+        """Store a delivery; False if this webhook id is already queued"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO events (webhook_id, topic, shop_domain, body, received_at) VALUES (?, ?, ?, ?, ?)",
+                (webhook_id, topic, shop_domain, body, datetime.utcnow().isoformat() + "Z")
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            self.ready.set()
+        return cursor.rowcount == 1
+
+    def take(self, limit: int) -> List[sqlite3.Row]:
+        """Oldest pending deliveries first"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT webhook_id, topic, body FROM events WHERE status = 'pending' ORDER BY received_at, rowid LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    def finish(self, outcomes: Dict[str, Tuple[str, Optional[str]]]) -> None:
+        """Record (status, error) per webhook id"""
+        processed_at = datetime.utcnow().isoformat() + "Z"
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE events SET status = ?, error = ?, attempts = attempts + 1, processed_at = ? WHERE webhook_id = ?",
+                [(status, error, processed_at, webhook_id) for webhook_id, (status, error) in outcomes.items()]
+            )
+            self._conn.commit()
 
+    def requeue_failed(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("UPDATE events SET status = 'pending' WHERE status = 'failed'")
+            self._conn.commit()
+        return cursor.rowcount
 
-class ShopifyAppMCPServer:
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {row[0]: row[1] for row in self._conn.execute("SELECT status, COUNT(*) FROM events GROUP BY status")}
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Acknowledges webhook deliveries as soon as server.receive has queued them"""
+
+    def do_POST(self) -> None:
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            status = self.server.receive(self.headers, body)
+        except Exception as e:
+            # Not acknowledged, so Shopify delivers it again later
+            print(json.dumps({
+                "event": "webhook",
+                "topic": self.headers.get("X-Shopify-Topic"),
+                "id": self.headers.get("X-Shopify-Webhook-Id"),
+                "outcome": "error",
+                "error": str(e)
+            }), file=sys.stderr, flush=True)
+            status = 500
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        # Deliveries are reported as NDJSON events on stderr instead
+        pass
+
+
+def product_summary(p: Dict) -> Dict:
+    """Listing fields of a REST product"""
+    return {
+        "id": p["id"],
+        "title": p["title"],
+        "handle": p["handle"],
+        "status": p["status"],
+        "vendor": p.get("vendor"),
+        "product_type": p.get("product_type"),
+        "created_at": p["created_at"],
+        "updated_at": p["updated_at"],
+        "published_at": p.get("published_at"),
+        "variants_count": len(p.get("variants", []))
+    }
+
+
+def order_version(o: Dict) -> int:
+    """An order's updated_at as epoch seconds, used to pick its latest version"""
+    stamp = o.get("updated_at") or o["created_at"]
+    return int(datetime.fromisoformat(stamp.replace("Z", "+00:00")).timestamp())
+
+
+def order_summary(o: Dict) -> Dict:
+    """Listing fields of a REST order"""
+    return {
+        "id": o["id"],
+        "order_number": o["order_number"],
+        "email": o.get("email"),
+        "total_price": o["total_price"],
+        "subtotal_price": o.get("subtotal_price"),
+        "total_tax": o.get("total_tax"),
+        "financial_status": o.get("financial_status"),
+        "fulfillment_status": o.get("fulfillment_status"),
+        "created_at": o["created_at"],
+        "updated_at": o["updated_at"],
+        "line_items_count": len(o.get("line_items", []))
+    }
+
+
+def customer_summary(c: Dict) -> Dict:
+    """Listing fields of a REST customer"""
+    return {
+        "id": c["id"],
+        "email": c.get("email"),
+        "first_name": c.get("first_name"),
+        "last_name": c.get("last_name"),
+        "orders_count": c.get("orders_count", 0),
+        "total_spent": c.get("total_spent"),
+        "created_at": c["created_at"],
+        "updated_at": c["updated_at"],
+        "verified_email": c.get("verified_email", False),
+        "state": c.get("state")
+    }
+
+
+class ShopifyAppMCPServer(ShopifyClient):
     """MCP Server for Shopify App development"""
 
-    def __init__(self):
-        self.token = os.getenv("SHOPIFY_ADMIN_TOKEN")
-        self.shop_domain = os.getenv("SHOP_DOMAIN")
+    def __init__(self, shop_domain: Optional[str] = None, token: Optional[str] = None):
+        super().__init__(shop_domain, token)
+        self.graphql_url = f"{self.base_url}/graphql.json"
 
-        if not self.token:
-            raise ValueError("SHOPIFY_ADMIN_TOKEN environment variable is required")
-        if not self.shop_domain:
-            raise ValueError("SHOP_DOMAIN environment variable is required")
+        # GraphQL cost bucket, synced from extensions.cost.throttleStatus
+        self._cost_lock = threading.Lock()
+        self._cost_available = DEFAULT_COST_BUCKET
+        self._cost_max = DEFAULT_COST_BUCKET
+        self._restore_rate = DEFAULT_RESTORE_RATE
+        self._cost_checked_at = time.monotonic()
+        # Cost reserved by requests the server has not answered yet
+        self._cost_in_flight = 0.0
 
-        self.base_url = f"https://{self.shop_domain}.myshopify.com/admin/api/2024-10"
-        self.graphql_url = f"https://{self.shop_domain}.myshopify.com/admin/api/2024-10/graphql.json"
-        self.headers = {
-            "X-Shopify-Access-Token": self.token,
-            "Content-Type": "application/json"
-        }
+        # Batches get_product/get_order/get_customer lookups into nodes(ids:) queries
+        self.node_loader = NodeLoader(self._fetch_nodes, NODE_BATCH_WINDOW)
+
+        # Shared secret Shopify signs webhook bodies with (the app's client secret)
+        self.webhook_secret = os.getenv("SHOPIFY_WEBHOOK_SECRET")
+
+        # Fetched on first use by _shop_timezone
+        self._shop_tz: Optional[ZoneInfo] = None
 
     def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
         """Make a REST API request"""
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
-
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
+            response = self._send(method, endpoint, json=data)
             return response.json() if response.text else {}
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
 
-    def _graphql(self, query: str, variables: Optional[Dict] = None) -> Dict[str, Any]:
-        """Make a GraphQL API request"""
+    def _paginate(self, endpoint: str, key: str, params: Dict, max_items: Optional[int] = None) -> Iterator[Dict]:
+        """Yield items across REST pages by following Link page_info cursors.
+
+        The next page is fetched while the current one is consumed, so at
+        most two pages are held in memory. Raises requests exceptions.
+        """
+        def fetch(page_params: Dict):
+            response = self._send("GET", endpoint, params=page_params)
+            next_url = response.links.get("next", {}).get("url")
+            # Cursor pages only accept limit/page_info, which the link already carries
+            next_params = dict(parse_qsl(urlsplit(next_url).query)) if next_url else None
+            return response.json().get(key, []), next_params
+
+        remaining = max_items
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(fetch, params)
+            while future is not None:
+                items, next_params = future.result()
+                if remaining is not None:
+                    items = items[:remaining]
+                    remaining -= len(items)
+                more = next_params is not None and (remaining is None or remaining > 0)
+                future = pool.submit(fetch, next_params) if more else None
+                yield from items
+
+    def _page_size(self, max_items: Optional[int]) -> int:
+        return min(MAX_PAGE_SIZE, max_items) if max_items else MAX_PAGE_SIZE
+
+    def _throttle_cost(self, cost: float) -> None:
+        """Wait until the GraphQL cost bucket can pay for a query"""
+        with self._cost_lock:
+            now = time.monotonic()
+            available = min(self._cost_max, self._cost_available + (now - self._cost_checked_at) * self._restore_rate)
+            wait = (min(cost, self._cost_max) - available) / self._restore_rate
+            # Reserve the cost now; concurrent callers queue behind the debt
+            self._cost_available = available - cost
+            self._cost_in_flight += cost
+            self._cost_checked_at = now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _record_cost(self, result: Optional[Dict[str, Any]], cost: float) -> None:
+        """Settle a request's reservation and sync with the server's throttleStatus"""
+        status = (result or {}).get("extensions", {}).get("cost", {}).get("throttleStatus")
+        with self._cost_lock:
+            self._cost_in_flight -= cost
+            if not status:
+                return
+            # The server's figure does not include requests still in flight
+            self._cost_available = float(status["currentlyAvailable"]) - self._cost_in_flight
+            self._cost_max = float(status["maximumAvailable"])
+            self._restore_rate = float(status["restoreRate"])
+            self._cost_checked_at = time.monotonic()
+
+    def _post_graphql(self, query: str, variables: Optional[Dict] = None, cost: float = 1, max_retries: int = 3) -> Dict[str, Any]:
+        """Send a GraphQL request and return the whole response body.
+
+        cost is the expected query cost, paid from the local cost bucket
+        before sending; THROTTLED responses are retried once it refills.
+        Raises requests exceptions.
+        """
         data = {"query": query}
         if variables:
             data["variables"] = variables
 
+        for attempt in range(max_retries + 1):
+            self._throttle_cost(cost)
+            result = None
+            try:
+                response = self.session.post(
+                    self.graphql_url,
+                    json=data,
+                    timeout=30
+                )
+                response.raise_for_status()
+                result = response.json()
+            finally:
+                self._record_cost(result, cost)
+
+            errors = result.get("errors")
+            throttled = isinstance(errors, list) and any(
+                isinstance(e, dict) and e.get("extensions", {}).get("code") == "THROTTLED" for e in errors
+            )
+            if not throttled or attempt == max_retries:
+                return result
+            cost = result.get("extensions", {}).get("cost", {}).get("requestedQueryCost", cost)
+
+    def _graphql(self, query: str, variables: Optional[Dict] = None, cost: float = 1, max_retries: int = 3) -> Dict[str, Any]:
+        """Make a GraphQL API request and return its data (or an error dict)"""
         try:
-            response = requests.post(
-                self.graphql_url,
-                headers=self.headers,
-                json=data,
-                timeout=30
+            result = self._post_graphql(query, variables, cost, max_retries)
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        if "errors" in result:
+            return {"error": result["errors"]}
+
+        return result.get("data", {})
+
+    def _paginate_graphql(
+        self,
+        query: str,
+        variables: Dict,
+        path: Optional[List[str]] = None,
+        max_items: Optional[int] = None,
+        on_page: Optional[Callable[[Dict], None]] = None
+    ) -> Iterator[Dict]:
+        """Yield nodes of a connection by following pageInfo.endCursor.
+
+        query must take $after (and may take $first, set from max_items and
+        variables["first"]) and select pageInfo { hasNextPage endCursor }
+        plus nodes or edges { node } on the connection at path; without a
+        path, the only connection in the first page is used. Each page is
+        paid for with the previous page's requested cost, the next page is
+        fetched while the current one is consumed, and on_page receives
+        each page's number, node count and cost extension. Raises
+        RuntimeError on GraphQL errors and requests exceptions.
+        """
+        sized = "$first" in query
+        page_size = min(variables.get("first") or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+
+        def fetch(cursor: Optional[str], first: int, cost: float):
+            nonlocal path
+            page_variables = {**variables, "after": cursor}
+            if sized:
+                page_variables["first"] = first
+            result = self._post_graphql(query, page_variables, cost)
+            cost_info = result.get("extensions", {}).get("cost", {})
+            if "errors" in result:
+                raise RuntimeError(json.dumps({"errors": result["errors"], "cost": cost_info} if cost_info else result["errors"]))
+
+            if path is None:
+                found = find_connections(result.get("data"))
+                if len(found) != 1:
+                    raise RuntimeError(
+                        f"Found {len(found)} connections ({', '.join('.'.join(p) for p in found) or 'none'}); pass path"
+                    )
+                path = found[0]
+            connection = result.get("data")
+            for depth, key in enumerate(path, 1):
+                connection = (connection or {}).get(key)
+                if connection is None:
+                    raise RuntimeError(f"{'.'.join(path[:depth])} not found")
+            nodes = connection.get("nodes")
+            if nodes is None:
+                nodes = [edge["node"] for edge in connection.get("edges", [])]
+            page_info = connection.get("pageInfo") or {}
+            next_cursor = page_info.get("endCursor") if page_info.get("hasNextPage") else None
+            return nodes, next_cursor, cost_info
+
+        def size(remaining: Optional[int]) -> int:
+            return min(page_size, remaining) if remaining is not None else page_size
+
+        remaining = max_items
+        page = 0
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # A connection costs about 2 plus one point per requested node
+            first = size(remaining)
+            future = pool.submit(fetch, None, first, 2 + first if sized else estimate_selection_cost(query))
+            while future is not None:
+                nodes, next_cursor, cost_info = future.result()
+                page += 1
+                if on_page:
+                    on_page({"page": page, "nodes": len(nodes), "cost": cost_info})
+                if remaining is not None:
+                    nodes = nodes[:remaining]
+                    remaining -= len(nodes)
+                more = next_cursor is not None and (remaining is None or remaining > 0)
+                cost = cost_info.get("requestedQueryCost", 2 + first)
+                future = pool.submit(fetch, next_cursor, size(remaining), cost) if more else None
+                yield from nodes
+
+    def _fetch_nodes(self, keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Any]:
+        """Fetch (typename, selection, gid) keys with aliased nodes(ids:) queries.
+
+        Ids are grouped per type and selection, then packed into as few
+        queries as the per-query cost limit allows. Raises RuntimeError on
+        GraphQL errors.
+        """
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for typename, selection, gid in keys:
+            groups.setdefault((typename, selection), []).append(gid)
+
+        budget = min(MAX_QUERY_COST, self._cost_max)
+        queries: List[List[Tuple[str, str, List[str], int]]] = []
+        current: List[Tuple[str, str, List[str], int]] = []
+        current_cost = 0
+        for (typename, selection), gids in groups.items():
+            per_node = estimate_selection_cost(selection)
+            step = int(max(1, min(NODES_MAX_IDS, budget // per_node)))
+            for i in range(0, len(gids), step):
+                chunk = gids[i:i + step]
+                cost = per_node * len(chunk)
+                if current and current_cost + cost > budget:
+                    queries.append(current)
+                    current, current_cost = [], 0
+                current.append((typename, selection, chunk, cost))
+                current_cost += cost
+        if current:
+            queries.append(current)
+
+        nodes = {}
+        for parts in queries:
+            declarations = ", ".join(f"$ids{i}: [ID!]!" for i in range(len(parts)))
+            selections = "\n".join(
+                f"  n{i}: nodes(ids: $ids{i}) {{ ... on {typename} {{ {selection} }} }}"
+                for i, (typename, selection, _, _) in enumerate(parts)
+            )
+            result = self._graphql(
+                f"query({declarations}) {{\n{selections}\n}}",
+                {f"ids{i}": chunk for i, (_, _, chunk, _) in enumerate(parts)},
+                cost=sum(cost for _, _, _, cost in parts)
             )
+            if "error" in result:
+                raise RuntimeError(json.dumps(result["error"]))
+            for i, (typename, selection, chunk, _) in enumerate(parts):
+                for gid, node in zip(chunk, result.get(f"n{i}") or []):
+                    nodes[(typename, selection, gid)] = node
+        return nodes
+
+    def _load_nodes(self, typename: str, ids: Any, fields: Any = None) -> Any:
+        """Look up one id or a list of ids through the node loader.
+
+        fields is a list of field names or a raw selection string, defaulting
+        to DEFAULT_NODE_FIELDS. A single lookup waits for the batch window so
+        concurrent lookups share a query; a list is fetched right away.
+        """
+        if isinstance(fields, list):
+            fields = " ".join(fields)
+        selection = fields or DEFAULT_NODE_FIELDS[typename]
+
+        try:
+            if isinstance(ids, list):
+                return self.node_loader.load_many([(typename, selection, to_gid(typename, i)) for i in ids])
+            node = self.node_loader.load((typename, selection, to_gid(typename, ids))).result()
+        except RuntimeError as e:
+            return {"error": str(e)}
+
+        if node is None:
+            return {"error": f"{typename} {ids} not found", "status_code": 404}
+        return node
+
+    def _fetch_product_ids(self, handles: List[str]) -> Dict[str, str]:
+        """Resolve product handles to gids with products(query:) searches.
+
+        A NodeLoader fetch function. Raises RuntimeError on GraphQL errors.
+        """
+        query = """
+        query($first: Int!, $query: String!) {
+          products(first: $first, query: $query) { nodes { id handle } }
+        }
+        """
+        ids = {}
+        for i in range(0, len(handles), HANDLES_PER_QUERY):
+            chunk = handles[i:i + HANDLES_PER_QUERY]
+            search = " OR ".join(f"handle:{json.dumps(handle)}" for handle in chunk)
+            # Search terms can match loosely: leave room, keep exact handles only
+            first = min(MAX_PAGE_SIZE, 2 * len(chunk))
+            result = self._graphql(query, {"first": first, "query": search}, cost=2 + first)
+            if "error" in result:
+                raise RuntimeError(json.dumps(result["error"]))
+            for node in result["products"]["nodes"]:
+                if node["handle"] in chunk:
+                    ids[node["handle"]] = node["id"]
+        return ids
+
+    # Bulk Operations
+    def _run_bulk_query(self, query: str) -> Dict[str, Any]:
+        """Start a bulk query operation and return it (or an error dict)"""
+        mutation = """
+        mutation($query: String!) {
+          bulkOperationRunQuery(query: $query) {
+            bulkOperation { id status }
+            userErrors { field message }
+          }
+        }
+        """
+        result = self._graphql(mutation, {"query": query})
+
+        if "error" in result:
+            return result
+
+        payload = result.get("bulkOperationRunQuery", {})
+        errors = payload.get("userErrors")
+        if errors:
+            # Only one bulk query runs per app and shop; callers may fall back
+            if any("already in progress" in error.get("message", "") for error in errors):
+                return {"error": errors, "code": "OPERATION_IN_PROGRESS"}
+            return {"error": errors}
+        return payload["bulkOperation"]
+
+    def _wait_bulk_operation(self, operation_id: str, timeout: float = 600) -> Dict[str, Any]:
+        """Poll a bulk operation until it finishes and return its final state"""
+        query = """
+        query($id: ID!) {
+          node(id: $id) {
+            ... on BulkOperation { id status errorCode objectCount url partialDataUrl createdAt }
+          }
+        }
+        """
+        deadline = time.monotonic() + timeout
+        interval = BULK_POLL_INTERVAL
+
+        while True:
+            result = self._graphql(query, {"id": operation_id})
+            if "error" in result:
+                return result
+
+            operation = result.get("node") or {}
+            if operation.get("status") not in ("CREATED", "RUNNING", "CANCELING"):
+                return operation
+            if time.monotonic() + interval > deadline:
+                return {"error": f"Bulk operation {operation_id} still {operation.get('status')} after {timeout}s", "id": operation_id}
+
+            time.sleep(interval)
+            interval = min(interval * 2, BULK_POLL_MAX_INTERVAL)
+
+    def _iter_bulk_results(self, url: Optional[str]) -> Iterator[Dict]:
+        """Stream-parse a bulk operation's JSONL result file line by line.
+
+        Raises requests exceptions.
+        """
+        if not url:
+            # Operations that matched nothing have no result file
+            return
+        # Signed storage URL: fetched without the shop's access token
+        with requests.get(url, stream=True, timeout=60) as response:
             response.raise_for_status()
-            result = response.json()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def _stage_upload(self, path: Path, resource: str = "BULK_MUTATION_VARIABLES") -> Dict[str, Any]:
+        """Upload a file through stagedUploadsCreate; return {"path": key} or an error"""
+        mutation = """
+        mutation($input: [StagedUploadInput!]!) {
+          stagedUploadsCreate(input: $input) {
+            stagedTargets { url resourceUrl parameters { name value } }
+            userErrors { field message }
+          }
+        }
+        """
+        result = self._graphql(mutation, {
+            "input": [{
+                "resource": resource,
+                "filename": path.name,
+                "mimeType": "text/jsonl",
+                "httpMethod": "POST"
+            }]
+        }, cost=10)
 
-            if "errors" in result:
-                return {"error": result["errors"]}
+        if "error" in result:
+            return result
 
-            return result.get("data", {})
+        payload = result.get("stagedUploadsCreate", {})
+        if payload.get("userErrors"):
+            return {"error": payload["userErrors"]}
+
+        target = payload["stagedTargets"][0]
+        fields = {param["name"]: param["value"] for param in target["parameters"]}
+        try:
+            # Signed storage form: the file must be the last part, no access token
+            with open(path, "rb") as f:
+                response = requests.post(target["url"], data=fields, files={"file": (path.name, f, "text/jsonl")}, timeout=300)
+            response.raise_for_status()
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
 
+        return {"path": fields["key"]}
+
+    def _run_bulk_mutation(self, mutation: str, staged_upload_path: str) -> Dict[str, Any]:
+        """Start a bulk mutation over staged variables and return it (or an error dict)"""
+        run = """
+        mutation($mutation: String!, $path: String!) {
+          bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $path) {
+            bulkOperation { id status }
+            userErrors { field message }
+          }
+        }
+        """
+        result = self._graphql(run, {"mutation": mutation, "path": staged_upload_path}, cost=10)
+
+        if "error" in result:
+            return result
+
+        payload = result.get("bulkOperationRunMutation", {})
+        if payload.get("userErrors"):
+            return {"error": payload["userErrors"]}
+        return payload["bulkOperation"]
+
     # Product Management
-    def list_products(self, limit: int = 50, status: str = "active") -> List[Dict]:
-        """List products"""
+    def list_products(self, limit: int = 50, status: str = "active", all_pages: bool = False, max_items: Optional[int] = None) -> Iterable[Dict]:
+        """List products.
+
+        With all_pages, returns an iterator over every product (up to
+        max_items), fetched page by page.
+        """
+        if all_pages:
+            params = {"limit": self._page_size(max_items), "status": status}
+            return map(product_summary, self._paginate("products.json", "products", params, max_items))
+
         endpoint = f"products.json?limit={limit}&status={status}"
         result = self._request("GET", endpoint)
 
         if "error" in result:
             return result
 
-        products = result.get("products", [])
-        return [{
-            "id": p["id"],
-            "title": p["title"],
-            "handle": p["handle"],
-            "status": p["status"],
-            "vendor": p.get("vendor"),
-            "product_type": p.get("product_type"),
-            "created_at": p["created_at"],
-            "updated_at": p["updated_at"],
-            "published_at": p.get("published_at"),
-            "variants_count": len(p.get("variants", []))
-        } for p in products]
-
-    def get_product(self, product_id: int) -> Dict:
-        """Get product details"""
+        return [product_summary(p) for p in result.get("products", [])]
+
+    def get_product(self, product_id: Any, fields: Any = None) -> Dict:
+        """Get product details.
+
+        With a list of ids or a fields selection, the lookup is batched
+        into GraphQL nodes(ids:) queries and returns Product nodes.
+        """
+        if fields is not None or isinstance(product_id, list):
+            return self._load_nodes("Product", product_id, fields)
+
         result = self._request("GET", f"products/{product_id}.json")
 
         if "error" in result:
@@ -131,32 +833,185 @@ class ShopifyAppMCPServer:
 
         return result.get("product", {})
 
+    def bulk_upsert_products(
+        self,
+        path: Optional[str] = None,
+        products: Optional[List[Dict]] = None,
+        results_path: Optional[str] = None,
+        timeout: float = BULK_UPSERT_TIMEOUT
+    ) -> Dict:
+        """Create or update products in one productSet bulk mutation.
+
+        Rows are ProductSetInput objects from an NDJSON/CSV file or inline.
+        Rows with an id update that product. Rows with only a handle are
+        matched against the local catalog (sync_catalog), then against the
+        shop with batched handle searches, and create a product only when
+        neither knows the handle. Input is streamed into a staged JSONL
+        upload, and the operation's per-line results are streamed into
+        results_path (default <path>.results.ndjson).
+        """
+        if path is None and products is None:
+            return {"error": "path or products is required"}
+        if path is not None and not Path(path).exists():
+            return {"error": f"File not found: {path}"}
+        if results_path is None and path is not None:
+            results_path = f"{path}.results.ndjson"
+
+        summary = {"submitted": 0, "created": 0, "updated": 0, "failed": 0}
+        results: List[Dict] = []
+        failures: List[Dict] = []
+        out = open(results_path, "w") if results_path else None
+
+        def record(entry: Dict) -> None:
+            if entry["status"] == "failed":
+                summary["failed"] += 1
+                if len(failures) < 50:
+                    failures.append(entry)
+            else:
+                summary[entry["status"]] += 1
+            if out:
+                out.write(json.dumps(entry) + "\n")
+            else:
+                results.append(entry)
+
+        def fail(error: Dict) -> Dict:
+            # Rows rejected while staging are reported with the error
+            return dict(error, **summary, failures=failures)
+
+        catalog = self._open_catalog_db() if (self.cache_dir / "catalog.db").exists() else None
+        # Fresh per run, so handles created since are not answered from cache
+        handle_loader = NodeLoader(self._fetch_product_ids, NODE_BATCH_WINDOW)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        staged: Optional[Path] = None
+        # (row number, handle) per staged line, for the report
+        lines: List[Tuple[int, Optional[str]]] = []
+
+        try:
+            # Concurrent runs against the same shop each get their own file
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.cache_dir, prefix="bulk_upsert_products.", suffix=".jsonl", delete=False
+            ) as f:
+                staged = Path(f.name)
+
+                def stage(pending: List[Tuple[int, Dict]]) -> None:
+                    unmatched = [p["handle"] for _, p in pending if "id" not in p and p.get("handle")]
+                    ids = dict(zip(unmatched, handle_loader.load_many(unmatched))) if unmatched else {}
+                    for number, product in pending:
+                        if "id" not in product and ids.get(product.get("handle")):
+                            product["id"] = ids[product["handle"]]
+                        f.write(json.dumps({"input": product}) + "\n")
+                        lines.append((number, product.get("handle")))
+
+                pending: List[Tuple[int, Dict]] = []
+                for number, row in self._read_rows(path, products):
+                    if not isinstance(row, dict) or not (row.get("id") or row.get("handle") or row.get("title")):
+                        record({"row": number, "status": "failed", "error": "Row is not a JSON object" if row is None else "Row needs an id, handle or title"})
+                        continue
+                    product = dict(row)
+                    if product.get("id"):
+                        product["id"] = to_gid("Product", product["id"])
+                    else:
+                        product.pop("id", None)
+                        if catalog is not None and product.get("handle"):
+                            match = catalog.execute("SELECT id FROM products WHERE handle = ?", (product["handle"],)).fetchone()
+                            if match:
+                                product["id"] = to_gid("Product", match["id"])
+                    pending.append((number, product))
+                    if len(pending) >= MAX_PAGE_SIZE:
+                        stage(pending)
+                        pending = []
+                stage(pending)
+            summary["submitted"] = len(lines)
+            if not lines:
+                summary["failures"] = failures
+                return summary
+
+            upload = self._stage_upload(staged)
+            if "error" in upload:
+                return fail(upload)
+
+            operation = self._run_bulk_mutation(PRODUCT_SET_MUTATION, upload["path"])
+            if "error" in operation:
+                return fail(operation)
+
+            operation = self._wait_bulk_operation(operation["id"], timeout)
+            if "error" in operation:
+                return fail(operation)
+
+            # Products created by this operation are no older than it
+            started = datetime.fromisoformat(operation["createdAt"].replace("Z", "+00:00"))
+            reported = set()
+            for result in self._iter_bulk_results(operation.get("url") or operation.get("partialDataUrl")):
+                line = result.get("__lineNumber")
+                if line is None or line >= len(lines):
+                    continue
+                number, handle = lines[line]
+                reported.add(line)
+                payload = (result.get("data") or {}).get("productSet") or {}
+                errors = payload.get("userErrors") or result.get("errors")
+                entry = {"row": number, "handle": handle}
+                if errors or not payload.get("product"):
+                    entry.update({"status": "failed", "error": "; ".join(e.get("message", "") for e in errors) if errors else "No product returned"})
+                else:
+                    product = payload["product"]
+                    created = datetime.fromisoformat(product["createdAt"].replace("Z", "+00:00")) >= started
+                    entry.update({"status": "created" if created else "updated", "id": product["id"], "handle": product["handle"]})
+                record(entry)
+
+            # Lines a failed or cancelled operation never reached
+            for line, (number, handle) in enumerate(lines):
+                if line not in reported:
+                    record({"row": number, "handle": handle, "status": "failed", "error": f"No result (operation {operation.get('status')})"})
+        except requests.exceptions.RequestException as e:
+            return fail({"error": str(e), "status_code": getattr(e.response, "status_code", None)})
+        except RuntimeError as e:
+            return fail({"error": f"Handle lookup failed: {e}"})
+        finally:
+            if catalog is not None:
+                catalog.close()
+            if out:
+                out.close()
+            if staged is not None:
+                staged.unlink(missing_ok=True)
+
+        summary.update({
+            "operation": {key: operation.get(key) for key in ("id", "status", "errorCode", "objectCount")},
+            "failures": failures
+        })
+        if results_path:
+            summary["results_path"] = results_path
+        else:
+            summary["results"] = results
+        return summary
+
     # Order Management
-    def list_orders(self, limit: int = 50, status: str = "any") -> List[Dict]:
-        """List orders"""
+    def list_orders(self, limit: int = 50, status: str = "any", all_pages: bool = False, max_items: Optional[int] = None) -> Iterable[Dict]:
+        """List orders.
+
+        With all_pages, returns an iterator over every order (up to
+        max_items), fetched page by page.
+        """
+        if all_pages:
+            params = {"limit": self._page_size(max_items), "status": status}
+            return map(order_summary, self._paginate("orders.json", "orders", params, max_items))
+
         endpoint = f"orders.json?limit={limit}&status={status}"
         result = self._request("GET", endpoint)
 
         if "error" in result:
             return result
 
-        orders = result.get("orders", [])
-        return [{
-            "id": o["id"],
-            "order_number": o["order_number"],
-            "email": o.get("email"),
-            "total_price": o["total_price"],
-            "subtotal_price": o.get("subtotal_price"),
-            "total_tax": o.get("total_tax"),
-            "financial_status": o.get("financial_status"),
-            "fulfillment_status": o.get("fulfillment_status"),
-            "created_at": o["created_at"],
-            "updated_at": o["updated_at"],
-            "line_items_count": len(o.get("line_items", []))
-        } for o in orders]
-
-    def get_order(self, order_id: int) -> Dict:
-        """Get order details"""
+        return [order_summary(o) for o in result.get("orders", [])]
+
+    def get_order(self, order_id: Any, fields: Any = None) -> Dict:
+        """Get order details.
+
+        With a list of ids or a fields selection, the lookup is batched
+        into GraphQL nodes(ids:) queries and returns Order nodes.
+        """
+        if fields is not None or isinstance(order_id, list):
+            return self._load_nodes("Order", order_id, fields)
+
         result = self._request("GET", f"orders/{order_id}.json")
 
         if "error" in result:
@@ -165,30 +1020,33 @@ class ShopifyAppMCPServer:
         return result.get("order", {})
 
     # Customer Management
-    def list_customers(self, limit: int = 50) -> List[Dict]:
-        """List customers"""
+    def list_customers(self, limit: int = 50, all_pages: bool = False, max_items: Optional[int] = None) -> Iterable[Dict]:
+        """List customers.
+
+        With all_pages, returns an iterator over every customer (up to
+        max_items), fetched page by page.
+        """
+        if all_pages:
+            params = {"limit": self._page_size(max_items)}
+            return map(customer_summary, self._paginate("customers.json", "customers", params, max_items))
+
         endpoint = f"customers.json?limit={limit}"
         result = self._request("GET", endpoint)
 
         if "error" in result:
             return result
 
-        customers = result.get("customers", [])
-        return [{
-            "id": c["id"],
-            "email": c.get("email"),
-            "first_name": c.get("first_name"),
-            "last_name": c.get("last_name"),
-            "orders_count": c.get("orders_count", 0),
-            "total_spent": c.get("total_spent"),
-            "created_at": c["created_at"],
-            "updated_at": c["updated_at"],
-            "verified_email": c.get("verified_email", False),
-            "state": c.get("state")
-        } for c in customers]
-
-    def get_customer(self, customer_id: int) -> Dict:
-        """Get customer details"""
+        return [customer_summary(c) for c in result.get("customers", [])]
+
+    def get_customer(self, customer_id: Any, fields: Any = None) -> Dict:
+        """Get customer details.
+
+        With a list of ids or a fields selection, the lookup is batched
+        into GraphQL nodes(ids:) queries and returns Customer nodes.
+        """
+        if fields is not None or isinstance(customer_id, list):
+            return self._load_nodes("Customer", customer_id, fields)
+
         result = self._request("GET", f"customers/{customer_id}.json")
 
         if "error" in result:
@@ -230,12 +1088,245 @@ class ShopifyAppMCPServer:
 
         return result.get("inventory_level", {})
 
+    def _read_rows(self, path: Optional[str], rows: Optional[List[Dict]]) -> Iterator[Tuple[int, Optional[Dict]]]:
+        """Yield (row number, row) from inline rows or a CSV/NDJSON file.
+
+        Unparseable NDJSON lines and rows that are not objects come out as
+        None so they can be reported.
+        """
+        if rows is not None:
+            for number, row in enumerate(rows, 1):
+                yield number, row if isinstance(row, dict) else None
+            return
+
+        with open(path, newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            if not first.lstrip().startswith("{"):
+                yield from enumerate(csv.DictReader(f), 1)
+                return
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+
+    def _completed_rows(self, results_path: Optional[str]) -> set:
+        """Row numbers whose latest outcome in a results file is ok"""
+        done = set()
+        if results_path and Path(results_path).exists():
+            with open(results_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash: its row is simply retried
+                        continue
+                    if record["status"] == "ok":
+                        done.add(record["row"])
+                    else:
+                        done.discard(record["row"])
+        return done
+
+    def _open_results(self, results_path: Optional[str], resume: bool) -> Optional[IO[str]]:
+        """Open a results file, appending to it on resume.
+
+        A partial last line left by a crash is terminated first, so new
+        records start on a line of their own.
+        """
+        if not results_path:
+            return None
+        if not resume:
+            return open(results_path, "w")
+        path = Path(results_path)
+        partial = False
+        if path.exists() and path.stat().st_size:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b"\n"
+        out = open(path, "a")
+        if partial:
+            out.write("\n")
+        return out
+
+    def _set_batch(
+        self,
+        mutation: str,
+        payload_name: str,
+        list_field: str,
+        variables: Callable[[List[Dict]], Dict],
+        batch: List[Tuple[int, Dict]],
+        cost: float
+    ) -> Dict[int, Optional[str]]:
+        """Apply one all-or-nothing list mutation; return {row number: error or None}.
+
+        variables builds the mutation variables from the batch's items. When
+        userErrors point at specific items (a field path running through
+        list_field and an index), those rows fail and the rest of the batch
+        is sent again.
+        """
+        outcome: Dict[int, Optional[str]] = {}
+        pending = batch
+        while pending:
+            result = self._graphql(mutation, variables([item for _, item in pending]), cost=cost)
+
+            if "error" in result:
+                error = json.dumps(result["error"]) if not isinstance(result["error"], str) else result["error"]
+                outcome.update((number, error) for number, _ in pending)
+                break
+
+            user_errors = (result.get(payload_name) or {}).get("userErrors", [])
+            if not user_errors:
+                outcome.update((number, None) for number, _ in pending)
+                break
+
+            # field looks like ["input", "quantities", "3", "locationId"]
+            row_errors: Dict[int, str] = {}
+            for user_error in user_errors:
+                field = [str(part) for part in user_error.get("field") or []]
+                at = field.index(list_field) + 1 if list_field in field else len(field)
+                if at < len(field) and field[at].isdigit() and int(field[at]) < len(pending):
+                    row_errors[int(field[at])] = user_error["message"]
+                else:
+                    row_errors = {}
+                    break
+            if not row_errors:
+                message = "; ".join(e["message"] for e in user_errors)
+                outcome.update((number, message) for number, _ in pending)
+                break
+
+            outcome.update((pending[i][0], message) for i, message in row_errors.items())
+            pending = [entry for i, entry in enumerate(pending) if i not in row_errors]
+
+        return outcome
+
+    def _set_inventory_batch(self, batch: List[Tuple[int, Dict]], name: str, reason: str) -> Dict[int, Optional[str]]:
+        """Apply one inventorySetQuantities call; return {row number: error or None}"""
+        mutation = """
+        mutation($input: InventorySetQuantitiesInput!) {
+          inventorySetQuantities(input: $input) {
+            inventoryAdjustmentGroup { id }
+            userErrors { field message code }
+          }
+        }
+        """
+        return self._set_batch(
+            mutation,
+            "inventorySetQuantities",
+            "quantities",
+            lambda quantities: {
+                "input": {
+                    "name": name,
+                    "reason": reason,
+                    "ignoreCompareQuantity": True,
+                    "quantities": quantities
+                }
+            },
+            batch,
+            INVENTORY_MUTATION_COST
+        )
+
+    def bulk_set_inventory(
+        self,
+        path: Optional[str] = None,
+        rows: Optional[List[Dict]] = None,
+        results_path: Optional[str] = None,
+        resume: bool = False,
+        name: str = "available",
+        reason: str = "correction",
+        batch_size: int = INVENTORY_BATCH_SIZE
+    ) -> Dict:
+        """Set inventory quantities from CSV/NDJSON rows in batched GraphQL mutations.
+
+        Rows carry inventory_item_id, location_id and quantity (REST ids or
+        gids). Each row's result is appended to results_path (default
+        <path>.results.ndjson) as it is known; with resume, rows already
+        recorded as ok there are skipped, so a rerun retries only failures.
+        """
+        if path is None and rows is None:
+            return {"error": "path or rows is required"}
+        if path is not None and not Path(path).exists():
+            return {"error": f"File not found: {path}"}
+        if results_path is None and path is not None:
+            results_path = f"{path}.results.ndjson"
+
+        done = self._completed_rows(results_path) if resume else set()
+
+        summary = {"applied": 0, "failed": 0, "skipped": 0, "batches": 0}
+        results: List[Dict] = []
+        failures: List[Dict] = []
+        out = self._open_results(results_path, resume)
+
+        def record(number: int, row: Optional[Dict], error: Optional[str]) -> None:
+            entry = {"row": number, "status": "failed" if error else "ok"}
+            if row:
+                entry.update({key: row.get(key) for key in ("inventory_item_id", "location_id", "quantity")})
+            if error:
+                entry["error"] = error
+                summary["failed"] += 1
+                if len(failures) < 50:
+                    failures.append(entry)
+            else:
+                summary["applied"] += 1
+            if out:
+                out.write(json.dumps(entry) + "\n")
+            else:
+                results.append(entry)
+
+        def apply(batch: List[Tuple[int, Dict]]) -> None:
+            summary["batches"] += 1
+            for number, error in self._set_inventory_batch(batch, name, reason).items():
+                record(number, rows_by_number.pop(number), error)
+            if out:
+                out.flush()
+
+        batch: List[Tuple[int, Dict]] = []
+        rows_by_number: Dict[int, Dict] = {}
+        try:
+            for number, row in self._read_rows(path, rows):
+                if number in done:
+                    summary["skipped"] += 1
+                    continue
+                try:
+                    quantity = {
+                        "inventoryItemId": to_gid("InventoryItem", row["inventory_item_id"]),
+                        "locationId": to_gid("Location", row["location_id"]),
+                        "quantity": int(row["quantity"])
+                    }
+                except (TypeError, KeyError, ValueError):
+                    record(number, row, "Row is not a JSON object" if row is None else "Row needs inventory_item_id, location_id and an integer quantity")
+                    continue
+
+                batch.append((number, quantity))
+                rows_by_number[number] = row
+                if len(batch) >= batch_size:
+                    apply(batch)
+                    batch = []
+            if batch:
+                apply(batch)
+        finally:
+            if out:
+                out.close()
+
+        summary["failures"] = failures
+        if results_path:
+            summary["results_path"] = results_path
+        else:
+            summary["results"] = results
+        return summary
+
     # Collection Management
     def list_collections(self, limit: int = 50) -> List[Dict]:
         """List smart and custom collections"""
-        # Get custom collections
-        custom = self._request("GET", f"custom_collections.json?limit={limit}")
-        smart = self._request("GET", f"smart_collections.json?limit={limit}")
+        # Both kinds are fetched concurrently
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            custom, smart = pool.map(
+                lambda kind: self._request("GET", f"{kind}_collections.json?limit={limit}"),
+                ["custom", "smart"]
+            )
 
         collections = []
 
@@ -263,6 +1354,632 @@ class ShopifyAppMCPServer:
 
         return collections
 
+    # Local Catalog
+    def _open_catalog_db(self) -> sqlite3.Connection:
+        """Open (and create if needed) the local catalog snapshot"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(str(self.cache_dir / "catalog.db"))
+        conn.row_factory = sqlite3.Row
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                handle TEXT,
+                title TEXT,
+                vendor TEXT COLLATE NOCASE,
+                product_type TEXT COLLATE NOCASE,
+                status TEXT,
+                tags TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                published_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_handle ON products(handle);
+            CREATE INDEX IF NOT EXISTS idx_products_vendor ON products(vendor);
+            CREATE INDEX IF NOT EXISTS idx_products_type ON products(product_type);
+            CREATE TABLE IF NOT EXISTS product_tags (
+                product_id INTEGER NOT NULL,
+                tag TEXT COLLATE NOCASE NOT NULL,
+                PRIMARY KEY (tag, product_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_product_tags_product ON product_tags(product_id);
+            CREATE TABLE IF NOT EXISTS variants (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                title TEXT,
+                sku TEXT,
+                barcode TEXT,
+                price TEXT,
+                position INTEGER,
+                inventory_item_id INTEGER,
+                inventory_quantity INTEGER,
+                updated_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_variants_product ON variants(product_id);
+            CREATE INDEX IF NOT EXISTS idx_variants_sku ON variants(sku);
+            CREATE INDEX IF NOT EXISTS idx_variants_barcode ON variants(barcode);
+            CREATE TABLE IF NOT EXISTS collections (
+                id INTEGER PRIMARY KEY,
+                handle TEXT,
+                title TEXT,
+                type TEXT,
+                published_at TEXT,
+                updated_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_collections_handle ON collections(handle);
+            CREATE TABLE IF NOT EXISTS collects (
+                collection_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                PRIMARY KEY (collection_id, product_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_collects_product ON collects(product_id);
+            CREATE TABLE IF NOT EXISTS inventory_levels (
+                inventory_item_id INTEGER NOT NULL,
+                location_id INTEGER NOT NULL,
+                available INTEGER,
+                updated_at TEXT,
+                PRIMARY KEY (inventory_item_id, location_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sync_state (
+                resource TEXT PRIMARY KEY,
+                since TEXT,
+                synced_at TEXT
+            );
+        """)
+        return conn
+
+    def _upsert_catalog_product(self, conn: sqlite3.Connection, product: Dict) -> None:
+        """Insert or replace one product with its tags and variants"""
+        product_id = product["id"]
+        tags = [tag.strip() for tag in (product.get("tags") or "").split(",") if tag.strip()]
+
+        conn.execute(
+            "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                product_id,
+                product["handle"],
+                product["title"],
+                product.get("vendor"),
+                product.get("product_type"),
+                product.get("status"),
+                ", ".join(tags),
+                product["created_at"],
+                product["updated_at"],
+                product.get("published_at")
+            )
+        )
+        conn.execute("DELETE FROM product_tags WHERE product_id = ?", (product_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO product_tags VALUES (?, ?)",
+            [(product_id, tag) for tag in tags]
+        )
+        conn.execute("DELETE FROM variants WHERE product_id = ?", (product_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(
+                v["id"],
+                product_id,
+                v.get("title"),
+                v.get("sku") or None,
+                v.get("barcode") or None,
+                v.get("price"),
+                v.get("position"),
+                v.get("inventory_item_id"),
+                v.get("inventory_quantity"),
+                v.get("updated_at")
+            ) for v in product.get("variants", [])]
+        )
+
+    def _upsert_catalog_collection(self, conn: sqlite3.Connection, collection: Dict, kind: str) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                collection["id"],
+                collection["handle"],
+                collection["title"],
+                kind,
+                collection.get("published_at"),
+                collection["updated_at"]
+            )
+        )
+
+    def _sync_catalog_resource(self, conn: sqlite3.Connection, resource: str, params: Dict, upsert: Callable[[Dict], None]) -> List[int]:
+        """Pull one list endpoint updated since the last sync into the catalog.
+
+        Returns the synced items' ids. The updated_at watermark only moves
+        once the whole pass succeeds; re-applying an item is harmless.
+        """
+        state = conn.execute("SELECT since FROM sync_state WHERE resource = ?", (resource,)).fetchone()
+        since = state["since"] if state else None
+
+        params = dict(params, limit=MAX_PAGE_SIZE)
+        if since:
+            params["updated_at_min"] = since
+
+        ids = []
+        newest = since
+        for item in self._paginate(f"{resource}.json", resource, params):
+            upsert(item)
+            ids.append(item["id"])
+            if newest is None or datetime.fromisoformat(item["updated_at"]) > datetime.fromisoformat(newest):
+                newest = item["updated_at"]
+            if len(ids) % MAX_PAGE_SIZE == 0:
+                conn.commit()
+
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+            (resource, newest, datetime.utcnow().isoformat() + "Z")
+        )
+        conn.commit()
+        return ids
+
+    def sync_catalog(self, full: bool = False) -> Dict:
+        """Incrementally snapshot products, variants, collections and membership into SQLite.
+
+        Products and collections are fetched with updated_at_min and new
+        collects with since_id. The collects of changed custom collections
+        are re-listed so removed products drop out. Smart collection
+        membership follows product fields, so every smart collection is
+        re-listed when any product changed (only the changed ones otherwise).
+        Deleted products and collections are only dropped by a full sync.
+        """
+        conn = self._open_catalog_db()
+        try:
+            if full:
+                conn.executescript("""
+                    DELETE FROM products; DELETE FROM product_tags; DELETE FROM variants;
+                    DELETE FROM collections; DELETE FROM collects; DELETE FROM sync_state;
+                """)
+
+            products = self._sync_catalog_resource(
+                conn, "products", {}, lambda p: self._upsert_catalog_product(conn, p)
+            )
+            custom = self._sync_catalog_resource(
+                conn, "custom_collections", {}, lambda c: self._upsert_catalog_collection(conn, c, "custom")
+            )
+            smart = self._sync_catalog_resource(
+                conn, "smart_collections", {}, lambda c: self._upsert_catalog_collection(conn, c, "smart")
+            )
+
+            # Collects only exist for custom collections and are never edited, only added or removed
+            state = conn.execute("SELECT since FROM sync_state WHERE resource = 'collects'").fetchone()
+            last_id = int(state["since"]) if state else 0
+            collects = 0
+            for collect in self._paginate("collects.json", "collects", {"since_id": last_id, "limit": MAX_PAGE_SIZE}):
+                conn.execute("INSERT OR IGNORE INTO collects VALUES (?, ?)", (collect["collection_id"], collect["product_id"]))
+                last_id = max(last_id, collect["id"])
+                collects += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES ('collects', ?, ?)",
+                (str(last_id), datetime.utcnow().isoformat() + "Z")
+            )
+
+            # since_id only sees additions: replace the collects of changed
+            # custom collections (a full sync has just listed them all)
+            if not full:
+                for collection_id in custom:
+                    members = [
+                        (collection_id, collect["product_id"])
+                        for collect in self._paginate("collects.json", "collects", {"collection_id": collection_id, "limit": MAX_PAGE_SIZE})
+                    ]
+                    conn.execute("DELETE FROM collects WHERE collection_id = ?", (collection_id,))
+                    conn.executemany("INSERT OR IGNORE INTO collects VALUES (?, ?)", members)
+
+            # Smart collections have no collects, and an edited product can
+            # enter or leave any of them: list the products of each
+            relist = smart
+            if products:
+                relist = [row["id"] for row in conn.execute("SELECT id FROM collections WHERE type = 'smart'")]
+            for collection_id in relist:
+                members = [
+                    (collection_id, product["id"])
+                    for product in self._paginate("products.json", "products", {"collection_id": collection_id, "fields": "id", "limit": MAX_PAGE_SIZE})
+                ]
+                conn.execute("DELETE FROM collects WHERE collection_id = ?", (collection_id,))
+                conn.executemany("INSERT OR IGNORE INTO collects VALUES (?, ?)", members)
+            conn.commit()
+
+            totals = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("products", "variants", "collections", "collects")
+            }
+            return {
+                "updated_products": len(products),
+                "updated_collections": len(custom) + len(smart),
+                "new_collects": collects,
+                "total_products": totals["products"],
+                "total_variants": totals["variants"],
+                "total_collections": totals["collections"],
+                "total_memberships": totals["collects"],
+                "database": str(self.cache_dir / "catalog.db")
+            }
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+        finally:
+            conn.close()
+
+    def find_products(
+        self,
+        handle: Optional[str] = None,
+        sku: Optional[str] = None,
+        vendor: Optional[str] = None,
+        tag: Optional[str] = None,
+        collection: Optional[Any] = None,
+        product_type: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict]:
+        """Look products up in the local catalog (run sync_catalog first).
+
+        Filters combine with AND; vendor, product_type and tag ignore case,
+        and collection matches a collection id or handle.
+        """
+        conn = self._open_catalog_db()
+        try:
+            where = []
+            args: List[Any] = []
+            if handle:
+                where.append("p.handle = ?")
+                args.append(handle)
+            if sku:
+                where.append("p.id IN (SELECT product_id FROM variants WHERE sku = ?)")
+                args.append(sku)
+            if vendor:
+                where.append("p.vendor = ?")
+                args.append(vendor)
+            if product_type:
+                where.append("p.product_type = ?")
+                args.append(product_type)
+            if tag:
+                where.append("p.id IN (SELECT product_id FROM product_tags WHERE tag = ?)")
+                args.append(tag)
+            if collection is not None:
+                where.append(
+                    "p.id IN (SELECT m.product_id FROM collects m JOIN collections c ON c.id = m.collection_id"
+                    " WHERE c.id = ? OR c.handle = ?)"
+                )
+                args.extend([collection, str(collection)])
+
+            sql = "SELECT p.* FROM products p"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY p.title LIMIT ?"
+            args.append(limit)
+            rows = conn.execute(sql, args).fetchall()
+
+            ids = [row["id"] for row in rows]
+            marks = ", ".join("?" * len(ids))
+            variants: Dict[int, List[Dict]] = {}
+            for v in conn.execute(f"SELECT * FROM variants WHERE product_id IN ({marks}) ORDER BY position", ids):
+                variants.setdefault(v["product_id"], []).append({
+                    "id": v["id"],
+                    "title": v["title"],
+                    "sku": v["sku"],
+                    "barcode": v["barcode"],
+                    "price": v["price"],
+                    "inventory_item_id": v["inventory_item_id"],
+                    "inventory_quantity": v["inventory_quantity"]
+                })
+            # Per-location levels arrive through inventory_levels webhooks
+            levels: Dict[int, Dict[str, int]] = {}
+            for level in conn.execute(
+                f"SELECT l.* FROM inventory_levels l JOIN variants v ON v.inventory_item_id = l.inventory_item_id"
+                f" WHERE v.product_id IN ({marks})", ids
+            ):
+                levels.setdefault(level["inventory_item_id"], {})[str(level["location_id"])] = level["available"]
+            for product_variants in variants.values():
+                for v in product_variants:
+                    if v["inventory_item_id"] in levels:
+                        v["inventory_levels"] = levels[v["inventory_item_id"]]
+            memberships: Dict[int, List[int]] = {}
+            for m in conn.execute(f"SELECT product_id, collection_id FROM collects WHERE product_id IN ({marks})", ids):
+                memberships.setdefault(m["product_id"], []).append(m["collection_id"])
+
+            return [{
+                "id": row["id"],
+                "title": row["title"],
+                "handle": row["handle"],
+                "vendor": row["vendor"],
+                "product_type": row["product_type"],
+                "status": row["status"],
+                "tags": row["tags"].split(", ") if row["tags"] else [],
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"],
+                "published_at": row["published_at"],
+                "variants": variants.get(row["id"], []),
+                "collection_ids": memberships.get(row["id"], [])
+            } for row in rows]
+        finally:
+            conn.close()
+
+    def find_collections(self, handle: Optional[str] = None, product_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        """Look collections up in the local catalog by handle or member product"""
+        conn = self._open_catalog_db()
+        try:
+            sql = "SELECT c.*, (SELECT COUNT(*) FROM collects m WHERE m.collection_id = c.id) AS products_count FROM collections c"
+            where = []
+            args: List[Any] = []
+            if handle:
+                where.append("c.handle = ?")
+                args.append(handle)
+            if product_id is not None:
+                where.append("c.id IN (SELECT collection_id FROM collects WHERE product_id = ?)")
+                args.append(product_id)
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY c.title LIMIT ?"
+            args.append(limit)
+
+            return [{
+                "id": row["id"],
+                "title": row["title"],
+                "handle": row["handle"],
+                "type": row["type"],
+                "published_at": row["published_at"],
+                "updated_at": row["updated_at"],
+                "products_count": row["products_count"]
+            } for row in conn.execute(sql, args)]
+        finally:
+            conn.close()
+
+    # Webhook Ingestion
+    def _webhook_signature(self, body: bytes) -> str:
+        digest = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).digest()
+        return base64.b64encode(digest).decode()
+
+    def _receive_webhook(self, events: WebhookQueue, headers: Any, body: bytes) -> str:
+        """Verify and queue one delivery; return queued, duplicate or rejected"""
+        signature = headers.get("X-Shopify-Hmac-Sha256") or ""
+        if not hmac.compare_digest(self._webhook_signature(body), signature):
+            return "rejected"
+
+        webhook_id = headers.get("X-Shopify-Webhook-Id")
+        topic = headers.get("X-Shopify-Topic")
+        shop_domain = headers.get("X-Shopify-Shop-Domain")
+        if not webhook_id or not topic or (shop_domain and shop_domain != f"{self.shop_domain}.myshopify.com"):
+            return "rejected"
+
+        return "queued" if events.put(webhook_id, topic, shop_domain, body) else "duplicate"
+
+    def _apply_product_webhook(self, conn: sqlite3.Connection, action: str, payload: Dict) -> bool:
+        if action == "delete":
+            for table, column in (("products", "id"), ("product_tags", "product_id"), ("variants", "product_id"), ("collects", "product_id")):
+                conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (payload["id"],))
+            return True
+
+        # Deliveries can arrive out of order; never replace a newer version
+        row = conn.execute("SELECT updated_at FROM products WHERE id = ?", (payload["id"],)).fetchone()
+        if row and datetime.fromisoformat(row["updated_at"]) > datetime.fromisoformat(payload["updated_at"]):
+            return False
+        self._upsert_catalog_product(conn, payload)
+        return True
+
+    def _apply_inventory_webhook(self, conn: sqlite3.Connection, action: str, payload: Dict) -> bool:
+        key = (payload["inventory_item_id"], payload["location_id"])
+        if action == "disconnect":
+            conn.execute("DELETE FROM inventory_levels WHERE inventory_item_id = ? AND location_id = ?", key)
+            return True
+
+        row = conn.execute(
+            "SELECT updated_at FROM inventory_levels WHERE inventory_item_id = ? AND location_id = ?", key
+        ).fetchone()
+        if row and row["updated_at"] and payload.get("updated_at") and \
+                datetime.fromisoformat(row["updated_at"]) > datetime.fromisoformat(payload["updated_at"]):
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO inventory_levels VALUES (?, ?, ?, ?)",
+            key + (payload.get("available"), payload.get("updated_at"))
+        )
+        return True
+
+    def _apply_webhooks(self, events: List[sqlite3.Row]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Apply queued deliveries to the local caches that exist.
+
+        Product and inventory events update the catalog snapshot; order
+        events are appended to the order store in one batch, where the
+        version with the latest updated_at stays live, and orders/delete
+        clears the order's live row. Events with no matching cache are
+        skipped. Returns (status, error) per webhook id.
+        """
+        outcomes: Dict[str, Tuple[str, Optional[str]]] = {}
+        catalog = self._open_catalog_db() if (self.cache_dir / "catalog.db").exists() else None
+        has_orders = bool(self._load_order_meta()["synced_at"])
+        orders: List[Tuple[str, Dict]] = []
+        deleted: List[Tuple[str, int]] = []
+
+        try:
+            for event in events:
+                webhook_id = event["webhook_id"]
+                resource, _, action = event["topic"].partition("/")
+                try:
+                    payload = json.loads(event["body"])
+                    if resource == "orders" and action == "delete" and has_orders:
+                        deleted.append((webhook_id, int(payload["id"])))
+                        continue
+                    if resource == "orders" and has_orders:
+                        # Validate here so one bad payload cannot fail the whole batch
+                        date.fromisoformat(payload["created_at"][:10])
+                        order_version(payload)
+                        int(payload["id"])
+                        orders.append((webhook_id, payload))
+                        continue
+                    if resource == "products" and catalog is not None:
+                        applied = self._apply_product_webhook(catalog, action, payload)
+                    elif resource == "inventory_levels" and catalog is not None:
+                        applied = self._apply_inventory_webhook(catalog, action, payload)
+                    else:
+                        applied = False
+                    outcomes[webhook_id] = ("applied" if applied else "skipped", None)
+                except (ValueError, KeyError, TypeError, sqlite3.Error) as e:
+                    outcomes[webhook_id] = ("failed", str(e))
+
+            if catalog is not None:
+                catalog.commit()
+
+            if orders or deleted:
+                batch = [webhook_id for webhook_id, _ in orders + deleted]
+                try:
+                    with self._order_store_lock():
+                        meta = self._load_order_meta()
+                        self._store_orders(meta, (payload for _, payload in orders))
+                        # Kept past compaction, so a replayed older version stays dead
+                        meta["deleted"] = sorted(set(meta["deleted"]).union(order_id for _, order_id in deleted))
+                        self._commit_order_store(meta)
+                    outcomes.update((webhook_id, ("applied", None)) for webhook_id in batch)
+                except (ValueError, KeyError, TypeError, OSError) as e:
+                    outcomes.update((webhook_id, ("failed", str(e))) for webhook_id in batch)
+        finally:
+            if catalog is not None:
+                catalog.close()
+
+        return outcomes
+
+    def _drain_webhooks(self, events: WebhookQueue) -> Dict[str, int]:
+        """Apply every pending delivery, in batches; return counts per outcome"""
+        counts = {"applied": 0, "skipped": 0, "failed": 0}
+        while True:
+            batch = events.take(WEBHOOK_BATCH_SIZE)
+            if not batch:
+                return counts
+            outcomes = self._apply_webhooks(batch)
+            events.finish(outcomes)
+            for status, _ in outcomes.values():
+                counts[status] += 1
+
+    def serve_webhooks(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8787,
+        record_path: Optional[str] = None,
+        duration: Optional[float] = None
+    ) -> Dict:
+        """Receive Shopify webhooks and apply them to the local caches.
+
+        Each delivery's HMAC is verified, it is stored in the durable queue
+        (deduplicated by webhook id) and acknowledged at once; a worker loop
+        applies queued events in batches. Accepted deliveries can be appended
+        to record_path for replay_webhooks. Runs until interrupted, or for
+        duration seconds.
+        """
+        if not self.webhook_secret:
+            return {"error": "SHOPIFY_WEBHOOK_SECRET environment variable is required"}
+
+        events = WebhookQueue(self.cache_dir / WEBHOOK_QUEUE_NAME)
+        received = {"queued": 0, "duplicate": 0, "rejected": 0}
+        processed = {"applied": 0, "skipped": 0, "failed": 0}
+        lock = threading.Lock()
+        record = open(record_path, "a") if record_path else None
+
+        def receive(headers: Any, body: bytes) -> int:
+            outcome = self._receive_webhook(events, headers, body)
+            with lock:
+                received[outcome] += 1
+                if record and outcome == "queued":
+                    record.write(json.dumps({
+                        "topic": headers.get("X-Shopify-Topic"),
+                        "webhook_id": headers.get("X-Shopify-Webhook-Id"),
+                        "body": body.decode("utf-8", "replace")
+                    }) + "\n")
+                    record.flush()
+            print(json.dumps({
+                "event": "webhook",
+                "topic": headers.get("X-Shopify-Topic"),
+                "id": headers.get("X-Shopify-Webhook-Id"),
+                "outcome": outcome
+            }), file=sys.stderr, flush=True)
+            return 401 if outcome == "rejected" else 200
+
+        httpd = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+        httpd.daemon_threads = True
+        httpd.receive = receive
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+        started = time.monotonic()
+        try:
+            # Deliveries a previous run left in the queue are applied first
+            while True:
+                for status, count in self._drain_webhooks(events).items():
+                    processed[status] += count
+                remaining = None if duration is None else duration - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    break
+                events.ready.wait(WEBHOOK_POLL_INTERVAL if remaining is None else min(WEBHOOK_POLL_INTERVAL, remaining))
+                events.ready.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            for status, count in self._drain_webhooks(events).items():
+                processed[status] += count
+            queue_counts = events.counts()
+            events.close()
+            if record:
+                record.close()
+
+        return {
+            "address": f"http://{host}:{port}",
+            "received": received,
+            "processed": processed,
+            "queue": queue_counts,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    def replay_webhooks(self, path: str, url: Optional[str] = None) -> Dict:
+        """Replay recorded deliveries ({"topic", "body", "webhook_id"} NDJSON).
+
+        Each body is signed like Shopify would. With url they are POSTed to a
+        running serve_webhooks; otherwise they go through the same
+        verification and queue locally and are applied before returning.
+        """
+        if not self.webhook_secret:
+            return {"error": "SHOPIFY_WEBHOOK_SECRET environment variable is required"}
+        if not Path(path).exists():
+            return {"error": f"File not found: {path}"}
+
+        events = None if url else WebhookQueue(self.cache_dir / WEBHOOK_QUEUE_NAME)
+        received = {"queued": 0, "duplicate": 0, "rejected": 0}
+        try:
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    body = entry["body"] if isinstance(entry["body"], str) else json.dumps(entry["body"])
+                    body = body.encode()
+                    headers = {
+                        "Content-Type": "application/json",
+                        "X-Shopify-Topic": entry["topic"],
+                        # Unrecorded ids are derived from the content, so replays stay idempotent
+                        "X-Shopify-Webhook-Id": entry.get("webhook_id") or hashlib.sha256(entry["topic"].encode() + body).hexdigest(),
+                        "X-Shopify-Shop-Domain": f"{self.shop_domain}.myshopify.com",
+                        "X-Shopify-Hmac-Sha256": self._webhook_signature(body)
+                    }
+                    if url:
+                        response = requests.post(url, data=body, headers=headers, timeout=30)
+                        received["queued" if response.status_code == 200 else "rejected"] += 1
+                    else:
+                        received[self._receive_webhook(events, headers, body)] += 1
+
+            if events is None:
+                return {"received": received}
+            return {"received": received, "processed": self._drain_webhooks(events), "queue": events.counts()}
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "received": received}
+        finally:
+            if events is not None:
+                events.close()
+
+    def process_webhooks(self, retry_failed: bool = False) -> Dict:
+        """Apply queued deliveries now, optionally retrying failed ones"""
+        events = WebhookQueue(self.cache_dir / WEBHOOK_QUEUE_NAME)
+        try:
+            requeued = events.requeue_failed() if retry_failed else 0
+            return {"requeued": requeued, "processed": self._drain_webhooks(events), "queue": events.counts()}
+        finally:
+            events.close()
+
     # Webhook Management
     def list_webhooks(self) -> List[Dict]:
         """List webhooks"""
@@ -307,38 +2024,235 @@ class ShopifyAppMCPServer:
         return {"success": True, "message": f"Webhook {webhook_id} deleted"}
 
     # GraphQL Queries
-    def graphql_query(self, query: str, variables: Optional[Dict] = None) -> Dict:
-        """Execute a custom GraphQL query"""
-        return self._graphql(query, variables)
+    def graphql_query(
+        self,
+        query: str,
+        variables: Optional[Dict] = None,
+        paginate: bool = False,
+        path: Any = None,
+        max_items: Optional[int] = None
+    ) -> Union[Dict, Iterator[Dict]]:
+        """Execute a custom GraphQL query.
+
+        With paginate, the query's connection (found automatically, or at the
+        dotted path) must take after: $after; every page is followed and the
+        nodes returned as an iterator, with each page's cost reported as an
+        NDJSON event on stderr. Errors keep the query's cost extension.
+        """
+        if paginate:
+            if "$after" not in query:
+                return {"error": "paginate needs the connection to take after: $after"}
+            if isinstance(path, str):
+                path = path.split(".")
+
+            def report(page: Dict) -> None:
+                print(json.dumps({"event": "page", **page}), file=sys.stderr, flush=True)
+
+            return self._paginate_graphql(query, variables or {}, path, max_items, report)
+
+        try:
+            result = self._post_graphql(query, variables, estimate_selection_cost(query))
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        if "errors" in result:
+            error = {"error": result["errors"]}
+            cost = result.get("extensions", {}).get("cost")
+            if cost:
+                error["cost"] = cost
+            return error
+
+        return result.get("data", {})
+
+    def get_metafields(
+        self,
+        owner: str = "shop",
+        owner_id: Any = None,
+        namespace: Optional[str] = None,
+        limit: int = 50,
+        all_pages: bool = False,
+        max_items: Optional[int] = None
+    ) -> Iterable[Dict]:
+        """Get metafields of the shop, a product or a variant.
+
+        With all_pages, returns an iterator over every metafield (up to
+        max_items), following the connection's cursors.
+        """
+        if owner not in METAFIELD_OWNERS:
+            return {"error": f"owner must be one of {', '.join(METAFIELD_OWNERS)}"}
+        root, typename = METAFIELD_OWNERS[owner]
+        if typename and owner_id is None:
+            return {"error": f"owner_id is required for {owner} metafields"}
+
+        query = f"""
+        query($first: Int!, $after: String, $namespace: String{", $id: ID!" if typename else ""}) {{
+          {root}{"(id: $id)" if typename else ""} {{
+            metafields(first: $first, after: $after, namespace: $namespace) {{
+              pageInfo {{ hasNextPage endCursor }}
+              nodes {{
+                id
+                namespace
+                key
+                value
+                type
+                createdAt
+                updatedAt
+              }}
+            }}
+          }}
+        }}
+        """
+        variables = {"namespace": namespace}
+        if typename:
+            variables["id"] = to_gid(typename, owner_id)
+        metafields = self._paginate_graphql(query, variables, [root, "metafields"], max_items if all_pages else limit)
 
-    def get_shop_metafields(self) -> List[Dict]:
+        if all_pages:
+            return metafields
+        try:
+            return list(metafields)
+        except RuntimeError as e:
+            return {"error": str(e)}
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+    def get_shop_metafields(self, namespace: Optional[str] = None, all_pages: bool = False, max_items: Optional[int] = None) -> Iterable[Dict]:
         """Get shop metafields using GraphQL"""
-        query = """
-        {
-          shop {
-            metafields(first: 50) {
-              edges {
-                node {
-                  id
-                  namespace
-                  key
-                  value
-                  type
-                  createdAt
-                  updatedAt
-                }
-              }
-            }
+        return self.get_metafields("shop", namespace=namespace, all_pages=all_pages, max_items=max_items)
+
+    def bulk_set_metafields(
+        self,
+        path: Optional[str] = None,
+        metafields: Optional[List[Dict]] = None,
+        results_path: Optional[str] = None,
+        resume: bool = False,
+        max_workers: int = METAFIELDS_MAX_WORKERS
+    ) -> Dict:
+        """Set metafields from CSV/NDJSON rows in batched metafieldsSet mutations.
+
+        Rows carry owner_id (a gid, or a REST id with owner "product" or
+        "variant"; owner "shop" needs no id), namespace, key, type and value.
+        Batches of METAFIELDS_SET_MAX run on up to max_workers threads, paced
+        by the shared cost bucket. Results and resume work as in
+        bulk_set_inventory.
+        """
+        if path is None and metafields is None:
+            return {"error": "path or metafields is required"}
+        if path is not None and not Path(path).exists():
+            return {"error": f"File not found: {path}"}
+        if results_path is None and path is not None:
+            results_path = f"{path}.results.ndjson"
+
+        mutation = """
+        mutation($metafields: [MetafieldsSetInput!]!) {
+          metafieldsSet(metafields: $metafields) {
+            metafields { id }
+            userErrors { field message code }
           }
         }
         """
-        result = self._graphql(query)
-
-        if "error" in result:
-            return result
-
-        edges = result.get("shop", {}).get("metafields", {}).get("edges", [])
-        return [edge["node"] for edge in edges]
+        done = self._completed_rows(results_path) if resume else set()
+        summary = {"applied": 0, "failed": 0, "skipped": 0, "batches": 0}
+        results: List[Dict] = []
+        failures: List[Dict] = []
+        out = self._open_results(results_path, resume)
+        rows_by_number: Dict[int, Dict] = {}
+        shop_gid: List[str] = []
+
+        def record(number: int, row: Optional[Dict], error: Optional[str]) -> None:
+            entry = {"row": number, "status": "failed" if error else "ok"}
+            if row:
+                entry.update({key: row.get(key) for key in ("owner_id", "namespace", "key")})
+            if error:
+                entry["error"] = error
+                summary["failed"] += 1
+                if len(failures) < 50:
+                    failures.append(entry)
+            else:
+                summary["applied"] += 1
+            if out:
+                out.write(json.dumps(entry) + "\n")
+            else:
+                results.append(entry)
+
+        def owner_gid(row: Dict) -> str:
+            owner = row.get("owner") or ("shop" if not row.get("owner_id") else None)
+            if owner == "shop":
+                if not shop_gid:
+                    result = self._graphql("{ shop { id } }")
+                    if "error" in result:
+                        raise ValueError(json.dumps(result["error"]))
+                    shop_gid.append(result["shop"]["id"])
+                return shop_gid[0]
+            owner_id = str(row["owner_id"])
+            if owner_id.startswith("gid://"):
+                return owner_id
+            if owner not in METAFIELD_OWNERS:
+                raise ValueError("REST owner_id needs owner product or variant")
+            return to_gid(METAFIELD_OWNERS[owner][1], owner_id)
+
+        def collect(future: Future) -> None:
+            for number, error in future.result().items():
+                record(number, rows_by_number.pop(number), error)
+            if out:
+                out.flush()
+
+        pending: List[Future] = []
+        batch: List[Tuple[int, Dict]] = []
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                def submit(batch: List[Tuple[int, Dict]]) -> None:
+                    summary["batches"] += 1
+                    pending.append(pool.submit(
+                        self._set_batch, mutation, "metafieldsSet", "metafields",
+                        lambda items: {"metafields": items}, batch, METAFIELDS_MUTATION_COST
+                    ))
+                    # Keep a bounded number of batches in flight
+                    while len(pending) > max_workers * 2:
+                        collect(pending.pop(0))
+
+                for number, row in self._read_rows(path, metafields):
+                    if number in done:
+                        summary["skipped"] += 1
+                        continue
+                    if row is None:
+                        record(number, None, "Row is not a JSON object")
+                        continue
+                    try:
+                        value = row["value"]
+                        metafield = {
+                            "ownerId": owner_gid(row),
+                            "namespace": row["namespace"],
+                            "key": row["key"],
+                            "type": row["type"],
+                            "value": value if isinstance(value, str) else json.dumps(value)
+                        }
+                    except KeyError as e:
+                        record(number, row, f"Row is missing {e}")
+                        continue
+                    except ValueError as e:
+                        record(number, row, str(e))
+                        continue
+
+                    batch.append((number, metafield))
+                    rows_by_number[number] = row
+                    if len(batch) >= METAFIELDS_SET_MAX:
+                        submit(batch)
+                        batch = []
+                if batch:
+                    submit(batch)
+                while pending:
+                    collect(pending.pop(0))
+        finally:
+            if out:
+                out.close()
+
+        summary["failures"] = failures
+        if results_path:
+            summary["results_path"] = results_path
+        else:
+            summary["results"] = results
+        return summary
 
     def get_app_installations(self) -> List[Dict]:
         """Get app installations using GraphQL"""
@@ -367,30 +2281,562 @@ class ShopifyAppMCPServer:
         return result.get("currentAppInstallation", {})
 
     # Analytics
-    def get_shop_analytics(self, start_date: str, end_date: str) -> Dict:
-        """Get shop analytics for a date range"""
-        # This would typically use the Analytics API or Reports API
-        # For now, using orders as a proxy for analytics
-        endpoint = f"orders.json?created_at_min={start_date}&created_at_max={end_date}&status=any&limit=250"
-        result = self._request("GET", endpoint)
-
-        if "error" in result:
-            return result
+    def get_shop_analytics(self, start_date: str, end_date: str, method: str = "auto", timeout: float = 600) -> Dict:
+        """Get shop analytics for a date range.
+
+        Orders are used as a proxy for analytics. method "bulk" exports them
+        through a bulk operation; "rest" pages through orders.json. "auto"
+        uses REST for ranges up to ANALYTICS_REST_MAX_DAYS and bulk beyond.
+        Both aggregate while streaming, so memory does not grow with the range,
+        and read the range the same way (see _order_window). A bulk export
+        that cannot start because another bulk query is running falls back
+        to REST. "local" answers from the store kept by sync_orders.
+        """
+        if method == "auto":
+            try:
+                days = (datetime.fromisoformat(end_date.replace("Z", "+00:00")) -
+                        datetime.fromisoformat(start_date.replace("Z", "+00:00"))).days
+                method = "rest" if days <= ANALYTICS_REST_MAX_DAYS else "bulk"
+            except (TypeError, ValueError):
+                method = "bulk"
 
-        orders = result.get("orders", [])
+        try:
+            if method == "local":
+                totals = self._order_totals_local(start_date, end_date)
+            elif method == "rest":
+                totals = self._order_totals_rest(*self._order_window(start_date, end_date))
+            else:
+                window = self._order_window(start_date, end_date)
+                totals = self._order_totals_bulk(*window, timeout)
+                if totals.get("code") == "OPERATION_IN_PROGRESS":
+                    method = "rest"
+                    totals = self._order_totals_rest(*window)
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+        except ValueError as e:
+            return {"error": str(e)}
 
-        total_sales = sum(float(o.get("total_price", 0)) for o in orders)
-        total_orders = len(orders)
-        total_items = sum(len(o.get("line_items", [])) for o in orders)
+        if "error" in totals:
+            return totals
 
+        total_orders, total_sales = totals["orders"], totals["sales"]
         return {
             "period": {"start": start_date, "end": end_date},
             "total_orders": total_orders,
             "total_sales": total_sales,
-            "total_items": total_items,
-            "average_order_value": total_sales / total_orders if total_orders > 0 else 0
+            "total_items": totals["items"],
+            "average_order_value": total_sales / total_orders if total_orders > 0 else 0,
+            "source": method
         }
 
+    def _shop_timezone(self) -> ZoneInfo:
+        """The shop's IANA timezone; raises ValueError if it cannot be read"""
+        if self._shop_tz is None:
+            result = self._request("GET", "shop.json?fields=iana_timezone")
+            if "error" in result:
+                raise ValueError(f"Could not read the shop timezone: {result['error']}")
+            self._shop_tz = ZoneInfo(result["shop"]["iana_timezone"])
+        return self._shop_tz
+
+    def _order_window(self, start_date: str, end_date: str) -> Tuple[str, str]:
+        """Resolve a date range to the first and last second it includes.
+
+        Bare dates are whole days in the shop's timezone, end day included,
+        like the day buckets of the local order store. Timestamps are used
+        as given, and read in the shop's timezone when they have no offset.
+        Order timestamps have second precision, so both bounds are inclusive.
+        """
+        tz = self._shop_timezone()
+
+        def parse(value: str, last: bool) -> str:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if last and len(value) == 10:
+                moment += timedelta(days=1, seconds=-1)
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=tz)
+            return moment.replace(microsecond=0).isoformat()
+
+        return parse(start_date, False), parse(end_date, True)
+
+    def _order_totals_local(self, start_date: str, end_date: str) -> Dict[str, Any]:
+        """Sum orders, sales and line items from the local order store"""
+        with self._order_store_lock(shared=True):
+            meta = self._load_order_meta()
+            if not meta["synced_at"]:
+                return {"error": "No local orders; run sync_orders first"}
+
+            groups = self._aggregate_orders(
+                meta,
+                date.fromisoformat(start_date[:10]).toordinal(),
+                date.fromisoformat(end_date[:10]).toordinal(),
+                None
+            )
+        if not groups:
+            return {"orders": 0, "sales": 0.0, "items": 0}
+        return groups[0]
+
+    def _order_totals_rest(self, first: str, last: str) -> Dict[str, Any]:
+        """Sum orders, sales and line items over every REST page of the window"""
+        params = {
+            "created_at_min": first,
+            "created_at_max": last,
+            "status": "any",
+            "limit": MAX_PAGE_SIZE,
+            "fields": "id,total_price,line_items"
+        }
+        totals = {"orders": 0, "sales": 0.0, "items": 0}
+        for order in self._paginate("orders.json", "orders", params):
+            totals["orders"] += 1
+            totals["sales"] += float(order.get("total_price", 0))
+            totals["items"] += len(order.get("line_items", []))
+        return totals
+
+    def _order_totals_bulk(self, first: str, last: str, timeout: float) -> Dict[str, Any]:
+        """Sum orders, sales and line items from a bulk export of the window"""
+        search = f"created_at:>='{first}' created_at:<='{last}'"
+        query = """
+        {
+          orders(query: %s) {
+            edges {
+              node {
+                id
+                totalPriceSet { shopMoney { amount } }
+                lineItems { edges { node { id } } }
+              }
+            }
+          }
+        }
+        """ % json.dumps(search)
+
+        operation = self._run_bulk_query(query)
+        if "error" in operation:
+            return operation
+        operation = self._wait_bulk_operation(operation["id"], timeout)
+        if "error" in operation:
+            return operation
+        if operation.get("status") != "COMPLETED":
+            return {"error": f"Bulk operation {operation.get('status')}: {operation.get('errorCode')}", "id": operation.get("id")}
+
+        # Line items come out as their own lines, pointing at the order via __parentId
+        totals = {"orders": 0, "sales": 0.0, "items": 0}
+        for record in self._iter_bulk_results(operation.get("url")):
+            if "__parentId" in record:
+                totals["items"] += 1
+            else:
+                totals["orders"] += 1
+                totals["sales"] += float(record["totalPriceSet"]["shopMoney"]["amount"])
+        return totals
+
+    # Local Order Store
+    def _column_path(self, table: str, name: str) -> Path:
+        return self.cache_dir / "orders" / f"{table}.{name}.bin"
+
+    @contextmanager
+    def _order_store_lock(self, shared: bool = False) -> Iterator[None]:
+        """Hold a file lock on the order store across load-meta, store and commit.
+
+        sync_orders and the webhook worker (possibly in other processes) take
+        it exclusively; readers take it shared. Windows has no shared locks,
+        so there readers take it exclusively too.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+            import msvcrt
+
+        path = self.cache_dir / "orders" / ".lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as lock:
+            if fcntl is not None:
+                # Closing the file releases the lock
+                fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                yield
+                return
+
+            lock.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ten one-second retries
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load_order_meta(self, fresh: bool = False) -> Dict[str, Any]:
+        path = self.cache_dir / "orders" / "meta.json"
+        if path.exists() and not fresh:
+            meta = json.loads(path.read_text())
+            if meta.get("version") == ORDER_STORE_VERSION:
+                return meta
+        return {
+            "version": ORDER_STORE_VERSION,
+            "orders": 0,
+            "lines": 0,
+            "updated_at": None,
+            "synced_at": None,
+            "channels": [],
+            "vendors": [],
+            "products": {},
+            "deleted": []
+        }
+
+    def _open_column(self, table: str, name: str, rows: int):
+        """Memory-map a column: a numpy memmap, or a typed memoryview without numpy"""
+        typecode = (ORDER_COLUMNS if table == "orders" else LINE_COLUMNS)[name]
+        if rows == 0:
+            return np.zeros(0, dtype=typecode) if np is not None else array(typecode)
+        path = self._column_path(table, name)
+        if np is not None:
+            return np.memmap(path, dtype=typecode, mode="r", shape=(rows,))
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[:rows * array(typecode).itemsize].cast(typecode)
+
+    def _write_live_column(self, meta: Dict[str, Any]) -> int:
+        """Mark the latest stored version of each order live; return the live count.
+
+        The latest version is the row with the highest updated_at (the last
+        appended among equals), since webhooks can arrive out of order or be
+        replayed. Deleted orders have no live row.
+        """
+        rows = meta["orders"]
+        ids = self._open_column("orders", "id", rows)
+        updated = self._open_column("orders", "updated_at", rows)
+        if np is not None:
+            live = np.zeros(rows, dtype="b")
+            order = np.lexsort((np.arange(rows), updated, ids))
+            sorted_ids = np.asarray(ids)[order]
+            last = order[np.append(sorted_ids[1:] != sorted_ids[:-1], True)] if rows else order
+            last = last[~np.isin(np.asarray(ids)[last], meta["deleted"])]
+            live[last] = 1
+            live.tofile(self._column_path("orders", "live"))
+            return len(last)
+
+        latest: Dict[int, int] = {}
+        for row, (order_id, version) in enumerate(zip(ids, updated)):
+            if order_id not in latest or version >= updated[latest[order_id]]:
+                latest[order_id] = row
+        for order_id in meta["deleted"]:
+            latest.pop(order_id, None)
+        live = array("b", bytes(rows))
+        for row in latest.values():
+            live[row] = 1
+        with open(self._column_path("orders", "live"), "wb") as f:
+            live.tofile(f)
+        return len(latest)
+
+    def _compact_order_store(self, meta: Dict[str, Any]) -> None:
+        """Rewrite the columns without superseded order versions"""
+        live = self._open_column("orders", "live", meta["orders"])
+        order_row = self._open_column("lines", "order_row", meta["lines"])
+
+        if np is not None:
+            keep = np.asarray(live) == 1
+            new_row = np.cumsum(keep) - 1
+            keep_lines = keep[order_row]
+            tables = {"orders": (ORDER_COLUMNS, keep), "lines": (LINE_COLUMNS, keep_lines)}
+            columns = {
+                (table, name): np.array(self._open_column(table, name, meta[table])[mask])
+                for table, (names, mask) in tables.items() for name in names
+            }
+            columns["lines", "order_row"] = new_row[columns["lines", "order_row"]]
+            meta["orders"], meta["lines"] = int(keep.sum()), int(keep_lines.sum())
+            for (table, name), values in columns.items():
+                values.tofile(self._column_path(table, name))
+            return
+
+        new_row, kept = [], 0
+        for flag in live:
+            new_row.append(kept if flag else -1)
+            kept += flag
+        keep_lines = [new_row[row] >= 0 for row in order_row]
+        tables = {"orders": (ORDER_COLUMNS, [flag == 1 for flag in live]), "lines": (LINE_COLUMNS, keep_lines)}
+        columns = {
+            (table, name): array(typecode, (v for v, k in zip(self._open_column(table, name, meta[table]), mask) if k))
+            for table, (names, mask) in tables.items() for name, typecode in names.items()
+        }
+        columns["lines", "order_row"] = array("q", (new_row[row] for row in columns["lines", "order_row"]))
+        meta["orders"], meta["lines"] = kept, sum(keep_lines)
+        for (table, name), values in columns.items():
+            with open(self._column_path(table, name), "wb") as f:
+                values.tofile(f)
+
+    def _store_orders(self, meta: Dict[str, Any], orders: Iterator[Dict]) -> None:
+        """Append REST orders to the column files, a page at a time.
+
+        meta's row counts and dictionaries advance as rows are written;
+        _commit_order_store must follow to refresh the live column and save
+        meta. Errors from the orders iterator propagate after a final flush.
+        """
+        (self.cache_dir / "orders").mkdir(parents=True, exist_ok=True)
+
+        # Drop rows an interrupted run wrote past the last saved meta
+        for table, columns in (("orders", ORDER_COLUMNS), ("lines", LINE_COLUMNS)):
+            for name, typecode in columns.items():
+                path = self._column_path(table, name)
+                path.touch()
+                os.truncate(path, meta[table] * array(typecode).itemsize)
+
+        codes = {
+            kind: {value: code for code, value in enumerate(meta[kind])}
+            for kind in ("channels", "vendors")
+        }
+
+        def code(kind: str, value: Optional[str]) -> int:
+            value = value or ""
+            if value not in codes[kind]:
+                codes[kind][value] = len(meta[kind])
+                meta[kind].append(value)
+            return codes[kind][value]
+
+        columns = {name: array(typecode) for name, typecode in ORDER_COLUMNS.items()}
+        lines = {name: array(typecode) for name, typecode in LINE_COLUMNS.items()}
+
+        def flush() -> None:
+            meta["orders"] += len(columns["id"])
+            meta["lines"] += len(lines["order_row"])
+            for table, values_by_name in (("orders", columns), ("lines", lines)):
+                for name, values in values_by_name.items():
+                    with open(self._column_path(table, name), "ab") as f:
+                        values.tofile(f)
+                    del values[:]
+
+        try:
+            for order in orders:
+                row = meta["orders"] + len(columns["id"])
+                items = order.get("line_items", [])
+                columns["id"].append(order["id"])
+                columns["day"].append(date.fromisoformat(order["created_at"][:10]).toordinal())
+                columns["updated_at"].append(order_version(order))
+                columns["channel"].append(code("channels", order.get("source_name")))
+                columns["total_price"].append(float(order.get("total_price") or 0))
+                columns["items"].append(len(items))
+                columns["quantity"].append(sum(item.get("quantity", 0) for item in items))
+                columns["live"].append(1)
+                for item in items:
+                    product_id = item.get("product_id") or 0
+                    if product_id:
+                        meta["products"][str(product_id)] = item.get("title")
+                    lines["order_row"].append(row)
+                    lines["product_id"].append(product_id)
+                    lines["vendor"].append(code("vendors", item.get("vendor")))
+                    lines["quantity"].append(item.get("quantity", 0))
+                    lines["amount"].append(float(item.get("price") or 0) * item.get("quantity", 0))
+                if len(columns["id"]) >= MAX_PAGE_SIZE:
+                    flush()
+        finally:
+            flush()
+
+    def _commit_order_store(self, meta: Dict[str, Any]) -> int:
+        """Refresh the live column, compact if needed and save meta; return live orders"""
+        live = self._write_live_column(meta)
+        if meta["orders"] > 2 * live:
+            self._compact_order_store(meta)
+        (self.cache_dir / "orders" / "meta.json").write_text(json.dumps(meta))
+        return live
+
+    def sync_orders(self, full: bool = False) -> Dict:
+        """Refresh the local columnar order store.
+
+        Fetches orders updated since the last sync (every order with full)
+        and appends them; the live column marks each order's latest version.
+        The store is compacted once superseded rows outnumber live ones.
+        """
+        with self._order_store_lock():
+            meta = self._load_order_meta(fresh=full)
+
+            params = {
+                "status": "any",
+                "limit": MAX_PAGE_SIZE,
+                "fields": "id,created_at,updated_at,total_price,source_name,line_items"
+            }
+            if meta["updated_at"]:
+                params["updated_at_min"] = meta["updated_at"]
+
+            progress = {"fetched": 0, "newest": meta["updated_at"]}
+
+            def tracked(orders: Iterator[Dict]) -> Iterator[Dict]:
+                for order in orders:
+                    updated_at = order.get("updated_at")
+                    newest = progress["newest"]
+                    if updated_at and (newest is None or datetime.fromisoformat(updated_at) > datetime.fromisoformat(newest)):
+                        progress["newest"] = updated_at
+                    progress["fetched"] += 1
+                    yield order
+
+            try:
+                self._store_orders(meta, tracked(self._paginate("orders.json", "orders", params)))
+                # Only a complete pass may advance the watermark; rows from a
+                # partial one are kept and simply superseded by the retry
+                meta["updated_at"] = progress["newest"]
+            except requests.exceptions.RequestException as e:
+                error = {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+            else:
+                error = None
+            finally:
+                meta["synced_at"] = datetime.utcnow().isoformat() + "Z"
+                live = self._commit_order_store(meta)
+
+        if error:
+            return dict(error, fetched=progress["fetched"])
+
+        return {
+            "fetched": progress["fetched"],
+            "orders": live,
+            "stored_rows": meta["orders"],
+            "line_items": meta["lines"],
+            "updated_at": meta["updated_at"],
+            "synced_at": meta["synced_at"]
+        }
+
+    def _aggregate_orders(self, meta: Dict[str, Any], start_day: int, end_day: int, group_by: Optional[str]) -> List[Dict]:
+        """Total live orders created between two day ordinals, optionally per group"""
+        o = {name: self._open_column("orders", name, meta["orders"]) for name in ORDER_COLUMNS}
+        order_level = group_by in (None, "day", "channel")
+        line_key = "product_id" if group_by == "product" else "vendor"
+
+        if np is not None:
+            selected = (o["live"] == 1) & (o["day"] >= start_day) & (o["day"] <= end_day)
+            if order_level:
+                keys = o[group_by][selected] if group_by else np.zeros(int(selected.sum()), dtype="q")
+                groups, inverse = np.unique(keys, return_inverse=True)
+                n = len(groups)
+                orders = np.bincount(inverse, minlength=n)
+                sales = np.bincount(inverse, weights=o["total_price"][selected], minlength=n)
+                items = np.bincount(inverse, weights=o["items"][selected], minlength=n)
+                quantity = np.bincount(inverse, weights=o["quantity"][selected], minlength=n)
+            else:
+                order_row = self._open_column("lines", "order_row", meta["lines"])
+                line_selected = selected[order_row]
+                rows = np.asarray(order_row[line_selected])
+                groups, inverse = np.unique(self._open_column("lines", line_key, meta["lines"])[line_selected], return_inverse=True)
+                n = len(groups)
+                # An order counts once per group however many of its lines fall in it
+                pairs = np.unique(inverse.astype("q") * max(1, meta["orders"]) + rows)
+                orders = np.bincount(pairs // max(1, meta["orders"]), minlength=n)
+                sales = np.bincount(inverse, weights=self._open_column("lines", "amount", meta["lines"])[line_selected], minlength=n)
+                items = np.bincount(inverse, minlength=n)
+                quantity = np.bincount(inverse, weights=self._open_column("lines", "quantity", meta["lines"])[line_selected], minlength=n)
+            return [{
+                "key": key.item(),
+                "orders": int(orders[i]),
+                "sales": float(sales[i]),
+                "items": int(items[i]),
+                "quantity": int(quantity[i])
+            } for i, key in enumerate(groups)]
+
+        totals: Dict[Any, Dict] = {}
+        selected = [
+            live == 1 and start_day <= day <= end_day
+            for live, day in zip(o["live"], o["day"])
+        ]
+        if order_level:
+            keys = o[group_by] if group_by else [0] * len(selected)
+            for row, key in enumerate(keys):
+                if selected[row]:
+                    t = totals.setdefault(key, {"key": key, "orders": 0, "sales": 0.0, "items": 0, "quantity": 0})
+                    t["orders"] += 1
+                    t["sales"] += o["total_price"][row]
+                    t["items"] += o["items"][row]
+                    t["quantity"] += o["quantity"][row]
+        else:
+            seen = set()
+            columns = zip(
+                self._open_column("lines", "order_row", meta["lines"]),
+                self._open_column("lines", line_key, meta["lines"]),
+                self._open_column("lines", "amount", meta["lines"]),
+                self._open_column("lines", "quantity", meta["lines"])
+            )
+            for row, key, amount, quantity in columns:
+                if selected[row]:
+                    t = totals.setdefault(key, {"key": key, "orders": 0, "sales": 0.0, "items": 0, "quantity": 0})
+                    if (key, row) not in seen:
+                        seen.add((key, row))
+                        t["orders"] += 1
+                    t["sales"] += amount
+                    t["items"] += 1
+                    t["quantity"] += quantity
+        return [totals[key] for key in sorted(totals)]
+
+    def order_analytics(self, start_date: str, end_date: str, group_by: str = "day", limit: Optional[int] = None) -> Dict:
+        """Aggregate the local order store by day, channel, product or vendor.
+
+        Days are inclusive and taken from each order's local created_at
+        date. Groups other than day are sorted by sales, highest first.
+        """
+        if group_by not in ORDER_GROUPS:
+            return {"error": f"group_by must be one of {', '.join(ORDER_GROUPS)}"}
+
+        with self._order_store_lock(shared=True):
+            meta = self._load_order_meta()
+            if not meta["synced_at"]:
+                return {"error": "No local orders; run sync_orders first"}
+
+            groups = self._aggregate_orders(
+                meta,
+                date.fromisoformat(start_date[:10]).toordinal(),
+                date.fromisoformat(end_date[:10]).toordinal(),
+                group_by
+            )
+        if group_by != "day":
+            groups.sort(key=lambda g: g["sales"], reverse=True)
+        if limit:
+            groups = groups[:limit]
+
+        results = []
+        for g in groups:
+            entry = {
+                "total_orders": g["orders"],
+                "total_sales": g["sales"],
+                "total_items": g["items"],
+                "total_quantity": g["quantity"],
+                "average_order_value": g["sales"] / g["orders"] if g["orders"] > 0 else 0
+            }
+            if group_by == "day":
+                entry = {"day": date.fromordinal(g["key"]).isoformat(), **entry}
+            elif group_by == "channel":
+                entry = {"channel": meta["channels"][g["key"]], **entry}
+            elif group_by == "vendor":
+                entry = {"vendor": meta["vendors"][g["key"]], **entry}
+            else:
+                entry = {"product_id": g["key"] or None, "title": meta["products"].get(str(g["key"])), **entry}
+            results.append(entry)
+
+        return {
+            "period": {"start": start_date, "end": end_date},
+            "group_by": group_by,
+            "synced_at": meta["synced_at"],
+            "groups": results
+        }
+
+
+def emit(result: Dict[str, Any]) -> None:
+    """Print a command result; streamed data goes out as NDJSON.
+
+    Each record is one line, followed by a summary line with the count (or
+    the error that ended the stream).
+    """
+    data = result.get("data")
+    if not isinstance(data, Iterator):
+        print(json.dumps(result, indent=2))
+        return
+
+    count = 0
+    try:
+        for record in data:
+            sys.stdout.write(json.dumps(record) + "\n")
+            count += 1
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e), "count": count}))
+        sys.exit(1)
+    print(json.dumps({"success": True, "count": count}))
+
 
 def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """Handle MCP commands"""
@@ -401,14 +2847,19 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             "success": True,
             "data": server.list_products(
                 params.get("limit", 50),
-                params.get("status", "active")
+                params.get("status", "active"),
+                params.get("all_pages", False),
+                params.get("max_items")
             )
         }
 
     elif command == "get_product":
         return {
             "success": True,
-            "data": server.get_product(params["product_id"])
+            "data": server.get_product(
+                params["product_id"],
+                params.get("fields")
+            )
         }
 
     elif command == "create_product":
@@ -431,33 +2882,56 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             )
         }
 
+    elif command == "bulk_upsert_products":
+        return {
+            "success": True,
+            "data": server.bulk_upsert_products(
+                params.get("path"),
+                params.get("products"),
+                params.get("results_path"),
+                params.get("timeout", BULK_UPSERT_TIMEOUT)
+            )
+        }
+
     # Order commands
     elif command == "list_orders":
         return {
             "success": True,
             "data": server.list_orders(
                 params.get("limit", 50),
-                params.get("status", "any")
+                params.get("status", "any"),
+                params.get("all_pages", False),
+                params.get("max_items")
             )
         }
 
     elif command == "get_order":
         return {
             "success": True,
-            "data": server.get_order(params["order_id"])
+            "data": server.get_order(
+                params["order_id"],
+                params.get("fields")
+            )
         }
 
     # Customer commands
     elif command == "list_customers":
         return {
             "success": True,
-            "data": server.list_customers(params.get("limit", 50))
+            "data": server.list_customers(
+                params.get("limit", 50),
+                params.get("all_pages", False),
+                params.get("max_items")
+            )
         }
 
     elif command == "get_customer":
         return {
             "success": True,
-            "data": server.get_customer(params["customer_id"])
+            "data": server.get_customer(
+                params["customer_id"],
+                params.get("fields")
+            )
         }
 
     # Inventory commands
@@ -480,6 +2954,20 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             )
         }
 
+    elif command == "bulk_set_inventory":
+        return {
+            "success": True,
+            "data": server.bulk_set_inventory(
+                params.get("path"),
+                params.get("rows"),
+                params.get("results_path"),
+                params.get("resume", False),
+                params.get("name", "available"),
+                params.get("reason", "correction"),
+                params.get("batch_size", INVENTORY_BATCH_SIZE)
+            )
+        }
+
     # Collection commands
     elif command == "list_collections":
         return {
@@ -487,6 +2975,36 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             "data": server.list_collections(params.get("limit", 50))
         }
 
+    elif command == "sync_catalog":
+        return {
+            "success": True,
+            "data": server.sync_catalog(params.get("full", False))
+        }
+
+    elif command == "find_products":
+        return {
+            "success": True,
+            "data": server.find_products(
+                params.get("handle"),
+                params.get("sku"),
+                params.get("vendor"),
+                params.get("tag"),
+                params.get("collection"),
+                params.get("product_type"),
+                params.get("limit", 50)
+            )
+        }
+
+    elif command == "find_collections":
+        return {
+            "success": True,
+            "data": server.find_collections(
+                params.get("handle"),
+                params.get("product_id"),
+                params.get("limit", 50)
+            )
+        }
+
     # Webhook commands
     elif command == "list_webhooks":
         return {
@@ -510,20 +3028,78 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             "data": server.delete_webhook(params["webhook_id"])
         }
 
+    elif command == "serve_webhooks":
+        return {
+            "success": True,
+            "data": server.serve_webhooks(
+                params.get("host", "127.0.0.1"),
+                params.get("port", 8787),
+                params.get("record_path"),
+                params.get("duration")
+            )
+        }
+
+    elif command == "replay_webhooks":
+        return {
+            "success": True,
+            "data": server.replay_webhooks(
+                params["path"],
+                params.get("url")
+            )
+        }
+
+    elif command == "process_webhooks":
+        return {
+            "success": True,
+            "data": server.process_webhooks(params.get("retry_failed", False))
+        }
+
     # GraphQL commands
     elif command == "graphql_query":
         return {
             "success": True,
             "data": server.graphql_query(
                 params["query"],
-                params.get("variables")
+                params.get("variables"),
+                params.get("paginate", False),
+                params.get("path"),
+                params.get("max_items")
             )
         }
 
     elif command == "get_shop_metafields":
         return {
             "success": True,
-            "data": server.get_shop_metafields()
+            "data": server.get_shop_metafields(
+                params.get("namespace"),
+                params.get("all_pages", False),
+                params.get("max_items")
+            )
+        }
+
+    elif command == "get_metafields":
+        return {
+            "success": True,
+            "data": server.get_metafields(
+                params.get("owner", "shop"),
+                params.get("owner_id"),
+                params.get("namespace"),
+                params.get("limit", 50),
+                params.get("all_pages", False),
+                params.get("max_items")
+            )
+        }
+
+    elif command == "bulk_set_metafields":
+        return {
+            "success": True,
+            "data": server.bulk_set_metafields(
+                params.get("path"),
+                params.get("metafields"),
+                params.get("results_path"),
+                params.get("resume", False),
+                params.get("max_workers", METAFIELDS_MAX_WORKERS)
+            )
         }
 
     elif command == "get_app_installations":
@@ -538,7 +3114,45 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
             "success": True,
             "data": server.get_shop_analytics(
                 params["start_date"],
-                params["end_date"]
+                params["end_date"],
+                params.get("method", "auto"),
+                params.get("timeout", 600)
+            )
+        }
+
+    elif command == "batch":
+        # Sub-commands run concurrently, so their id lookups share node queries
+        commands = params["commands"]
+
+        def run(entry: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                result = handle_command(server, entry["command"], entry.get("params", {}))
+                if isinstance(result.get("data"), Iterator):
+                    result["data"] = list(result["data"])
+                return result
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_MAX_WORKERS, len(commands)))) as pool:
+            return {
+                "success": True,
+                "data": list(pool.map(run, commands))
+            }
+
+    elif command == "sync_orders":
+        return {
+            "success": True,
+            "data": server.sync_orders(params.get("full", False))
+        }
+
+    elif command == "order_analytics":
+        return {
+            "success": True,
+            "data": server.order_analytics(
+                params["start_date"],
+                params["end_date"],
+                params.get("group_by", "day"),
+                params.get("limit")
             )
         }
 
@@ -552,7 +3166,7 @@ def handle_command(server: ShopifyAppMCPServer, command: str, params: Dict[str,
 def main():
     """Main entry point for MCP server"""
     try:
-        server = ShopifyAppMCPServer()
+        stores = StoreRegistry(ShopifyAppMCPServer)
 
         # Read command from stdin
         if len(sys.argv) > 1:
@@ -563,8 +3177,8 @@ def main():
         command = input_data.get("command")
         params = input_data.get("params", {})
 
-        result = handle_command(server, command, params)
-        print(json.dumps(result, indent=2))
+        result = dispatch(stores, command, params, handle_command, FAN_OUT_COMMANDS)
+        emit(result)
 
     except Exception as e:
         error_result = {
@@ -5,44 +5,411 @@ Provides Shopify Admin API integration for theme development and management.
 """
 
 import os
+import re
 import json
 import sys
-from typing import Any, Dict, List, Optional
+import time
+import base64
+import difflib
+import fnmatch
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 import requests
 from datetime import datetime
+from pathlib import Path
+
+from shopify_common import ShopifyClient, StoreRegistry, dispatch
+
+# Optional: inotify/FSEvents-backed file watching for watch_theme (pip install watchdog)
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Optional: full CSS/JS minifiers for push_theme optimize (pip install rcssmin rjsmin)
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# Local theme mirrors keep their sync state next to the files
+MANIFEST_NAME = ".shopify-manifest.json"
+
+# Theme folders in upload order: dependencies (snippets) before the
+# sections that render them, and sections before the templates using them
+THEME_FOLDERS = ["assets", "locales", "snippets", "blocks", "sections", "templates", "layout", "config"]
+
+# Assets uploaded as text `value`; everything else goes up as a base64 `attachment`
+TEXT_EXTENSIONS = {".liquid", ".json", ".css", ".js", ".scss", ".svg", ".txt", ".md", ".html"}
+
+
+# Streamed asset transfers work in multiples of 3 raw bytes (4 base64 chars)
+STREAM_CHUNK_SIZE = 3 * 64 * 1024
+ATTACHMENT_MARKER = re.compile(rb'"attachment"\s*:\s*"')
+
+
+# Deep validation: bump when analyze_theme_file output changes so cached results are discarded
+ANALYZER_VERSION = 2
+VALIDATION_CACHE_NAME = ".shopify-validation-cache.json"
+LIQUID_RENDER = re.compile(r"{%-?\s*(?:render|include)\s+['\"]([^'\"]+)['\"]")
+LIQUID_SECTION = re.compile(r"{%-?\s*section\s+['\"]([^'\"]+)['\"]")
+LIQUID_SECTIONS_GROUP = re.compile(r"{%-?\s*sections\s+['\"]([^'\"]+)['\"]")
+LIQUID_TAG = re.compile(r"{%-?\s*(\w+)")
+LIQUID_SCHEMA = re.compile(r"{%-?\s*schema\s*-?%}(.*?){%-?\s*endschema\s*-?%}", re.S)
+LIQUID_RAW = re.compile(r"{%-?\s*(raw|comment)\s*-?%}.*?{%-?\s*end\1\s*-?%}", re.S)
+LIQUID_BLOCK_TAGS = {
+    "if", "unless", "case", "for", "tablerow", "capture", "form", "paginate",
+    "schema", "javascript", "stylesheet", "style"
+}
+JSON_COMMENT = re.compile(r"^\s*/\*.*?\*/", re.S)
+
+# Below this many files, parsing inline beats starting a process pool
+PROCESS_POOL_MIN_FILES = 32
+
+# Push-time asset optimization: bump when optimize_asset output changes
+OPTIMIZER_VERSION = 1
+OPTIMIZABLE_EXTENSIONS = {".css", ".js", ".svg"}
+SVG_TEXT_CONTENT = re.compile(r"<(?:text|tspan|textPath)\b|xml:space")
+
+# Theme search keeps a trigram index next to the mirror
+SEARCH_INDEX_NAME = ".shopify-search-index.db"
+REGEX_QUANTIFIERS = "*?{"
+REGEX_METACHARS = ".^$[]()|+*?{}"
+REGEX_INLINE_FLAGS = re.compile(r"\(\?[aiLmsux-]+[:)]")
+ESCAPE_ARGUMENT_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+# Commands that may run against several stores at once (see shopify_common.dispatch)
+FAN_OUT_COMMANDS = {"list_themes", "get_shop_info"}
+
+
+def minify_css(text: str) -> str:
+    """Conservative CSS minifier: drops comments and whitespace that cannot matter.
+
+    Strings and /*! license */ comments are kept, and spaces around + and -
+    are left alone because calc() needs them.
+    """
+    out = []
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char in "\"'":
+            j = i + 1
+            while j < n and text[j] != char:
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif text.startswith("/*", i):
+            j = text.find("*/", i + 2)
+            j = n if j == -1 else j + 2
+            if text.startswith("/*!", i):
+                out.append(text[i:j])
+            i = j
+        elif char.isspace():
+            j = i
+            while j < n and text[j].isspace():
+                j += 1
+            prev = out[-1][-1] if out else ""
+            following = text[j] if j < n else ""
+            if prev and following and prev not in " {};,>:" and following not in "{};,>":
+                out.append(" ")
+            i = j
+        else:
+            if char == "}" and out and out[-1] == ";":
+                out.pop()
+            out.append(char)
+            i += 1
+    return "".join(out)
 
 
-class ShopifyMCPServer:
-    """MCP Server for Shopify Admin API integration"""
+def minify_js(text: str) -> str:
+    """Minify JavaScript with rjsmin when installed, else only drop blank lines and indentation.
 
-    def __init__(self):
-        self.token = os.getenv("SHOPIFY_ADMIN_TOKEN")
-        self.shop_domain = os.getenv("SHOP_DOMAIN")
+    The fallback leaves files with template literals untouched, since their
+    whitespace is significant.
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    if "`" in text:
+        return text
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
 
-        if not self.token:
-            raise ValueError("SHOPIFY_ADMIN_TOKEN environment variable is required")
-        if not self.shop_domain:
-            raise ValueError("SHOP_DOMAIN environment variable is required")
 
-        self.base_url = f"https://{self.shop_domain}.myshopify.com/admin/api/2024-10"
-        self.headers = {
-            "X-Shopify-Access-Token": self.token,
-            "Content-Type": "application/json"
-        }
+def minify_svg(text: str) -> str:
+    """Strip comments, metadata and inter-tag whitespace from an SVG"""
+    text = re.sub(r"<!--.*?-->", "", text, flags=re.S)
+    text = re.sub(r"<metadata\b.*?</metadata>", "", text, flags=re.S)
+    if not SVG_TEXT_CONTENT.search(text):
+        text = re.sub(r">\s+<", "><", text)
+    return text.strip()
 
-    def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
-        """Make a request to Shopify Admin API"""
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
 
+def optimize_asset(key: str, content: bytes) -> bytes:
+    """Return the optimized form of an asset, or the original if nothing was gained.
+
+    Runs in worker processes, so it only depends on its arguments.
+    """
+    try:
+        text = content.decode("utf-8")
+    except UnicodeDecodeError:
+        return content
+
+    suffix = Path(key).suffix
+    if suffix == ".css":
+        optimized = rcssmin.cssmin(text) if rcssmin is not None else minify_css(text)
+    elif suffix == ".js":
+        optimized = minify_js(text)
+    elif suffix == ".svg":
+        optimized = minify_svg(text)
+    else:
+        return content
+
+    result = optimized.encode("utf-8")
+    return result if len(result) < len(content) else content
+
+
+def minifier_backend(suffix: str) -> str:
+    """Name and version of the minifier optimize_asset uses for a file extension"""
+    module = {".css": rcssmin, ".js": rjsmin}.get(suffix)
+    if module is None:
+        return "builtin"
+    return f"{module.__name__}-{getattr(module, '__version__', 'unknown')}"
+
+
+def required_literals(pattern: str) -> List[str]:
+    """Literal runs that every match of a regex must contain, for index prefiltering.
+
+    Conservative: groups and classes end a run, and top-level alternation
+    means nothing is guaranteed.
+    """
+    if REGEX_INLINE_FLAGS.search(pattern):
+        # (?x) makes whitespace and # comments insignificant, and other
+        # inline flags change what a literal run can match
+        return []
+
+    runs = []
+    current = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if not escaped.isalnum():
+                if depth == 0:
+                    current += escaped
+                continue
+            # Classes (\d, \b...) and escapes with an argument (\x41, \u0041,
+            # \N{...}, octal \101, backreference \1) end the run; the argument
+            # must not be read as literal text
+            if escaped in ESCAPE_ARGUMENT_LENGTHS:
+                i += ESCAPE_ARGUMENT_LENGTHS[escaped]
+            elif escaped == "N" and pattern[i:i + 1] == "{":
+                i = pattern.find("}", i) + 1 or len(pattern)
+            elif escaped.isdigit():
+                while i < len(pattern) and pattern[i].isdigit():
+                    i += 1
+            if depth == 0:
+                runs.append(current)
+                current = ""
+            continue
+        if char == "[" and depth == 0:
+            # Skip the class, including a leading ] or escaped characters
+            j = i + 2 if pattern[i + 1:i + 2] == "]" else i + 1
+            while j < len(pattern) and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            runs.append(current)
+            current = ""
+            i = j + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return []
+        elif depth == 0:
+            if char in REGEX_QUANTIFIERS:
+                # The preceding character is optional or repeated
+                current = current[:-1]
+                runs.append(current)
+                current = ""
+                if char == "{":
+                    i = pattern.find("}", i) if "}" in pattern[i:] else len(pattern)
+            elif char in REGEX_METACHARS:
+                runs.append(current)
+                current = ""
+            else:
+                current += char
+        if depth > 0 and current:
+            runs.append(current)
+            current = ""
+        i += 1
+    runs.append(current)
+    return [run for run in runs if len(run) >= 3]
+
+
+def analyze_theme_file(key: str, text: str) -> Dict:
+    """Parse one theme file and return the asset keys it references plus any errors.
+
+    Runs in worker processes, so it only depends on its arguments.
+    """
+    refs = set()
+    errors = []
+    info = {}
+
+    if key.endswith(".liquid"):
+        stripped = LIQUID_RAW.sub("", text)
+        refs.update(f"snippets/{name}.liquid" for name in LIQUID_RENDER.findall(stripped))
+        refs.update(f"sections/{name}.liquid" for name in LIQUID_SECTION.findall(stripped))
+        refs.update(f"sections/{name}.json" for name in LIQUID_SECTIONS_GROUP.findall(stripped))
+
+        if stripped.count("{%") != stripped.count("%}"):
+            errors.append("Unbalanced {% %} delimiters")
+        if stripped.count("{{") != stripped.count("}}"):
+            errors.append("Unbalanced {{ }} delimiters")
+
+        stack = []
+        for tag in LIQUID_TAG.findall(stripped):
+            if tag in LIQUID_BLOCK_TAGS:
+                stack.append(tag)
+            elif tag.startswith("end") and tag[3:] in LIQUID_BLOCK_TAGS:
+                if not stack or stack[-1] != tag[3:]:
+                    errors.append(f"Unexpected {{% {tag} %}}")
+                    break
+                stack.pop()
+        else:
+            if stack:
+                errors.append(f"Unclosed {{% {stack[-1]} %}}")
+
+        schema = LIQUID_SCHEMA.search(stripped)
+        if schema:
+            try:
+                schema_json = json.loads(schema.group(1))
+            except ValueError as e:
+                errors.append(f"Invalid schema JSON: {e}")
+            else:
+                if isinstance(schema_json, dict):
+                    info["has_presets"] = bool(schema_json.get("presets"))
+                else:
+                    errors.append(f"Schema must be a JSON object, not {type(schema_json).__name__}")
+
+    elif key.endswith(".json"):
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
+            data = json.loads(JSON_COMMENT.sub("", text, count=1))
+        except ValueError as e:
+            errors.append(f"Invalid JSON: {e}")
+            data = None
+
+        # JSON templates and section groups reference sections by type
+        if isinstance(data, dict) and key.startswith(("templates/", "sections/")):
+            sections = data.get("sections")
+            if not isinstance(sections, dict):
+                if sections is not None:
+                    errors.append("sections must be a JSON object")
+                elif key.startswith("templates/"):
+                    errors.append("JSON template has no sections object")
+                sections = {}
+            for section_id, section in sections.items():
+                if not isinstance(section, dict) or "type" not in section:
+                    errors.append(f"Section '{section_id}' has no type")
+                    continue
+                refs.add(f"sections/{section['type']}.liquid")
+            order = data.get("order", [])
+            for section_id in order if isinstance(order, list) else []:
+                if not isinstance(section_id, str) or section_id not in sections:
+                    errors.append(f"Order references unknown section '{section_id}'")
+            if data.get("layout"):
+                refs.add(f"layout/{data['layout']}.liquid")
+
+    return {"refs": sorted(refs), "errors": errors, **info}
+
+
+class ThemeChangeHandler(FileSystemEventHandler):
+    """Collects changed asset keys from watchdog events for watch_theme"""
+
+    def __init__(self, root: Path):
+        self.root = root.resolve()
+        self.lock = threading.Lock()
+        self.changed = set()
+
+    def on_any_event(self, event) -> None:
+        if event.is_directory:
+            return
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if not path:
+                continue
+            try:
+                key = Path(path).resolve().relative_to(self.root).as_posix()
+            except ValueError:
+                continue
+            with self.lock:
+                self.changed.add(key)
+
+    def drain(self) -> set:
+        with self.lock:
+            changed, self.changed = self.changed, set()
+        return changed
+
+
+class AttachmentUploadBody:
+    """File-like JSON request body that base64-encodes an asset file as it is sent.
+
+    Its exact length is known up front, so it is sent with a Content-Length
+    instead of being buffered; seek(0) restarts it for a retry.
+    """
+
+    def __init__(self, key: str, path: Path):
+        self.path = path
+        self.prefix = b'{"asset": {"key": ' + json.dumps(key).encode("utf-8") + b', "attachment": "'
+        self.suffix = b'"}}'
+        size = path.stat().st_size
+        self.length = len(self.prefix) + 4 * ((size + 2) // 3) + len(self.suffix)
+        self._chunks = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _generate(self):
+        yield self.prefix
+        with open(self.path, "rb") as f:
+            while True:
+                raw = f.read(STREAM_CHUNK_SIZE)
+                if not raw:
+                    break
+                yield base64.b64encode(raw)
+        yield self.suffix
+
+    def seek(self, offset: int, whence: int = 0) -> None:
+        self._chunks = None
+
+    def tell(self) -> int:
+        return 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self._chunks is None:
+            self._chunks = self._generate()
+        return next(self._chunks, b"")
+
+
+class ShopifyMCPServer(ShopifyClient):
+    """MCP Server for Shopify Admin API integration"""
+
+    def _request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict[str, Any]:
+        """Make a request to Shopify Admin API"""
+        try:
+            response = self._send(method, endpoint, json=data, params=params)
             return response.json() if response.text else {}
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
@@ -108,14 +475,15 @@ class ShopifyMCPServer:
             "updated_at": asset["updated_at"],
             "content_type": asset["content_type"],
             "size": asset.get("size", 0),
+            "checksum": asset.get("checksum"),
             "theme_id": asset["theme_id"]
         } for asset in assets]
 
     def get_theme_asset(self, theme_id: int, asset_key: str) -> Dict:
         """Get a specific theme asset"""
-        endpoint = f"themes/{theme_id}/assets.json?asset[key]={asset_key}"
+        endpoint = f"themes/{theme_id}/assets.json"
 
-        result = self._request("GET", endpoint)
+        result = self._request("GET", endpoint, params={"asset[key]": asset_key})
 
         if "error" in result:
             return result
@@ -130,6 +498,7 @@ class ShopifyMCPServer:
             "updated_at": asset["updated_at"],
             "content_type": asset["content_type"],
             "size": asset.get("size", 0),
+            "checksum": asset.get("checksum"),
             "theme_id": asset["theme_id"]
         }
 
@@ -156,10 +525,128 @@ class ShopifyMCPServer:
             "updated_at": asset["updated_at"]
         }
 
+    def upload_asset_file(self, theme_id: int, asset_key: str, file_path: str) -> Dict:
+        """Upload a file as a theme asset, base64-encoding it while streaming the request"""
+        path = Path(file_path).expanduser()
+        if not path.is_file():
+            return {"error": f"File not found: {path}"}
+
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for raw in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+                md5.update(raw)
+
+        try:
+            response = self._send(
+                "PUT",
+                f"themes/{theme_id}/assets.json",
+                data=AttachmentUploadBody(asset_key, path),
+                headers={"Content-Type": "application/json"},
+                timeout=300
+            )
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        asset = response.json().get("asset", {})
+        return {
+            "key": asset.get("key", asset_key),
+            "public_url": asset.get("public_url"),
+            "updated_at": asset.get("updated_at"),
+            "size": path.stat().st_size,
+            "checksum": asset.get("checksum"),
+            "checksum_verified": asset.get("checksum") == md5.hexdigest() if asset.get("checksum") else None
+        }
+
+    def download_asset_file(self, theme_id: int, asset_key: str, file_path: str) -> Dict:
+        """Download a theme asset to a file, decoding a base64 attachment as it streams in"""
+        path = Path(file_path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+
+        try:
+            response = self._send(
+                "GET",
+                f"themes/{theme_id}/assets.json",
+                params={"asset[key]": asset_key},
+                stream=True,
+                timeout=300
+            )
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+
+        head = b""
+        tail = b""
+        pending = b""
+        in_attachment = False
+        done = False
+        md5 = hashlib.md5()
+        size = 0
+
+        try:
+            with response, open(tmp_path, "wb") as out:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    if done:
+                        tail += chunk
+                        continue
+                    if not in_attachment:
+                        head += chunk
+                        match = ATTACHMENT_MARKER.search(head)
+                        if not match:
+                            # Text assets carry a JSON "value" and are small enough to parse whole
+                            continue
+                        chunk = head[match.end():]
+                        head = head[:match.end()]
+                        in_attachment = True
+
+                    end = chunk.find(b'"')
+                    if end != -1:
+                        tail = chunk[end:]
+                        chunk = chunk[:end]
+                        done = True
+
+                    # Base64 never contains backslashes; drop JSON "\/" escapes
+                    pending += chunk.replace(b"\\", b"")
+                    usable = len(pending) - len(pending) % 4
+                    if usable:
+                        raw = base64.b64decode(pending[:usable])
+                        pending = pending[usable:]
+                        out.write(raw)
+                        md5.update(raw)
+                        size += len(raw)
+
+                if in_attachment:
+                    asset = json.loads(head + tail)["asset"]
+                else:
+                    asset = json.loads(head)["asset"]
+                    raw = (asset.get("value") or "").encode("utf-8")
+                    out.write(raw)
+                    md5.update(raw)
+                    size = len(raw)
+
+            if asset.get("checksum") and asset["checksum"] != md5.hexdigest():
+                return {"error": f"Checksum mismatch for {asset_key}"}
+            os.replace(tmp_path, path)
+        except (ValueError, KeyError) as e:
+            return {"error": f"Invalid asset response for {asset_key}: {e}"}
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e), "status_code": getattr(e.response, "status_code", None)}
+        finally:
+            # Gone after a successful replace; a failed download leaves nothing behind
+            tmp_path.unlink(missing_ok=True)
+
+        return {
+            "key": asset["key"],
+            "file_path": str(path),
+            "size": size,
+            "content_type": asset.get("content_type"),
+            "checksum": asset.get("checksum") or md5.hexdigest(),
+            "updated_at": asset.get("updated_at")
+        }
+
     def delete_theme_asset(self, theme_id: int, asset_key: str) -> Dict:
         """Delete a theme asset"""
-        endpoint = f"themes/{theme_id}/assets.json?asset[key]={asset_key}"
-        result = self._request("DELETE", endpoint)
+        endpoint = f"themes/{theme_id}/assets.json"
+        result = self._request("DELETE", endpoint, params={"asset[key]": asset_key})
 
         if "error" in result:
             return result
@@ -206,13 +693,30 @@ class ShopifyMCPServer:
 
         return result.get("theme", {})
 
-    def validate_theme(self, theme_id: int) -> Dict:
-        """Validate theme structure and assets"""
-        # Get theme assets
-        assets = self.list_theme_assets(theme_id)
+    def validate_theme(self, theme_id: int, deep: bool = False, directory: Optional[str] = None, max_workers: Optional[int] = None) -> Dict:
+        """Validate theme structure and assets.
+
+        With deep, Liquid and JSON files of a local mirror are parsed as well;
+        without a directory the theme is first pulled into the cache mirror.
+        """
+        if deep and directory:
+            # Validate local files as they are, e.g. before a push
+            root = Path(directory).expanduser()
+            if not root.is_dir():
+                return {"error": f"Directory not found: {root}"}
+            assets = [{"key": key} for key in self._scan_theme_directory(root)]
+        else:
+            assets = self.list_theme_assets(theme_id)
 
-        if isinstance(assets, dict) and "error" in assets:
-            return assets
+            if isinstance(assets, dict) and "error" in assets:
+                return assets
+
+            if deep:
+                root = self._mirror_path(theme_id)
+                pulled = self.pull_theme(theme_id, str(root))
+                if "error" in pulled:
+                    return pulled
+                pull_errors = pulled.get("errors", {})
 
         # Check for required files
         required_files = [
@@ -234,7 +738,7 @@ class ShopifyMCPServer:
         config = [a for a in assets if a["key"].startswith("config/")]
         layout = [a for a in assets if a["key"].startswith("layout/")]
 
-        return {
+        result = {
             "valid": len(missing_files) == 0,
             "missing_files": missing_files,
             "summary": {
@@ -248,6 +752,1006 @@ class ShopifyMCPServer:
             }
         }
 
+        if deep:
+            result["deep"] = self._deep_validate(root, max_workers)
+            result["valid"] = result["valid"] and result["deep"]["valid"]
+            if not directory and pull_errors:
+                # Files that failed to download were checked stale or not at all
+                result["deep"]["pull_errors"] = pull_errors
+                result["deep"]["valid"] = False
+                result["valid"] = False
+
+        return result
+
+    def _deep_validate(self, root: Path, max_workers: Optional[int] = None) -> Dict:
+        """Parse a local theme in a process pool and check its reference graph"""
+        files = {
+            key: path for key, path in self._scan_theme_directory(root).items()
+            if key.endswith((".liquid", ".json"))
+        }
+
+        cache_path = root / VALIDATION_CACHE_NAME
+        cache = {}
+        if cache_path.exists():
+            with open(cache_path, "r") as f:
+                cache = json.load(f)
+            if cache.get("version") != ANALYZER_VERSION:
+                cache = {}
+        cached = cache.get("files", {})
+
+        results = {}
+        pending = {}
+        for key, path in files.items():
+            text = path.read_bytes().decode("utf-8", "replace")
+            checksum = hashlib.md5(text.encode("utf-8")).hexdigest()
+            entry = cached.get(key)
+            if entry and entry["checksum"] == checksum:
+                results[key] = entry
+            else:
+                pending[key] = (checksum, text)
+
+        if pending:
+            keys = list(pending)
+            texts = [pending[k][1] for k in keys]
+            # A process pool only pays off once there is enough to parse
+            if len(keys) >= PROCESS_POOL_MIN_FILES:
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    analyses = list(pool.map(analyze_theme_file, keys, texts, chunksize=16))
+            else:
+                analyses = [analyze_theme_file(k, t) for k, t in zip(keys, texts)]
+            for key, analysis in zip(keys, analyses):
+                results[key] = {"checksum": pending[key][0], **analysis}
+
+            with open(cache_path, "w") as f:
+                json.dump({"version": ANALYZER_VERSION, "files": results}, f)
+
+        all_keys = set(self._scan_theme_directory(root))
+        referenced = {}
+        for key, analysis in results.items():
+            for ref in analysis["refs"]:
+                referenced.setdefault(ref, []).append(key)
+
+        missing_references = {
+            ref: sorted(users) for ref, users in referenced.items()
+            if ref not in all_keys
+        }
+        # Sections with presets can be added from the theme editor at any time
+        orphaned_sections = sorted(
+            key for key in files
+            if key.startswith("sections/") and key.endswith(".liquid")
+            and key not in referenced and not results[key].get("has_presets")
+        )
+        unused_snippets = sorted(
+            key for key in files
+            if key.startswith("snippets/") and key not in referenced
+        )
+        file_errors = {key: a["errors"] for key, a in sorted(results.items()) if a["errors"]}
+
+        return {
+            "valid": not missing_references and not file_errors,
+            "files_checked": len(files),
+            "files_parsed": len(pending),
+            "missing_snippets": {k: v for k, v in missing_references.items() if k.startswith("snippets/")},
+            "missing_references": {k: v for k, v in missing_references.items() if not k.startswith("snippets/")},
+            "orphaned_sections": orphaned_sections,
+            "unused_snippets": unused_snippets,
+            "json_errors": {k: v for k, v in file_errors.items() if k.endswith(".json")},
+            "liquid_errors": {k: v for k, v in file_errors.items() if k.endswith(".liquid")},
+            "dependency_graph": {key: a["refs"] for key, a in sorted(results.items()) if a["refs"]}
+        }
+
+    # Local Theme Mirror
+    def _asset_path(self, directory: Path, key: str) -> Path:
+        """Resolve an asset key inside a mirror directory, refusing keys that escape it"""
+        path = (directory / key).resolve()
+        if directory.resolve() not in path.parents:
+            raise ValueError(f"Asset key escapes theme directory: {key}")
+        return path
+
+    def _mirror_path(self, theme_id: int) -> Path:
+        """Default mirror directory for a theme under the cache root"""
+        return self.cache_dir / "themes" / str(theme_id)
+
+    def _load_manifest(self, directory: Path) -> Dict:
+        """Load a mirror's manifest, or an empty one if the directory was never pulled"""
+        manifest_path = directory / MANIFEST_NAME
+        if not manifest_path.exists():
+            return {"assets": {}}
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+
+    def _save_manifest(self, directory: Path, manifest: Dict) -> None:
+        """Atomically write a mirror's manifest"""
+        manifest_path = directory / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+    def _fetch_asset_content(self, theme_id: int, key: str) -> Tuple[Dict, bytes]:
+        """Fetch one asset and return its metadata and raw content"""
+        response = self._send("GET", f"themes/{theme_id}/assets.json", params={"asset[key]": key})
+        asset = response.json()["asset"]
+
+        if asset.get("attachment") is not None:
+            content = base64.b64decode(asset["attachment"])
+        else:
+            content = (asset.get("value") or "").encode("utf-8")
+        return asset, content
+
+    def _download_asset(self, theme_id: int, key: str, directory: Path) -> Dict:
+        """Fetch one asset into the mirror and return its manifest entry"""
+        asset, content = self._fetch_asset_content(theme_id, key)
+
+        path = self._asset_path(directory, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+        return {
+            "checksum": asset.get("checksum") or hashlib.md5(content).hexdigest(),
+            "updated_at": asset["updated_at"],
+            "size": len(content)
+        }
+
+    def pull_theme(self, theme_id: int, directory: str, max_workers: int = 4, delete_removed: bool = True) -> Dict:
+        """Mirror a theme to a local directory, fetching only assets whose checksum changed"""
+        started = time.monotonic()
+        root = Path(directory).expanduser()
+        root.mkdir(parents=True, exist_ok=True)
+
+        remote = self.list_theme_assets(theme_id)
+        if isinstance(remote, dict) and "error" in remote:
+            return remote
+
+        manifest = self._load_manifest(root)
+        local = manifest.get("assets", {})
+
+        def unchanged(asset: Dict) -> bool:
+            entry = local.get(asset["key"])
+            if entry is None or not self._asset_path(root, asset["key"]).exists():
+                return False
+            if asset.get("checksum"):
+                return entry.get("checksum") == asset["checksum"]
+            # Some binary assets have no checksum in listings
+            return entry.get("updated_at") == asset["updated_at"] and entry.get("size") == asset["size"]
+
+        to_fetch = [a for a in remote if not unchanged(a)]
+        remote_keys = {a["key"] for a in remote}
+        removed = [key for key in local if key not in remote_keys]
+
+        fetched = []
+        errors = {}
+        try:
+            if to_fetch:
+                with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_fetch)))) as pool:
+                    futures = {a["key"]: pool.submit(self._download_asset, theme_id, a["key"], root) for a in to_fetch}
+                    for key, future in futures.items():
+                        try:
+                            local[key] = future.result()
+                            fetched.append(key)
+                        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                            errors[key] = str(e)
+
+            if delete_removed:
+                for key in removed:
+                    path = self._asset_path(root, key)
+                    if path.exists():
+                        path.unlink()
+                    del local[key]
+        finally:
+            # Record whatever was fetched so an interrupted pull resumes cheaply
+            manifest.update({
+                "theme_id": theme_id,
+                "shop": self.shop_domain,
+                "pulled_at": datetime.utcnow().isoformat() + "Z",
+                "assets": local
+            })
+            self._save_manifest(root, manifest)
+
+        return {
+            "theme_id": theme_id,
+            "directory": str(root),
+            "total_assets": len(remote),
+            "fetched": fetched,
+            "unchanged": len(remote) - len(to_fetch),
+            "removed": removed if delete_removed else [],
+            "errors": errors,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    def _scan_theme_directory(self, root: Path) -> Dict[str, Path]:
+        """Map asset keys to files for everything under the theme folders of a directory"""
+        files = {}
+        for folder in THEME_FOLDERS:
+            folder_path = root / folder
+            if not folder_path.is_dir():
+                continue
+            for path in folder_path.rglob("*"):
+                if path.is_file() and not path.name.startswith(".") and not path.name.endswith(".tmp"):
+                    files[path.relative_to(root).as_posix()] = path
+        return files
+
+    def _upload_asset(self, theme_id: int, key: str, content: bytes) -> Dict:
+        """Upload one asset from raw bytes and return its manifest entry"""
+        asset_data = {"key": key}
+        if Path(key).suffix in TEXT_EXTENSIONS:
+            try:
+                asset_data["value"] = content.decode("utf-8")
+            except UnicodeDecodeError:
+                asset_data["attachment"] = base64.b64encode(content).decode("ascii")
+        else:
+            asset_data["attachment"] = base64.b64encode(content).decode("ascii")
+
+        response = self._send("PUT", f"themes/{theme_id}/assets.json", json={"asset": asset_data})
+        asset = response.json()["asset"]
+        return {
+            "checksum": asset.get("checksum") or hashlib.md5(content).hexdigest(),
+            "updated_at": asset["updated_at"],
+            "size": len(content)
+        }
+
+    def _upload_in_order(
+        self,
+        theme_id: int,
+        keys: List[str],
+        read_content,
+        max_workers: int,
+        stop_on_error: bool,
+        uploaded: List[Dict],
+        errors: Dict[str, str],
+        on_uploaded=None
+    ) -> None:
+        """Upload assets folder by folder in THEME_FOLDERS order, concurrently within a folder.
+
+        Results are appended to uploaded/errors as they complete, so callers
+        keep partial progress if a later folder fails or is interrupted.
+        """
+        for folder in THEME_FOLDERS:
+            phase = sorted(k for k in keys if k.split("/", 1)[0] == folder)
+            if not phase:
+                continue
+
+            def upload(key: str) -> Dict:
+                upload_started = time.monotonic()
+                entry = self._upload_asset(theme_id, key, read_content(key))
+                return {"entry": entry, "ms": int((time.monotonic() - upload_started) * 1000)}
+
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(phase)))) as pool:
+                futures = {key: pool.submit(upload, key) for key in phase}
+                for key, future in futures.items():
+                    try:
+                        result = future.result()
+                    except (requests.exceptions.RequestException, KeyError, OSError) as e:
+                        errors[key] = str(e)
+                        continue
+                    uploaded.append({"key": key, "size": result["entry"]["size"], "ms": result["ms"]})
+                    if on_uploaded:
+                        on_uploaded(key, result["entry"])
+            if errors and stop_on_error:
+                break
+
+    def _delete_assets(self, theme_id: int, keys: List[str], errors: Dict[str, str]) -> List[str]:
+        """Delete assets one by one, recording failures in errors"""
+        deleted = []
+        for key in keys:
+            try:
+                self._send("DELETE", f"themes/{theme_id}/assets.json", params={"asset[key]": key})
+                deleted.append(key)
+            except requests.exceptions.RequestException as e:
+                errors[key] = str(e)
+        return deleted
+
+    def _optimize_files(self, files: Dict[str, Path], max_workers: Optional[int] = None) -> Dict[str, Dict]:
+        """Optimize CSS/JS/SVG assets, caching outputs under the cache root.
+
+        Outputs are keyed by extension, minifier backend and input MD5, so
+        installing or upgrading rcssmin/rjsmin never serves stale output.
+
+        Returns {key: {"path", "original_bytes", "optimized_bytes", "cached"}} for eligible files.
+        """
+        cache_dir = self.cache_dir.parent / "optimized" / f"v{OPTIMIZER_VERSION}"
+        results = {}
+        misses = {}
+        for key, path in files.items():
+            name = Path(key).name
+            if (not key.startswith("assets/") or Path(key).suffix not in OPTIMIZABLE_EXTENSIONS
+                    or ".min." in name):
+                continue
+            content = path.read_bytes()
+            digest = hashlib.md5(content).hexdigest()
+            suffix = Path(key).suffix
+            backend_dir = cache_dir / f"{suffix.lstrip('.')}-{minifier_backend(suffix)}"
+            output_path = backend_dir / digest[:2] / digest[2:]
+            results[key] = {"path": output_path, "original_bytes": len(content), "cached": output_path.exists()}
+            if not results[key]["cached"]:
+                misses[key] = content
+
+        if misses:
+            keys = list(misses)
+            contents = [misses[k] for k in keys]
+            if len(keys) >= PROCESS_POOL_MIN_FILES:
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    outputs = list(pool.map(optimize_asset, keys, contents, chunksize=8))
+            else:
+                outputs = [optimize_asset(k, c) for k, c in zip(keys, contents)]
+            for key, output in zip(keys, outputs):
+                output_path = results[key]["path"]
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = output_path.with_name(output_path.name + ".tmp")
+                tmp_path.write_bytes(output)
+                os.replace(tmp_path, output_path)
+
+        for entry in results.values():
+            entry["optimized_bytes"] = entry["path"].stat().st_size
+        return results
+
+    def push_theme(
+        self,
+        theme_id: int,
+        directory: str,
+        max_workers: int = 4,
+        delete_missing: bool = False,
+        dry_run: bool = False,
+        stop_on_error: bool = True,
+        optimize: bool = False
+    ) -> Dict:
+        """Upload changed files from a local theme directory, folder by folder in dependency order.
+
+        Files are compared against the remote checksums from one asset listing,
+        so re-running an interrupted push only uploads what is still missing.
+        With optimize, CSS/JS/SVG under assets/ are minified before upload and
+        compared by their optimized content.
+        """
+        started = time.monotonic()
+        root = Path(directory).expanduser()
+        if not root.is_dir():
+            return {"error": f"Directory not found: {root}"}
+
+        remote = self.list_theme_assets(theme_id)
+        if isinstance(remote, dict) and "error" in remote:
+            return remote
+        remote_by_key = {a["key"]: a for a in remote}
+
+        local_files = self._scan_theme_directory(root)
+        optimized = self._optimize_files(local_files) if optimize else {}
+
+        def read_content(key: str) -> bytes:
+            if key in optimized:
+                return optimized[key]["path"].read_bytes()
+            return local_files[key].read_bytes()
+
+        changed = []
+        for key in local_files:
+            remote_asset = remote_by_key.get(key)
+            if remote_asset and remote_asset.get("checksum") == hashlib.md5(read_content(key)).hexdigest():
+                continue
+            changed.append(key)
+        to_delete = sorted(k for k in remote_by_key if k not in local_files) if delete_missing else []
+
+        optimization = None
+        if optimize:
+            changed_keys = set(changed)
+            savings = [{
+                "key": key,
+                "original_bytes": entry["original_bytes"],
+                "optimized_bytes": entry["optimized_bytes"],
+                "saved_bytes": entry["original_bytes"] - entry["optimized_bytes"],
+                "cached": entry["cached"]
+            } for key, entry in sorted(optimized.items()) if key in changed_keys]
+            optimization = {
+                "assets": savings,
+                "original_bytes": sum(s["original_bytes"] for s in savings),
+                "saved_bytes": sum(s["saved_bytes"] for s in savings)
+            }
+
+        phases = [[k for k in sorted(changed) if k.split("/", 1)[0] == folder] for folder in THEME_FOLDERS]
+        if dry_run:
+            return {
+                "theme_id": theme_id,
+                "upload": [k for phase in phases for k in phase],
+                "delete": to_delete,
+                "unchanged": len(local_files) - len(changed),
+                "optimization": optimization
+            }
+
+        # Only keep the local manifest in step when it mirrors this theme
+        manifest = self._load_manifest(root)
+        track_manifest = manifest.get("theme_id") in (None, theme_id)
+
+        def uploaded_entry(key: str, entry: Dict) -> None:
+            if track_manifest:
+                manifest.setdefault("assets", {})[key] = entry
+
+        uploaded = []
+        deleted = []
+        errors = {}
+        try:
+            self._upload_in_order(
+                theme_id, changed, read_content,
+                max_workers, stop_on_error, uploaded, errors, uploaded_entry
+            )
+
+            if not (errors and stop_on_error):
+                deleted = self._delete_assets(theme_id, to_delete, errors)
+                if track_manifest:
+                    for key in deleted:
+                        manifest.get("assets", {}).pop(key, None)
+        finally:
+            if track_manifest and (uploaded or deleted):
+                manifest["theme_id"] = theme_id
+                self._save_manifest(root, manifest)
+
+        return {
+            "theme_id": theme_id,
+            "uploaded": uploaded,
+            "deleted": deleted,
+            "unchanged": len(local_files) - len(changed),
+            "pending": sorted(set(changed) - set(errors) - {u["key"] for u in uploaded}),
+            "errors": errors,
+            "optimization": optimization,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    def diff_themes(
+        self,
+        theme_id: int,
+        other_theme_id: Optional[int] = None,
+        directory: Optional[str] = None,
+        prefix: Optional[str] = None,
+        text_diff: bool = False,
+        max_diff_keys: int = 50,
+        max_workers: int = 4
+    ) -> Dict:
+        """Compare a theme with another theme or a local directory using listing checksums only.
+
+        Asset content is fetched only for changed keys, and only when text_diff is set.
+        """
+        if (other_theme_id is None) == (directory is None):
+            return {"error": "Provide exactly one of other_theme_id or directory"}
+
+        base = self.list_theme_assets(theme_id)
+        if isinstance(base, dict) and "error" in base:
+            return base
+        base_index = {a["key"]: (a.get("checksum"), a["size"]) for a in base}
+
+        local_files: Dict[str, Path] = {}
+        if other_theme_id is not None:
+            other = self.list_theme_assets(other_theme_id)
+            if isinstance(other, dict) and "error" in other:
+                return other
+            other_index = {a["key"]: (a.get("checksum"), a["size"]) for a in other}
+        else:
+            root = Path(directory).expanduser()
+            if not root.is_dir():
+                return {"error": f"Directory not found: {root}"}
+            local_files = self._scan_theme_directory(root)
+            other_index = {}
+            for key, path in local_files.items():
+                content = path.read_bytes()
+                other_index[key] = (hashlib.md5(content).hexdigest(), len(content))
+
+        if prefix:
+            base_index = {k: v for k, v in base_index.items() if k.startswith(prefix)}
+            other_index = {k: v for k, v in other_index.items() if k.startswith(prefix)}
+
+        added = sorted(other_index.keys() - base_index.keys())
+        removed = sorted(base_index.keys() - other_index.keys())
+        changed = []
+        identical = 0
+        unverified = []
+        for key in sorted(base_index.keys() & other_index.keys()):
+            (base_sum, base_size), (other_sum, other_size) = base_index[key], other_index[key]
+            if base_size != other_size or (base_sum and other_sum and base_sum != other_sum):
+                changed.append(key)
+            elif base_sum and other_sum:
+                identical += 1
+            else:
+                # Same size but no checksum on one side to confirm
+                unverified.append(key)
+
+        result = {
+            "theme_id": theme_id,
+            "compared_to": other_theme_id if other_theme_id is not None else str(Path(directory).expanduser()),
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unverified": unverified,
+            "identical": identical
+        }
+
+        if text_diff and changed:
+            text_keys = [k for k in changed if Path(k).suffix in TEXT_EXTENSIONS]
+            diff_keys = text_keys[:max_diff_keys]
+
+            def read_other(key: str) -> bytes:
+                if other_theme_id is not None:
+                    return self._fetch_asset_content(other_theme_id, key)[1]
+                return local_files[key].read_bytes()
+
+            def unified(key: str) -> str:
+                before = self._fetch_asset_content(theme_id, key)[1].decode("utf-8", "replace")
+                after = read_other(key).decode("utf-8", "replace")
+                return "".join(difflib.unified_diff(
+                    before.splitlines(keepends=True),
+                    after.splitlines(keepends=True),
+                    fromfile=f"a/{key}",
+                    tofile=f"b/{key}"
+                ))
+
+            diffs = {}
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(diff_keys)))) as pool:
+                futures = {key: pool.submit(unified, key) for key in diff_keys}
+                for key, future in futures.items():
+                    try:
+                        diffs[key] = future.result()
+                    except (requests.exceptions.RequestException, KeyError) as e:
+                        diffs[key] = {"error": str(e)}
+            result["diffs"] = diffs
+            result["diffs_truncated"] = len(diff_keys) < len(text_keys)
+
+        return result
+
+    def watch_theme(
+        self,
+        theme_id: int,
+        directory: str,
+        debounce_ms: int = 150,
+        poll_interval: float = 0.2,
+        max_workers: int = 4,
+        delete: bool = False,
+        duration: Optional[float] = None
+    ) -> Dict:
+        """Watch a local theme directory and push changed files as they are saved.
+
+        Bursts of writes are coalesced for debounce_ms, unchanged content is
+        skipped, and each push is reported as an NDJSON line on stderr. Uses
+        watchdog when installed, otherwise polls file stats. Runs until
+        interrupted, or for duration seconds.
+        """
+        root = Path(directory).expanduser()
+        if not root.is_dir():
+            return {"error": f"Directory not found: {root}"}
+
+        manifest = self._load_manifest(root)
+        track_manifest = manifest.get("theme_id") in (None, theme_id)
+        # Content already on the theme, as far as we know
+        pushed = {k: v["checksum"] for k, v in manifest.get("assets", {}).items()} if track_manifest else {}
+
+        def snapshot() -> Dict[str, Tuple[int, int]]:
+            stats = {}
+            for key, path in self._scan_theme_directory(root).items():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                stats[key] = (stat.st_mtime_ns, stat.st_size)
+            return stats
+
+        handler = None
+        observer = None
+        if Observer is not None:
+            handler = ThemeChangeHandler(root)
+            observer = Observer()
+            observer.schedule(handler, str(root), recursive=True)
+            observer.start()
+        else:
+            stats = snapshot()
+
+        def upload(key: str) -> Dict:
+            path = root / key
+            saved_at = path.stat().st_mtime
+            content = path.read_bytes()
+            checksum = hashlib.md5(content).hexdigest()
+            if pushed.get(key) == checksum:
+                return {"key": key, "skipped": True}
+            entry = self._upload_asset(theme_id, key, content)
+            pushed[key] = checksum
+            if track_manifest:
+                manifest.setdefault("assets", {})[key] = entry
+            return {"key": key, "size": entry["size"], "saved_at": saved_at}
+
+        def delete_asset(key: str) -> Dict:
+            self._send("DELETE", f"themes/{theme_id}/assets.json", params={"asset[key]": key})
+            pushed.pop(key, None)
+            if track_manifest:
+                manifest.get("assets", {}).pop(key, None)
+            return {"key": key, "deleted": True, "saved_at": seen_at[key]}
+
+        started = time.monotonic()
+        pending: Dict[str, float] = {}
+        seen_at: Dict[str, float] = {}
+        latencies = []
+        pushes = 0
+        errors = {}
+        pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                time.sleep(poll_interval if observer is None else 0.05)
+                now = time.monotonic()
+
+                if observer is not None:
+                    changed = {k for k in handler.drain() if k.split("/", 1)[0] in THEME_FOLDERS
+                               and not Path(k).name.startswith(".") and not k.endswith(".tmp")}
+                else:
+                    current = snapshot()
+                    changed = {k for k, v in current.items() if stats.get(k) != v}
+                    changed |= stats.keys() - current.keys()
+                    stats = current
+                for key in changed:
+                    pending[key] = now
+                    seen_at.setdefault(key, time.time())
+
+                # Flush once the burst has been quiet for the debounce window
+                if not pending or now - max(pending.values()) < debounce_ms / 1000:
+                    continue
+                batch = sorted(pending, key=lambda k: (THEME_FOLDERS.index(k.split("/", 1)[0]), k))
+                pending.clear()
+
+                results = []
+                for folder in THEME_FOLDERS:
+                    keys = [k for k in batch if k.split("/", 1)[0] == folder]
+                    futures = {}
+                    for key in keys:
+                        if (root / key).is_file():
+                            futures[key] = pool.submit(upload, key)
+                        elif delete and key in pushed:
+                            futures[key] = pool.submit(delete_asset, key)
+                    for key, future in futures.items():
+                        try:
+                            results.append(future.result())
+                        except (requests.exceptions.RequestException, KeyError, OSError) as e:
+                            errors[key] = str(e)
+                            results.append({"key": key, "error": str(e)})
+
+                for key in batch:
+                    seen_at.pop(key, None)
+                done = [r for r in results if not r.get("skipped")]
+                if not done:
+                    continue
+                # Save-to-live latency, from the earliest save in the batch
+                latency_ms = int((time.time() - min(r.get("saved_at", time.time()) for r in done)) * 1000)
+                for r in done:
+                    r.pop("saved_at", None)
+                latencies.append(latency_ms)
+                pushes += 1
+                if track_manifest:
+                    manifest["theme_id"] = theme_id
+                    self._save_manifest(root, manifest)
+                print(json.dumps({"event": "push", "files": done, "latency_ms": latency_ms}), file=sys.stderr, flush=True)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown(wait=True)
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+        latencies.sort()
+        return {
+            "theme_id": theme_id,
+            "watcher": "watchdog" if observer is not None else "polling",
+            "pushes": pushes,
+            "errors": errors,
+            "latency_ms": {
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "max": latencies[-1] if latencies else None
+            },
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    # Theme Snapshots
+    def _object_path(self, checksum: str) -> Path:
+        """Location of asset content in the MD5-addressed object store shared by all snapshots"""
+        return self.cache_dir / "objects" / checksum[:2] / checksum[2:]
+
+    def _store_object(self, content: bytes) -> str:
+        """Write content to the object store (once) and return its MD5"""
+        checksum = hashlib.md5(content).hexdigest()
+        path = self._object_path(checksum)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+        return checksum
+
+    def _snapshot_path(self, snapshot_id: str) -> Path:
+        return self.cache_dir / "snapshots" / f"{snapshot_id}.json"
+
+    def snapshot_theme(self, theme_id: int, name: Optional[str] = None, max_workers: int = 4) -> Dict:
+        """Save a local, deduplicated snapshot of a theme's assets as a rollback point.
+
+        Assets whose listed checksum is already in the object store are not downloaded.
+        """
+        started = time.monotonic()
+        remote = self.list_theme_assets(theme_id)
+        if isinstance(remote, dict) and "error" in remote:
+            return remote
+
+        assets = {}
+        to_fetch = []
+        for a in remote:
+            if a.get("checksum") and self._object_path(a["checksum"]).exists():
+                assets[a["key"]] = {"checksum": a["checksum"], "size": a["size"]}
+            else:
+                to_fetch.append(a)
+
+        def fetch(key: str) -> Dict:
+            _, content = self._fetch_asset_content(theme_id, key)
+            return {"checksum": self._store_object(content), "size": len(content)}
+
+        errors = {}
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_fetch)))) as pool:
+                futures = {a["key"]: pool.submit(fetch, a["key"]) for a in to_fetch}
+                for key, future in futures.items():
+                    try:
+                        assets[key] = future.result()
+                    except (requests.exceptions.RequestException, KeyError) as e:
+                        errors[key] = str(e)
+
+        if errors:
+            # An incomplete snapshot is not a safe rollback point
+            return {"error": "Snapshot incomplete", "errors": errors}
+
+        created_at = datetime.utcnow()
+        snapshot_id = f"{theme_id}-{created_at.strftime('%Y%m%dT%H%M%SZ')}"
+        suffix = 1
+        while self._snapshot_path(snapshot_id).exists():
+            suffix += 1
+            snapshot_id = f"{theme_id}-{created_at.strftime('%Y%m%dT%H%M%SZ')}-{suffix}"
+        snapshot = {
+            "id": snapshot_id,
+            "name": name,
+            "theme_id": theme_id,
+            "shop": self.shop_domain,
+            "created_at": created_at.isoformat() + "Z",
+            "assets": assets
+        }
+        path = self._snapshot_path(snapshot_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        return {
+            "id": snapshot_id,
+            "name": name,
+            "theme_id": theme_id,
+            "total_assets": len(assets),
+            "fetched": len(to_fetch),
+            "deduplicated": len(remote) - len(to_fetch),
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    def list_snapshots(self, theme_id: Optional[int] = None) -> List[Dict]:
+        """List local theme snapshots, newest first"""
+        snapshot_dir = self.cache_dir / "snapshots"
+        if not snapshot_dir.is_dir():
+            return []
+
+        snapshots = []
+        for path in snapshot_dir.glob("*.json"):
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+            if theme_id is not None and snapshot["theme_id"] != theme_id:
+                continue
+            snapshots.append({
+                "id": snapshot["id"],
+                "name": snapshot.get("name"),
+                "theme_id": snapshot["theme_id"],
+                "created_at": snapshot["created_at"],
+                "total_assets": len(snapshot["assets"])
+            })
+        return sorted(snapshots, key=lambda s: s["created_at"], reverse=True)
+
+    def restore_theme(
+        self,
+        snapshot_id: str,
+        theme_id: Optional[int] = None,
+        delete_extra: bool = False,
+        dry_run: bool = False,
+        max_workers: int = 4
+    ) -> Dict:
+        """Restore a snapshot onto a theme, uploading only assets whose checksum differs"""
+        started = time.monotonic()
+        path = self._snapshot_path(snapshot_id)
+        if not path.exists():
+            return {"error": f"Snapshot not found: {snapshot_id}"}
+        try:
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+        except ValueError as e:
+            return {"error": f"Snapshot {snapshot_id} is corrupt: {e}"}
+
+        target_id = theme_id if theme_id is not None else snapshot["theme_id"]
+        remote = self.list_theme_assets(target_id)
+        if isinstance(remote, dict) and "error" in remote:
+            return remote
+        remote_by_key = {a["key"]: a for a in remote}
+
+        to_upload = [
+            key for key, entry in snapshot["assets"].items()
+            if key not in remote_by_key or remote_by_key[key].get("checksum") != entry["checksum"]
+        ]
+        to_delete = sorted(k for k in remote_by_key if k not in snapshot["assets"]) if delete_extra else []
+
+        if dry_run:
+            return {
+                "snapshot_id": snapshot_id,
+                "theme_id": target_id,
+                "upload": sorted(to_upload),
+                "delete": to_delete,
+                "unchanged": len(snapshot["assets"]) - len(to_upload)
+            }
+
+        uploaded = []
+        errors = {}
+        self._upload_in_order(
+            target_id, to_upload,
+            lambda key: self._object_path(snapshot["assets"][key]["checksum"]).read_bytes(),
+            max_workers, True, uploaded, errors
+        )
+        deleted = [] if errors else self._delete_assets(target_id, to_delete, errors)
+
+        return {
+            "snapshot_id": snapshot_id,
+            "theme_id": target_id,
+            "uploaded": uploaded,
+            "deleted": deleted,
+            "unchanged": len(snapshot["assets"]) - len(to_upload),
+            "errors": errors,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+    # Theme Search
+    def _update_search_index(self, root: Path) -> Tuple[sqlite3.Connection, Dict]:
+        """Open a mirror's trigram index and bring it up to date with the files on disk"""
+        conn = sqlite3.connect(str(root / SEARCH_INDEX_NAME))
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    key TEXT PRIMARY KEY,
+                    mtime_ns INTEGER,
+                    size INTEGER,
+                    checksum TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(key UNINDEXED, content, tokenize='trigram');
+            """)
+        except sqlite3.OperationalError:
+            conn.close()
+            raise
+
+        indexed = {row[0]: row[1:] for row in conn.execute("SELECT key, mtime_ns, size, checksum FROM files")}
+        files = {k: p for k, p in self._scan_theme_directory(root).items() if Path(k).suffix in TEXT_EXTENSIONS}
+        updated = 0
+
+        for key, path in files.items():
+            stat = path.stat()
+            old = indexed.get(key)
+            if old and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+                continue
+            content = path.read_bytes()
+            checksum = hashlib.md5(content).hexdigest()
+            if old and old[2] == checksum:
+                # Touched but not changed
+                conn.execute("UPDATE files SET mtime_ns = ? WHERE key = ?", (stat.st_mtime_ns, key))
+                continue
+            conn.execute("DELETE FROM docs WHERE key = ?", (key,))
+            conn.execute("INSERT INTO docs(key, content) VALUES (?, ?)", (key, content.decode("utf-8", "replace")))
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (key, stat.st_mtime_ns, stat.st_size, checksum))
+            updated += 1
+
+        removed = [key for key in indexed if key not in files]
+        for key in removed:
+            conn.execute("DELETE FROM docs WHERE key = ?", (key,))
+            conn.execute("DELETE FROM files WHERE key = ?", (key,))
+
+        conn.commit()
+        return conn, {"files": len(files), "updated": updated, "removed": len(removed)}
+
+    def search_theme(
+        self,
+        query: str,
+        directory: Optional[str] = None,
+        theme_id: Optional[int] = None,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        keys: Optional[List[str]] = None,
+        context: int = 2,
+        max_results: int = 100
+    ) -> Dict:
+        """Search theme source through a local trigram index.
+
+        Searches a local directory, or the cached mirror of theme_id (pulled
+        incrementally first). The index is refreshed from file mtimes on each call.
+        """
+        started = time.monotonic()
+        if directory:
+            root = Path(directory).expanduser()
+            if not root.is_dir():
+                return {"error": f"Directory not found: {root}"}
+        elif theme_id is not None:
+            root = self._mirror_path(theme_id)
+            pulled = self.pull_theme(theme_id, str(root))
+            if "error" in pulled:
+                return pulled
+        else:
+            return {"error": "Provide directory or theme_id"}
+
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            matcher = re.compile(query if regex else re.escape(query), flags)
+        except re.error as e:
+            return {"error": f"Invalid regex: {e}"}
+
+        try:
+            conn, index_stats = self._update_search_index(root)
+        except sqlite3.OperationalError as e:
+            # The trigram tokenizer needs SQLite 3.34+ built with FTS5
+            conn, index_stats = None, {"fallback": "scan", "reason": str(e)}
+        try:
+            # The trigram tokenizer matches case-insensitively; re does the exact check
+            literals = required_literals(query) if regex else ([query] if len(query) >= 3 else [])
+            if conn is None:
+                rows = (
+                    (key, path.read_bytes().decode("utf-8", "replace"))
+                    for key, path in sorted(self._scan_theme_directory(root).items())
+                    if Path(key).suffix in TEXT_EXTENSIONS
+                )
+            elif literals:
+                match_expr = " AND ".join('"' + lit.replace('"', '""') + '"' for lit in literals)
+                rows = conn.execute("SELECT key, content FROM docs WHERE docs MATCH ?", (match_expr,))
+            else:
+                rows = conn.execute("SELECT key, content FROM docs")
+
+            matches = []
+            candidates = 0
+            files_matched = set()
+            truncated = False
+            for key, content in rows:
+                if keys and not any(fnmatch.fnmatch(key, pattern) for pattern in keys):
+                    continue
+                candidates += 1
+                if not matcher.search(content):
+                    continue
+                lines = content.splitlines()
+                for number, line in enumerate(lines):
+                    if not matcher.search(line):
+                        continue
+                    if len(matches) >= max_results:
+                        truncated = True
+                        break
+                    files_matched.add(key)
+                    matches.append({
+                        "key": key,
+                        "line": number + 1,
+                        "text": line,
+                        "before": lines[max(0, number - context):number],
+                        "after": lines[number + 1:number + 1 + context]
+                    })
+                if truncated:
+                    break
+        finally:
+            if conn is not None:
+                conn.close()
+
+        return {
+            "query": query,
+            "matches": matches,
+            "files_matched": len(files_matched),
+            "candidates": candidates,
+            "truncated": truncated,
+            "index": index_stats,
+            "elapsed_ms": int((time.monotonic() - started) * 1000)
+        }
+
     def get_shop_info(self) -> Dict:
         """Get shop information"""
         result = self._request("GET", "shop.json")
@@ -313,6 +1817,26 @@ def handle_command(server: ShopifyMCPServer, command: str, params: Dict[str, Any
             )
         }
 
+    elif command == "upload_asset_file":
+        return {
+            "success": True,
+            "data": server.upload_asset_file(
+                params["theme_id"],
+                params["asset_key"],
+                params["file_path"]
+            )
+        }
+
+    elif command == "download_asset_file":
+        return {
+            "success": True,
+            "data": server.download_asset_file(
+                params["theme_id"],
+                params["asset_key"],
+                params["file_path"]
+            )
+        }
+
     elif command == "delete_theme_asset":
         return {
             "success": True,
@@ -340,7 +1864,108 @@ def handle_command(server: ShopifyMCPServer, command: str, params: Dict[str, Any
     elif command == "validate_theme":
         return {
             "success": True,
-            "data": server.validate_theme(params["theme_id"])
+            "data": server.validate_theme(
+                params["theme_id"],
+                params.get("deep", False),
+                params.get("directory"),
+                params.get("max_workers")
+            )
+        }
+
+    elif command == "pull_theme":
+        return {
+            "success": True,
+            "data": server.pull_theme(
+                params["theme_id"],
+                params["directory"],
+                params.get("max_workers", 4),
+                params.get("delete_removed", True)
+            )
+        }
+
+    elif command == "push_theme":
+        return {
+            "success": True,
+            "data": server.push_theme(
+                params["theme_id"],
+                params["directory"],
+                params.get("max_workers", 4),
+                params.get("delete_missing", False),
+                params.get("dry_run", False),
+                params.get("stop_on_error", True),
+                params.get("optimize", False)
+            )
+        }
+
+    elif command == "diff_themes":
+        return {
+            "success": True,
+            "data": server.diff_themes(
+                params["theme_id"],
+                params.get("other_theme_id"),
+                params.get("directory"),
+                params.get("prefix"),
+                params.get("text_diff", False),
+                params.get("max_diff_keys", 50),
+                params.get("max_workers", 4)
+            )
+        }
+
+    elif command == "watch_theme":
+        return {
+            "success": True,
+            "data": server.watch_theme(
+                params["theme_id"],
+                params["directory"],
+                params.get("debounce_ms", 150),
+                params.get("poll_interval", 0.2),
+                params.get("max_workers", 4),
+                params.get("delete", False),
+                params.get("duration")
+            )
+        }
+
+    elif command == "snapshot_theme":
+        return {
+            "success": True,
+            "data": server.snapshot_theme(
+                params["theme_id"],
+                params.get("name"),
+                params.get("max_workers", 4)
+            )
+        }
+
+    elif command == "list_snapshots":
+        return {
+            "success": True,
+            "data": server.list_snapshots(params.get("theme_id"))
+        }
+
+    elif command == "restore_theme":
+        return {
+            "success": True,
+            "data": server.restore_theme(
+                params["snapshot_id"],
+                params.get("theme_id"),
+                params.get("delete_extra", False),
+                params.get("dry_run", False),
+                params.get("max_workers", 4)
+            )
+        }
+
+    elif command == "search_theme":
+        return {
+            "success": True,
+            "data": server.search_theme(
+                params["query"],
+                params.get("directory"),
+                params.get("theme_id"),
+                params.get("regex", False),
+                params.get("case_sensitive", False),
+                params.get("keys"),
+                params.get("context", 2),
+                params.get("max_results", 100)
+            )
         }
 
     elif command == "get_shop_info":
@@ -359,7 +1984,7 @@ def handle_command(server: ShopifyMCPServer, command: str, params: Dict[str, Any
 def main():
     """Main entry point for MCP server"""
     try:
-        server = ShopifyMCPServer()
+        stores = StoreRegistry(ShopifyMCPServer)
 
         # Read command from stdin
         if len(sys.argv) > 1:
@@ -370,7 +1995,7 @@ def main():
         command = input_data.get("command")
         params = input_data.get("params", {})
 
-        result = handle_command(server, command, params)
+        result = dispatch(stores, command, params, handle_command, FAN_OUT_COMMANDS)
         print(json.dumps(result, indent=2))
 
     except Exception as e:
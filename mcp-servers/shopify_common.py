@@ -0,0 +1,261 @@
+"""
+Shared Shopify plumbing for shopify-server.py and shopify-app-server.py:
+the paced REST client, the multi-store registry and command dispatch.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+import requests
+from pathlib import Path
+
+# Upper bound on concurrent stores in one fan-out command
+FAN_OUT_MAX_WORKERS = 16
+
+# Records buffered between per-store streams and the merged output
+MERGE_QUEUE_SIZE = 250
+
+
+class ShopifyClient:
+    """Credentials, session and REST rate limiting for one store"""
+
+    def __init__(self, shop_domain: Optional[str] = None, token: Optional[str] = None):
+        # Without explicit credentials, serve the single store configured in env
+        if shop_domain is None:
+            shop_domain, token = os.getenv("SHOP_DOMAIN"), os.getenv("SHOPIFY_ADMIN_TOKEN")
+        self.token = token
+        self.shop_domain = shop_domain
+
+        if not self.token:
+            raise ValueError("SHOPIFY_ADMIN_TOKEN environment variable is required")
+        if not self.shop_domain:
+            raise ValueError("SHOP_DOMAIN environment variable is required")
+
+        self.base_url = f"https://{self.shop_domain}.myshopify.com/admin/api/2024-10"
+        self.headers = {
+            "X-Shopify-Access-Token": self.token,
+            "Content-Type": "application/json"
+        }
+
+        # Theme mirrors and local stores live under ORCHESTRA_CACHE_DIR
+        cache_root = os.getenv("ORCHESTRA_CACHE_DIR", str(Path.home() / ".cache" / "orchestra"))
+        self.cache_dir = Path(cache_root).expanduser() / "shopify" / self.shop_domain
+
+        # One connection pool per store
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+
+        # REST leaky bucket (40 requests, leaking 2/s on standard plans),
+        # tracked from X-Shopify-Shop-Api-Call-Limit and shared by worker threads
+        self._bucket_lock = threading.Lock()
+        self._bucket_used = 0.0
+        self._bucket_size = 40.0
+        self._bucket_checked_at = time.monotonic()
+        self._leak_rate = 2.0
+
+    def _throttle(self) -> None:
+        """Wait until the leaky bucket has room for another request"""
+        with self._bucket_lock:
+            now = time.monotonic()
+            used = max(0.0, self._bucket_used - (now - self._bucket_checked_at) * self._leak_rate)
+            # Keep a few slots free for other clients of the same shop
+            wait = (used + 1 - (self._bucket_size - 4)) / self._leak_rate
+            self._bucket_used = used + 1
+            self._bucket_checked_at = now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _record_call_limit(self, response: requests.Response) -> None:
+        """Sync the local bucket estimate with the server's call-limit header"""
+        call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if not call_limit:
+            return
+        used, size = (float(x) for x in call_limit.split("/"))
+        with self._bucket_lock:
+            self._bucket_used = used
+            self._bucket_size = size
+            self._bucket_checked_at = time.monotonic()
+
+    def _send(self, method: str, endpoint: str, max_retries: int = 3, **kwargs) -> requests.Response:
+        """Send a paced REST request, retrying 429 responses after Retry-After.
+
+        Raises requests exceptions for other failures.
+        """
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        kwargs.setdefault("timeout", 30)
+
+        for attempt in range(max_retries + 1):
+            self._throttle()
+            response = self.session.request(method, url, **kwargs)
+            self._record_call_limit(response)
+            if response.status_code != 429 or attempt == max_retries:
+                break
+            response.close()
+            # Streamed request bodies must be restarted before they are resent
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+            time.sleep(float(response.headers.get("Retry-After", 2 ** attempt)))
+
+        response.raise_for_status()
+        return response
+
+
+class StoreRegistry:
+    """Resolve the optional "shop" param to a per-store server.
+
+    Stores come from SHOP_DOMAIN/SHOPIFY_ADMIN_TOKEN and from the JSON file
+    named by SHOPIFY_STORES_FILE. Servers are created on first use, one per
+    store, so each store keeps its own connection pool and rate-limit bucket.
+    """
+
+    def __init__(self, server_class: Callable[[str, str], ShopifyClient]):
+        self.server_class = server_class
+        self.stores: Dict[str, Dict[str, str]] = {}
+        self.default: Optional[str] = None
+        self._servers: Dict[str, ShopifyClient] = {}
+        self._lock = threading.Lock()
+
+        env_domain = os.getenv("SHOP_DOMAIN")
+        if env_domain and os.getenv("SHOPIFY_ADMIN_TOKEN"):
+            self.stores[env_domain] = {"shop_domain": env_domain, "token_env": "SHOPIFY_ADMIN_TOKEN"}
+            self.default = env_domain
+
+        stores_file = os.getenv("SHOPIFY_STORES_FILE")
+        if stores_file:
+            config = json.loads(Path(stores_file).expanduser().read_text())
+            for name, entry in config.get("stores", {}).items():
+                if not entry.get("shop_domain"):
+                    raise ValueError(f"Store {name} in {stores_file} has no shop_domain")
+                # The env store is listed again under its own name: keep the file entry
+                if env_domain == entry["shop_domain"] and name != env_domain:
+                    self.stores.pop(env_domain, None)
+                    if self.default == env_domain:
+                        self.default = name
+                self.stores[name] = entry
+            if self.default is None:
+                self.default = config.get("default")
+
+        if self.default is None and len(self.stores) == 1:
+            self.default = next(iter(self.stores))
+
+    def resolve(self, shop: Optional[str] = None) -> str:
+        """Map a store name or shop domain to a configured store name"""
+        if shop is None:
+            if self.default:
+                return self.default
+            if self.stores:
+                raise ValueError("Several stores are configured; pass a shop param")
+            if not os.getenv("SHOPIFY_ADMIN_TOKEN"):
+                raise ValueError("SHOPIFY_ADMIN_TOKEN environment variable is required")
+            raise ValueError("SHOP_DOMAIN environment variable is required")
+
+        if shop in self.stores:
+            return shop
+        for name, entry in self.stores.items():
+            if entry["shop_domain"] == shop:
+                return name
+        raise ValueError(f"Unknown shop: {shop}")
+
+    def select(self, shops: Any) -> List[str]:
+        """Resolve a fan-out target: "*" for every store, or a list of stores"""
+        if shops in ("*", "all"):
+            return list(self.stores)
+        return [self.resolve(shop) for shop in shops]
+
+    def server(self, shop: Optional[str] = None) -> ShopifyClient:
+        """Get (creating on first use) the server for a store"""
+        name = self.resolve(shop)
+        with self._lock:
+            if name not in self._servers:
+                entry = self.stores[name]
+                token = entry.get("token") or os.getenv(entry.get("token_env", ""))
+                if not token:
+                    raise ValueError(f"No token configured for shop {name}")
+                self._servers[name] = self.server_class(entry["shop_domain"], token)
+            return self._servers[name]
+
+
+def dispatch(
+    stores: StoreRegistry,
+    command: str,
+    params: Dict[str, Any],
+    handle_command: Callable[[Any, str, Dict[str, Any]], Dict[str, Any]],
+    fan_out_commands: Set[str]
+) -> Dict[str, Any]:
+    """Route a command by its optional "shop" param.
+
+    A store name or domain (or no shop, for the default store) runs the
+    command once. "shop": [...] or "*" fans out: each server passes its
+    read-only fan_out_commands, which run once per store, concurrently,
+    each on its own session and rate-limit bucket. Per-store results are
+    keyed by store name; streamed results are merged into one stream.
+    """
+    params = dict(params)
+    shop = params.pop("shop", None)
+
+    if shop is None or (isinstance(shop, str) and shop not in ("*", "all")):
+        return handle_command(stores.server(shop), command, params)
+
+    if command not in fan_out_commands:
+        return {
+            "success": False,
+            "error": f"{command} runs against one shop at a time"
+        }
+
+    names = stores.select(shop)
+
+    def run(name: str) -> Dict[str, Any]:
+        try:
+            return handle_command(stores.server(name), command, params)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_MAX_WORKERS, len(names)))) as pool:
+        results = dict(zip(names, pool.map(run, names)))
+
+    if any(isinstance(result.get("data"), Iterator) for result in results.values()):
+        return {"success": True, "data": merge_streams(results)}
+
+    return {
+        "success": True,
+        "data": {
+            name: result["data"] if result["success"] else {"error": result["error"]}
+            for name, result in results.items()
+        }
+    }
+
+
+def merge_streams(results: Dict[str, Dict[str, Any]]) -> Iterator[Dict]:
+    """Interleave per-store record streams, tagging each record with its store.
+
+    Stores are read concurrently into a bounded queue, so memory stays at a
+    few pages however many records each store has.
+    """
+    records: queue.Queue = queue.Queue(maxsize=MERGE_QUEUE_SIZE)
+    done = object()
+
+    def drain(name: str, result: Dict[str, Any]) -> None:
+        try:
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+            for record in result["data"]:
+                records.put(dict(record, shop=name))
+        except Exception as e:
+            records.put({"shop": name, "error": str(e)})
+        finally:
+            records.put(done)
+
+    for name, result in results.items():
+        threading.Thread(target=drain, args=(name, result), daemon=True).start()
+
+    remaining = len(results)
+    while remaining:
+        record = records.get()
+        if record is done:
+            remaining -= 1
+        else:
+            yield record
@@ -0,0 +1,28 @@
+"""Load the MCP server scripts, whose hyphenated file names are not importable"""
+
+import sys
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SERVERS_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVERS_DIR))
+
+
+def load_server(filename: str):
+    name = filename.replace("-", "_").removesuffix(".py")
+    spec = importlib.util.spec_from_file_location(name, SERVERS_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def shop_env(monkeypatch, tmp_path):
+    """Credentials for one store and a throwaway ORCHESTRA_CACHE_DIR"""
+    monkeypatch.setenv("SHOP_DOMAIN", "test-shop")
+    monkeypatch.setenv("SHOPIFY_ADMIN_TOKEN", "token")
+    monkeypatch.delenv("SHOPIFY_STORES_FILE", raising=False)
+    monkeypatch.setenv("ORCHESTRA_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path
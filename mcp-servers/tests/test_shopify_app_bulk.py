@@ -0,0 +1,106 @@
+"""Batched writes from NDJSON files: bad rows are reported, resume survives crashes"""
+
+import json
+
+import pytest
+
+from conftest import load_server
+
+app = load_server("shopify-app-server.py")
+
+THROTTLE = {"cost": {"throttleStatus": {"maximumAvailable": 1000, "currentlyAvailable": 1000, "restoreRate": 50}}}
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+        self.headers = {}
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class InventorySession:
+    """Accepts every inventorySetQuantities call and counts the rows sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def post(self, url, json=None, **kwargs):
+        self.sent.extend(json["variables"]["input"]["quantities"])
+        payload = {"inventoryAdjustmentGroup": {"id": "gid://shopify/InventoryAdjustmentGroup/1"}, "userErrors": []}
+        return Response({"data": {"inventorySetQuantities": payload}, "extensions": THROTTLE})
+
+
+@pytest.fixture
+def server(shop_env):
+    server = app.ShopifyAppMCPServer()
+    server.session = InventorySession()
+    return server
+
+
+def write_ndjson(path, lines):
+    path.write_text("".join(line + "\n" for line in lines))
+
+
+def test_non_object_rows_fail_without_aborting(server, tmp_path):
+    feed = tmp_path / "inventory.ndjson"
+    write_ndjson(feed, [
+        json.dumps({"inventory_item_id": 1, "location_id": 2, "quantity": 3}),
+        "[1, 2]",
+        '"x"',
+        "not json",
+        json.dumps({"inventory_item_id": 4, "location_id": 2, "quantity": 5}),
+    ])
+
+    result = server.bulk_set_inventory(path=str(feed))
+
+    assert (result["applied"], result["failed"]) == (2, 3)
+    assert [failure["row"] for failure in result["failures"]] == [2, 3, 4]
+    assert all(failure["error"] == "Row is not a JSON object" for failure in result["failures"])
+    assert len(server.session.sent) == 2
+
+
+def test_resume_skips_a_truncated_results_line(server, tmp_path):
+    feed = tmp_path / "inventory.ndjson"
+    write_ndjson(feed, [json.dumps({"inventory_item_id": n, "location_id": 2, "quantity": n}) for n in range(1, 4)])
+    results = tmp_path / "inventory.ndjson.results.ndjson"
+    # A crash while writing row 2's result
+    results.write_text(json.dumps({"row": 1, "status": "ok"}) + '\n{"row": 2, "sta')
+
+    result = server.bulk_set_inventory(path=str(feed), resume=True)
+
+    assert (result["applied"], result["skipped"], result["failed"]) == (2, 1, 0)
+    lines = results.read_text().splitlines()
+    assert [json.loads(line)["row"] for line in lines[2:]] == [2, 3]
+    assert server._completed_rows(str(results)) == {1, 2, 3}
+
+
+class MetafieldsSession:
+    """Accepts every metafieldsSet call and counts the metafields sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def post(self, url, json=None, **kwargs):
+        self.sent.extend(json["variables"]["metafields"])
+        payload = {"metafields": [{"id": "gid://shopify/Metafield/1"}], "userErrors": []}
+        return Response({"data": {"metafieldsSet": payload}, "extensions": THROTTLE})
+
+
+def test_non_object_metafield_rows_fail_without_aborting(server, tmp_path):
+    server.session = MetafieldsSession()
+    row = {"owner_id": "gid://shopify/Product/1", "namespace": "custom", "key": "k", "type": "single_line_text_field", "value": "v"}
+    feed = tmp_path / "metafields.ndjson"
+    write_ndjson(feed, [json.dumps(row), "[1, 2]", "7", json.dumps(dict(row, key="j"))])
+
+    result = server.bulk_set_metafields(path=str(feed))
+
+    assert (result["applied"], result["failed"]) == (2, 2)
+    assert [failure["error"] for failure in result["failures"]] == ["Row is not a JSON object"] * 2
+    assert len(server.session.sent) == 2
@@ -0,0 +1,112 @@
+"""Order store: overlapping versions, deletes and compaction give the same totals with and without numpy"""
+
+import json
+
+import pytest
+
+from conftest import load_server
+
+app = load_server("shopify-app-server.py")
+
+GROUPS = ("day", "channel", "product", "vendor")
+
+
+def order(order_id, price, updated_at):
+    return {
+        "id": order_id,
+        "created_at": f"2024-01-0{order_id}T10:00:00Z",
+        "updated_at": updated_at,
+        "total_price": price,
+        "source_name": "web" if order_id % 2 else "pos",
+        "line_items": [{
+            "product_id": order_id % 2 + 1,
+            "title": f"Product {order_id % 2 + 1}",
+            "vendor": "Acme" if order_id < 3 else "Other",
+            "quantity": 2,
+            "price": str(float(price) / 2)
+        }]
+    }
+
+
+def webhook(webhook_id, topic, body):
+    return {"webhook_id": webhook_id, "topic": topic, "body": json.dumps(body)}
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+        self.headers = {}
+        self.links = {}
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class OrdersSession:
+    """Serves whatever orders the test puts on the next sync"""
+
+    def __init__(self):
+        self.orders = []
+
+    def request(self, method, url, params=None, **kwargs):
+        if "shop.json" in url:
+            return Response({"shop": {"iana_timezone": "UTC"}})
+        return Response({"orders": self.orders})
+
+
+def run_scenario(monkeypatch, tmp_path, numpy):
+    if numpy is None:
+        monkeypatch.setattr(app, "np", None)
+    monkeypatch.setenv("ORCHESTRA_CACHE_DIR", str(tmp_path / f"cache-{numpy is not None}"))
+    server = app.ShopifyAppMCPServer()
+    server.session = OrdersSession()
+
+    server.session.orders = [order(n, "10.00", "2024-02-01T00:00:00Z") for n in range(1, 5)]
+    server.sync_orders()
+    # Overlapping pass: orders 1 and 2 changed, 3 and 4 come back unchanged
+    server.session.orders = [
+        order(1, "20.00", "2024-02-02T00:00:00Z"),
+        order(2, "20.00", "2024-02-02T00:00:00Z"),
+        order(3, "10.00", "2024-02-01T00:00:00Z"),
+        order(4, "10.00", "2024-02-01T00:00:00Z"),
+        order(5, "10.00", "2024-02-02T00:00:00Z"),
+    ]
+    server.sync_orders()
+    stale = webhook("a", "orders/updated", order(1, "99.00", "2024-01-15T00:00:00Z"))
+    server._apply_webhooks([
+        stale,
+        webhook("b", "orders/updated", order(2, "30.00", "2024-03-01T00:00:00Z")),
+        webhook("c", "orders/delete", {"id": 4}),
+    ])
+    compacted = server._load_order_meta()["orders"]
+    # After compaction: re-fetched old versions and a replayed stale delivery
+    server.session.orders = [order(n, "10.00", "2024-02-01T00:00:00Z") for n in range(1, 5)]
+    live = server.sync_orders()["orders"]
+    server._apply_webhooks([stale])
+
+    totals = {group: server.order_analytics("2024-01-01", "2024-01-31", group)["groups"] for group in GROUPS}
+    return compacted, live, totals
+
+
+def test_latest_versions_survive_compaction(shop_env, monkeypatch, tmp_path):
+    compacted, live, totals = run_scenario(monkeypatch, tmp_path, None)
+
+    assert compacted == 4
+    assert live == 4
+    assert [(g["day"], g["total_sales"]) for g in totals["day"]] == [
+        ("2024-01-01", 20.0), ("2024-01-02", 30.0), ("2024-01-03", 10.0), ("2024-01-05", 10.0)
+    ]
+    assert {g["channel"]: g["total_orders"] for g in totals["channel"]} == {"web": 3, "pos": 1}
+
+
+def test_numpy_and_pure_python_agree(shop_env, monkeypatch, tmp_path):
+    numpy = pytest.importorskip("numpy")
+    with monkeypatch.context() as patch:
+        expected = run_scenario(patch, tmp_path, None)
+
+    assert run_scenario(monkeypatch, tmp_path, numpy) == expected
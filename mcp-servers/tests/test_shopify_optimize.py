@@ -0,0 +1,46 @@
+"""push_theme's optimizer cache must not serve output from another extension or minifier"""
+
+import types
+
+import pytest
+
+from conftest import load_server
+
+shopify = load_server("shopify-server.py")
+
+CSS = ".a  {  color : red ;  }\n\n.b { margin : 0 }\n"
+
+
+@pytest.fixture
+def server(shop_env):
+    return shopify.ShopifyMCPServer()
+
+
+@pytest.fixture
+def theme(tmp_path):
+    assets = tmp_path / "theme" / "assets"
+    assets.mkdir(parents=True)
+    (assets / "base.css").write_text(CSS)
+    # Same bytes under another extension
+    (assets / "base.js").write_text(CSS)
+    return {f"assets/{path.name}": path for path in assets.iterdir()}
+
+
+def test_same_content_is_cached_per_extension(server, theme):
+    optimized = server._optimize_files(theme)
+
+    assert optimized["assets/base.css"]["path"] != optimized["assets/base.js"]["path"]
+
+
+def test_changing_the_minifier_misses_the_cache(server, theme, monkeypatch):
+    first = server._optimize_files(theme)
+    assert not first["assets/base.css"]["cached"]
+    assert server._optimize_files(theme)["assets/base.css"]["cached"]
+
+    fake = types.SimpleNamespace(__name__="rcssmin", __version__="9.9", cssmin=lambda text: "/*fake*/")
+    monkeypatch.setattr(shopify, "rcssmin", fake)
+    second = server._optimize_files(theme)
+
+    assert not second["assets/base.css"]["cached"]
+    assert second["assets/base.css"]["path"].read_text() == "/*fake*/"
+    assert second["assets/base.js"]["cached"]
@@ -0,0 +1,46 @@
+"""search_theme's trigram prefilter must never drop a file that matches"""
+
+import re
+
+import pytest
+
+from conftest import load_server
+
+shopify = load_server("shopify-server.py")
+
+TEXTS = [
+    "Abcd and more", "xAbcd", "ébcd here", "Aébcd", "abc-def", "abcXdef",
+    "the quick brown fox", "foo.bar", "foobar", "a1b2c3", "section header_main",
+    "{% render 'card' %}", "price: 10.00", "tab\there", "{{ product.title }}",
+]
+
+PATTERNS = [
+    r"\x41bcd", r"\101bcd", r"Abcd", r"\U00000041bcd", r"\N{LATIN SMALL LETTER E WITH ACUTE}bcd",
+    r"(abc)\1?def", r"\0bcd|abcd", r"abc\ddef", r"abc\.def", r"foo\.bar", r"quick\sbrown",
+    r"render '(\w+)'", r"product\.title", r"pri.e: \d+", r"tab\there", r"header_\w+",
+    r"(?i)ABCD", r"(?x) qu ick", r"\x41?bcd", r"ab+cd", r"abc[-X]def",
+]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_required_literals_appear_in_every_match(pattern):
+    matcher = re.compile(pattern, re.IGNORECASE)
+    for literal in shopify.required_literals(pattern):
+        for text in TEXTS:
+            if matcher.search(text):
+                assert literal.lower() in text.lower(), (pattern, literal, text)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_search_theme_matches_plain_scan(shop_env, pattern):
+    theme = shop_env / "theme"
+    (theme / "snippets").mkdir(parents=True)
+    for number, text in enumerate(TEXTS):
+        (theme / "snippets" / f"s{number}.liquid").write_text(text + "\n")
+
+    server = shopify.ShopifyMCPServer()
+    result = server.search_theme(pattern, directory=str(theme), regex=True, max_results=1000)
+
+    matcher = re.compile(pattern, re.IGNORECASE)
+    expected = {f"snippets/s{number}.liquid" for number, text in enumerate(TEXTS) if matcher.search(text)}
+    assert {match["key"] for match in result["matches"]} == expected